@@ -1,22 +1,174 @@
-from flask import Flask, request, jsonify
-from app.models.infer import predict
+from concurrent.futures import TimeoutError as FutureTimeout
+from flask import Flask, Response, request, jsonify, stream_with_context
+from app.helpers.batching import DynamicBatcher, QueueFull
+from app.models.infer import pred_cache_stats, predict, predict_batch
+from app.models.registry import REGISTRY
+from app.utils.metrics import CONTENT_TYPE, METRICS, STAGE_SECONDS
+import json
 import os
+import time
 
 app = Flask(__name__)
 
 MODEL_PATH = os.environ.get("IDS_MODEL_PATH", "models/best_svm.joblib")
+# Larger list payloads are scored in chunks of this many rows
+MAX_BATCH_SIZE = int(os.environ.get("IDS_MAX_BATCH_SIZE", "4096"))
+
+# Dynamic batching: concurrent single-flow requests are grouped into one model call
+BATCHING = os.environ.get("IDS_BATCHING", "0") == "1"
+BATCHER = DynamicBatcher(
+    lambda samples: predict_batch(MODEL_PATH, samples),
+    max_size=int(os.environ.get("IDS_BATCH_MAX_SIZE", "256")),
+    max_wait=float(os.environ.get("IDS_BATCH_MAX_WAIT_MS", "5")) / 1000.0,
+    queue_depth=int(os.environ.get("IDS_BATCH_QUEUE_DEPTH", "1024")),
+)
+BATCH_TIMEOUT = float(os.environ.get("IDS_BATCH_TIMEOUT", "30"))
+# /predict/stream scores this many NDJSON rows per model call
+STREAM_CHUNK_ROWS = int(os.environ.get("IDS_STREAM_CHUNK_ROWS", "4096"))
+
+# Prometheus text metrics, scraped at GET /metrics
+REQUESTS = METRICS.counter("ids_http_requests_total", "Prediction requests by outcome", label="status")
+METRICS.gauge("ids_batch_queue_depth", "Requests waiting in the dynamic batcher", fn=BATCHER.queued)
+METRICS.counter("ids_model_cache_lookups_total", "Model registry lookups by result", label="result",
+                fn=lambda: {"hit": REGISTRY.hits, "miss": REGISTRY.misses})
 
 @app.route("/predict", methods=["POST"])
 def predict_endpoint():
+    t0 = time.perf_counter()
     data = request.get_json(force=True)
-    if isinstance(data, dict):
-        result = predict(MODEL_PATH, data)
-        return jsonify(result)
-    elif isinstance(data, list):
-        results = [predict(MODEL_PATH, sample) for sample in data]
-        return jsonify(results)
-    else:
-        return jsonify({"error": "Input must be a dict or list of dicts"}), 400
+    STAGE_SECONDS.observe(time.perf_counter() - t0, "decode")
+    try:
+        if isinstance(data, dict):
+            if BATCHING:
+                try:
+                    result = BATCHER.predict([data], timeout=BATCH_TIMEOUT)[0]
+                except QueueFull as e:
+                    REQUESTS.inc(label_value="rejected")
+                    return jsonify({"error": str(e)}), 503
+                except FutureTimeout:
+                    REQUESTS.inc(label_value="timeout")
+                    return jsonify({"error": f"prediction not ready within {BATCH_TIMEOUT:g}s"}), 503
+            else:
+                result = predict(MODEL_PATH, data)
+            REQUESTS.inc(label_value="ok")
+            return jsonify(result)
+        elif isinstance(data, list):
+            if not all(isinstance(sample, dict) for sample in data):
+                REQUESTS.inc(label_value="bad_request")
+                return jsonify({"error": "Input must be a dict or list of dicts"}), 400
+            results = predict_batch(MODEL_PATH, data, max_batch_size=MAX_BATCH_SIZE)
+            REQUESTS.inc(label_value="ok")
+            return jsonify(results)
+    except Exception as e:
+        # model/load failures: counted, logged and returned instead of an HTML 500 page
+        app.logger.exception("prediction failed")
+        REQUESTS.inc(label_value="error")
+        return jsonify({"error": f"prediction failed: {e}"}), 500
+    REQUESTS.inc(label_value="bad_request")
+    return jsonify({"error": "Input must be a dict or list of dicts"}), 400
+
+
+def _iter_lines(stream, block_size=1 << 16):
+    # block reads: readline() on the raw WSGI input reads chunked bodies a byte at a time
+    tail = b""
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        lines = (tail + block).split(b"\n")
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+
+def _ndjson_results(lines, chunk_size):
+    """NDJSON result lines for NDJSON flow lines, one model call per `chunk_size` flows.
+
+    One output line per non-empty input line, in order; lines that are not a JSON object,
+    and the rows of a chunk whose model call failed, get {"line": n, "error": ...} instead
+    of a prediction. The request is counted once it ends: stream_ok, stream_error (some
+    chunk failed or the stream broke off) or stream_aborted (client went away).
+    """
+    slots, samples = [], []
+    failed_chunks = 0
+
+    def flush():
+        nonlocal failed_chunks
+        try:
+            results = iter(predict_batch(MODEL_PATH, samples) if samples else ())
+            error = None
+        except Exception as e:
+            app.logger.exception("stream chunk of %d rows failed", len(samples))
+            failed_chunks += 1
+            error = f"prediction failed: {e}"
+        out = []
+        for slot in slots:
+            # slot: an error record for a bad line, or the line number of a sample
+            if not isinstance(slot, dict):
+                slot = next(results) if error is None else {"line": slot, "error": error}
+            out.append(json.dumps(slot) + "\n")
+        slots.clear()
+        samples.clear()
+        return "".join(out)
+
+    outcome = "stream_error"
+    try:
+        for n, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            t0 = time.perf_counter()
+            try:
+                sample = json.loads(line)
+            except ValueError as e:
+                sample, error = None, f"invalid JSON: {e}"
+            else:
+                error = None if isinstance(sample, dict) else "Input must be a dict"
+            STAGE_SECONDS.observe(time.perf_counter() - t0, "decode")
+            if error:
+                slots.append({"line": n, "error": error})
+                continue
+            slots.append(n)
+            samples.append(sample)
+            if len(samples) >= chunk_size:
+                yield flush()
+        if slots:
+            yield flush()
+        outcome = "stream_error" if failed_chunks else "stream_ok"
+    except GeneratorExit:
+        outcome = "stream_aborted"
+        raise
+    finally:
+        REQUESTS.inc(label_value=outcome)
+
+
+@app.route("/predict/stream", methods=["POST"])
+def predict_stream_endpoint():
+    # Chunked NDJSON in, NDJSON out: rows are scored and sent back as they arrive,
+    # so memory stays flat however large the upload is. Clients should read the response
+    # while uploading; one that sends everything first stalls once the socket buffers fill.
+    body = _ndjson_results(_iter_lines(request.stream), STREAM_CHUNK_ROWS)
+    return Response(stream_with_context(body), mimetype="application/x-ndjson")
+
+
+@app.route("/models", methods=["GET"])
+def models_endpoint():
+    # Load times and cache hit/miss counters of the process-wide model registry,
+    # plus hit rate and memory of the prediction caches (IDS_PRED_CACHE)
+    return jsonify(dict(REGISTRY.stats(), prediction_cache=pred_cache_stats()))
+
+
+@app.route("/batching", methods=["GET"])
+def batching_endpoint():
+    # Dynamic batching settings, queue depth, batch sizes and request latency percentiles
+    return jsonify(dict(BATCHER.stats(), enabled=BATCHING))
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    # Per-stage latency histograms, request/row counters and gauges (Prometheus text format)
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
 
 
 # For local development, run: python app.py
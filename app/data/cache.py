@@ -0,0 +1,234 @@
+"""
+Binary columnar cache for the NSL-KDD tables.
+
+A table is a directory with one .npy file per column plus meta.json. Categorical
+columns (protocol_type/service/flag/label) are stored as integer codes + categories,
+numeric columns in the narrowest dtype that holds them. Columns are loaded with
+np.load(mmap_mode="r"), so re-reading a table costs page faults, not parsing.
+
+Raw-file caches are keyed by a fingerprint of the source file's content, so editing or
+re-downloading a raw file invalidates its cache automatically.
+
+`<name>.cols` is a symlink to a hidden `.<name>.cols.v-<id>` directory. A write fills a
+fresh version directory and swaps the link with os.replace, so readers always see one
+complete table. A published directory is never deleted while it is current, and a
+replaced one is kept for SUPERSEDED_GRACE seconds for readers still loading it. Writers
+of the same table are serialized (a lock per path, plus flock across processes).
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are then only serialized within one process
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from app.features.columns_nsl_kdd import CATEGORICAL, LABEL_COL
+from app.utils.io import ensure_dir, file_digest
+
+CACHE = Path("data/cache")
+SUFFIX = ".cols"
+CATEGORY_COLS = CATEGORICAL + [LABEL_COL]
+# seconds a replaced table version is kept after the link moved off it
+SUPERSEDED_GRACE = 300.0
+
+_LOCKS = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Categoricals for the string columns, narrowest int/float32 for the rest."""
+    out = {}
+    for c in df.columns:
+        s = df[c]
+        if c in CATEGORY_COLS or s.dtype == object:
+            out[c] = s.astype("category")
+        elif s.dtype.kind in "iub":
+            out[c] = pd.to_numeric(s, downcast="integer" if s.min() < 0 else "unsigned")
+        elif s.dtype.kind == "f":
+            out[c] = s.astype(np.float32)
+        else:
+            out[c] = s
+    return pd.DataFrame(out)
+
+
+def table_path(path) -> Path:
+    p = Path(path)
+    return p if p.suffix == SUFFIX else p.with_name(p.name + SUFFIX)
+
+
+@contextmanager
+def _locked(dest: Path):
+    """Serialize writers of the table at `dest` (threads, and processes where flock exists)."""
+    with _LOCKS_GUARD:
+        lock = _LOCKS.setdefault(str(dest.resolve(strict=False)), threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        ensure_dir(dest.parent)
+        with open(dest.with_name(f".{dest.name}.lock"), "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _versions(dest: Path):
+    return dest.parent.glob(f".{dest.name}.v-*")
+
+
+def save_table(df: pd.DataFrame, path, source=None) -> Path:
+    """Write `df` as a column table and publish it atomically (see the module docstring)."""
+    dest = table_path(path)
+    with _locked(dest):
+        return _write_table(df, dest, source)
+
+
+def _write_table(df: pd.DataFrame, dest: Path, source=None) -> Path:
+    ensure_dir(dest.parent)
+    tmp = dest.with_name(f".{dest.name}.v-{time.time_ns():016x}-{os.getpid()}")
+    ensure_dir(tmp)
+    meta = {"rows": int(len(df)), "columns": [], "source": source}
+    for i, c in enumerate(df.columns):
+        s = df[c]
+        entry = {"name": str(c), "file": f"{i:03d}.npy"}
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            codes = s.cat.codes.to_numpy()
+            entry["categories"] = [str(v) for v in s.cat.categories]
+            np.save(tmp / entry["file"], codes)
+        else:
+            np.save(tmp / entry["file"], s.to_numpy())
+        meta["columns"].append(entry)
+    (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    previous = None
+    if dest.is_symlink():
+        previous = os.readlink(dest)
+    elif dest.exists():
+        # a plain directory from before versioned tables: move it aside once (the link replaces it below)
+        previous = f".{dest.name}.v-{0:016x}-legacy"
+        os.replace(dest, dest.with_name(previous))
+    link = dest.with_name(f".{dest.name}.link-{os.getpid()}-{threading.get_ident()}")
+    os.symlink(tmp.name, link)
+    os.replace(link, dest)
+    if previous is not None:
+        # its grace period starts now, not when it was written
+        try:
+            os.utime(dest.with_name(previous))
+        except OSError:
+            pass
+    horizon = time.time() - SUPERSEDED_GRACE
+    for old in _versions(dest):
+        try:
+            expired = old.name != tmp.name and old.stat().st_mtime < horizon
+        except OSError:
+            continue
+        if expired:
+            shutil.rmtree(old, ignore_errors=True)
+    return dest
+
+
+def _remove_table(dest: Path):
+    """Remove a table that is no longer referenced (link and every version)."""
+    for old in _versions(dest):
+        shutil.rmtree(old, ignore_errors=True)
+    if dest.is_symlink():
+        dest.unlink()
+    elif dest.exists():
+        shutil.rmtree(dest, ignore_errors=True)
+
+
+def table_exists(path) -> bool:
+    return (table_path(path) / "meta.json").exists()
+
+
+def _read_meta(src: Path) -> dict:
+    return json.loads((src / "meta.json").read_text(encoding="utf-8"))
+
+
+def load_table(path, columns=None, mmap: bool = True) -> pd.DataFrame:
+    # resolved once: every file comes from the same version even if a writer swaps the link meanwhile
+    src = table_path(path).resolve()
+    meta = _read_meta(src)
+    data = {}
+    for entry in meta["columns"]:
+        name = entry["name"]
+        if columns is not None and name not in columns:
+            continue
+        arr = np.load(src / entry["file"], mmap_mode="r" if mmap else None)
+        if "categories" in entry:
+            data[name] = pd.Categorical.from_codes(np.asarray(arr), categories=entry["categories"])
+        else:
+            data[name] = arr
+    return pd.DataFrame(data, copy=False)
+
+
+def iter_table(path, chunk_size: int, columns=None):
+    """Yield the table as DataFrames of at most `chunk_size` rows; only one chunk is ever materialized."""
+    src = table_path(path).resolve()
+    meta = _read_meta(src)
+    cols = [(e, np.load(src / e["file"], mmap_mode="r")) for e in meta["columns"]
+            if columns is None or e["name"] in columns]
+    for start in range(0, meta["rows"], chunk_size):
+        data = {}
+        for entry, arr in cols:
+            part = np.array(arr[start:start + chunk_size])
+            if "categories" in entry:
+                part = pd.Categorical.from_codes(part, categories=entry["categories"])
+            data[entry["name"]] = part
+        yield pd.DataFrame(data, copy=False)
+
+
+def iter_chunks(source, chunk_size: int):
+    """DataFrames of at most `chunk_size` rows from a column table, CSV or JSONL file."""
+    name = str(source)
+    if table_exists(source):
+        yield from iter_table(source, chunk_size)
+    elif name.endswith((".csv", ".csv.gz")):
+        yield from pd.read_csv(source, chunksize=chunk_size)
+    elif name.endswith((".jsonl", ".json", ".jsonl.gz", ".json.gz")):
+        yield from pd.read_json(source, lines=True, chunksize=chunk_size)
+    else:
+        raise ValueError(f"Don't know how to stream {source} (expected a .cols table, .csv or .jsonl)")
+
+
+def fingerprint(path) -> str:
+    return file_digest(path)[:16]
+
+
+def cached_read(src, reader, cache_dir=CACHE, digest=None) -> pd.DataFrame:
+    """`reader(src)` compacted and cached under a key derived from the source content.
+
+    Pass the file's sha256 as `digest` when it is already known to skip hashing it again.
+    Concurrent callers for the same source parse it once; the others wait and load the
+    published table, which is never rewritten once it exists (its name is its content).
+    """
+    src = Path(src)
+    fp = digest[:16] if digest else fingerprint(src)
+    dest = Path(cache_dir) / f"{src.name}.{fp}{SUFFIX}"
+    if not table_exists(dest):
+        with _locked(dest):
+            if not table_exists(dest):
+                df = compact_frame(reader(src))
+                _write_table(df, dest, source={"path": str(src), "fingerprint": fp})
+                # drop caches of older versions of the same file
+                for stale in Path(cache_dir).glob(f"{src.name}.*{SUFFIX}"):
+                    if stale != dest:
+                        _remove_table(stale)
+    return load_table(dest)
+
+
+def load_interim(path) -> pd.DataFrame:
+    """An interim dataset from its column cache, or from `<path>.csv` written by older runs."""
+    if table_exists(path):
+        return load_table(path)
+    return pd.read_csv(Path(path).with_suffix(".csv"))
@@ -1,11 +1,17 @@
 from __future__ import annotations
-from pathlib import Path
+import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import requests
 import pandas as pd
 
 # keep your existing imports for COLUMNS (and ensure_dir if you already have it)
 from app.features.columns_nsl_kdd import COLUMNS
+from app.data.cache import CACHE, cached_read
+from app.utils.io import file_digest
 try:
     from app.utils.io import ensure_dir
 except Exception:
@@ -17,7 +23,7 @@ RAW = Path("data/raw")
 TRAIN_FILE = RAW / "KDDTrain+.txt"
 TEST_FILE  = RAW / "KDDTest+.txt"
 
-# Primary + mirror URLs (order matters; fastest first)
+# Primary + mirror URLs (raced; the first mirror to answer is used)
 URLS_TRAIN = [
     "https://raw.githubusercontent.com/defcom17/NSL_KDD/master/KDDTrain+.txt",
     "https://raw.githubusercontent.com/MathCoub/NSL-KDD/master/KDDTrain+.txt",
@@ -26,70 +32,180 @@ URLS_TEST = [
     "https://raw.githubusercontent.com/defcom17/NSL_KDD/master/KDDTest+.txt",
     "https://raw.githubusercontent.com/MathCoub/NSL-KDD/master/KDDTest+.txt",
 ]
+# Optional pinned sha256 per file name; without one, the digest of the first complete
+# download is recorded in <file>.sha256 and later runs check the cached file against it.
+CHECKSUMS = {}
+
+# identity encoding: byte ranges and Content-Length then refer to the file itself
+HEADERS = {"User-Agent": "NSL-KDD-downloader/1.0", "Accept-Encoding": "identity"}
+
+
+def sidecar(path: Path) -> Path:
+    return path.with_name(path.name + ".sha256")
+
+
+def read_sidecar(path: Path):
+    try:
+        return sidecar(path).read_text(encoding="utf-8").split()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def write_sidecar(path: Path, digest: str) -> None:
+    # sha256sum format, so `sha256sum -c KDDTrain+.txt.sha256` works in data/raw
+    sidecar(path).write_text(f"{digest}  {path.name}\n", encoding="utf-8")
+
+
+def verify_cached(path: Path, expected: str = None):
+    """Digest of a cached raw file if it matches its pin/sidecar, else None.
+
+    A file with neither (e.g. copied into data/raw by hand) is accepted and its digest recorded.
+    """
+    if not path.exists():
+        return None
+    expected = expected or read_sidecar(path)
+    digest = file_digest(path)
+    if expected is None:
+        write_sidecar(path, digest)
+        return digest
+    return digest if digest == expected else None
+
+
+def _open_first(urls, part: Path, session, timeout):
+    """Request every mirror at once; (url, response, resume offset) of the first healthy answer."""
+    meta_path = part.with_name(part.name + ".json")
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() and part.exists() else {}
+    offset = part.stat().st_size if meta else 0
+    winner = []
+    lock = threading.Lock()
+    done = threading.Event()
+    errors = []
+
+    def attempt(url):
+        headers = dict(HEADERS)
+        # resume only from the mirror the .part came from; If-Range makes the server send
+        # the whole file instead if it changed since
+        if offset and url == meta.get("url"):
+            headers["Range"] = f"bytes={offset}-"
+            if meta.get("etag"):
+                headers["If-Range"] = meta["etag"]
+        try:
+            r = session.get(url, headers=headers, timeout=timeout, stream=True)
+            if r.status_code == 416 and "Range" in headers:
+                # .part is not a prefix of what the mirror has (anymore): start over
+                r.close()
+                headers.pop("Range")
+                headers.pop("If-Range", None)
+                r = session.get(url, headers=headers, timeout=timeout, stream=True)
+            r.raise_for_status()
+        except Exception as e:
+            errors.append(f"{url}: {e}")
+            return
+        with lock:
+            first = not winner
+            if first:
+                winner.append((url, r))
+        if first:
+            done.set()
+        else:
+            r.close()
+
+    threads = [threading.Thread(target=attempt, args=(u,), daemon=True) for u in urls]
+    for t in threads:
+        t.start()
+    while not done.is_set() and any(t.is_alive() for t in threads):
+        done.wait(0.05)
+    if not winner:
+        raise RuntimeError("; ".join(errors) or "no mirror answered")
+    url, r = winner[0]
+    resumed = r.status_code == 206 and offset and r.headers.get("Content-Range", "").startswith(f"bytes {offset}-")
+    meta_path.write_text(json.dumps({"url": url, "etag": r.headers.get("ETag")}))
+    return url, r, offset if resumed else 0
+
+
+def download_with_retries(urls, out_path: Path, max_retries: int = 4, timeout: int = 60,
+                          expected: str = None, session=None) -> str:
+    """Race the mirrors, resume <out_path>.part, verify and move into place; returns the sha256.
+
+    Each attempt races all `urls`; a failed attempt keeps what was received in the .part
+    file, and the next one resumes it with a Range request.
+    """
+    session = session or requests.Session()
+    part = out_path.with_name(out_path.name + ".part")
+    meta_path = part.with_name(part.name + ".json")
+    for attempt in range(1, max_retries + 1):
+        try:
+            url, r, offset = _open_first(urls, part, session, timeout)
+            with r:
+                print(f"[download] {out_path.name} <- {url}" + (f" (resuming at {offset} B)" if offset else ""))
+                with open(part, "ab" if offset else "wb") as f:
+                    for chunk in r.iter_content(chunk_size=1 << 20):
+                        if chunk:
+                            f.write(chunk)
+                size = part.stat().st_size
+                total = r.headers.get("Content-Length")
+                if total is not None and size != offset + int(total):
+                    raise IOError(f"short read: {size} of {offset + int(total)} bytes")
+            digest = file_digest(part)
+            if expected and digest != expected:
+                part.unlink()
+                meta_path.unlink(missing_ok=True)
+                raise IOError(f"sha256 mismatch: got {digest}, expected {expected}")
+            part.replace(out_path)
+            meta_path.unlink(missing_ok=True)
+            write_sidecar(out_path, digest)
+            return digest
+        except Exception as e:
+            error = e
+            if attempt == max_retries:
+                break
+            wait = min(2 ** attempt, 10)
+            print(f"  -> {out_path.name} attempt {attempt}/{max_retries} failed: {e} ; retrying in {wait}s")
+            time.sleep(wait)
+    raise RuntimeError(f"Could not download {out_path.name} from any mirror: {error}")
+
+
+def fetch(urls, out_path: Path) -> str:
+    """A verified raw file: the cached one if its checksum matches, else a fresh download."""
+    expected = CHECKSUMS.get(out_path.name)
+    digest = verify_cached(out_path, expected)
+    if digest:
+        print(f"[download] Using cached (sha256 ok): {out_path}")
+        return digest
+    if out_path.exists():
+        print(f"[download] {out_path} does not match its checksum; downloading again")
+    return download_with_retries(urls, out_path, expected=expected)
 
-def download_with_retries(urls, out_path: Path, max_retries: int = 4, timeout: int = 60) -> None:
-    """Try each url with retries/backoff; write to out_path. Raises on failure."""
-    headers = {"User-Agent": "NSL-KDD-downloader/1.0"}
-    for url in urls:
-        for attempt in range(1, max_retries + 1):
-            try:
-                print(f"[download] {url} (attempt {attempt}/{max_retries})")
-                with requests.get(url, headers=headers, timeout=timeout, stream=True) as r:
-                    r.raise_for_status()
-                    tmp = out_path.with_suffix(out_path.suffix + ".part")
-                    with open(tmp, "wb") as f:
-                        for chunk in r.iter_content(chunk_size=1 << 20):
-                            if chunk:
-                                f.write(chunk)
-                    tmp.replace(out_path)
-                return
-            except Exception as e:
-                wait = min(2 ** attempt, 30)
-                print(f"  -> failed: {e} ; retrying in {wait}s")
-                time.sleep(wait)
-    raise RuntimeError(f"Could not download {out_path.name} from any mirror.")
 
 def read_nsl_kdd_txt(path: Path) -> pd.DataFrame:
-    # Be forgiving across forks; some lines can be quirky.
+    # Be forgiving across forks; some lines can be quirky (the C parser skips them too).
     return pd.read_csv(
         path,
         header=None,
         names=COLUMNS,
-        engine="python",
+        engine="c",
         on_bad_lines="skip",
     )
 
 def main():
     ensure_dir(RAW)
 
-    # Download if not cached
-    if not TRAIN_FILE.exists():
-        print("[1/4] Downloading training file …")
-        download_with_retries(URLS_TRAIN, TRAIN_FILE)
-    else:
-        print("[1/4] Using cached:", TRAIN_FILE)
-
-    if not TEST_FILE.exists():
-        print("[2/4] Downloading test file …")
-        download_with_retries(URLS_TEST, TEST_FILE)
-    else:
-        print("[2/4] Using cached:", TEST_FILE)
+    # Fetch both files concurrently; cached files are reused when their checksum matches
+    print("[1/4] Fetching training and test files …")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(fetch, URLS_TRAIN, TRAIN_FILE), pool.submit(fetch, URLS_TEST, TEST_FILE)]
+        digests = [f.result() for f in futures]
+    print("[2/4] Verified:", ", ".join(f"{p.name} {d[:12]}" for p, d in zip((TRAIN_FILE, TEST_FILE), digests)))
 
-    # Read locally, then save CSVs
-    print("[3/4] Parsing to DataFrames …")
-    df_tr = read_nsl_kdd_txt(TRAIN_FILE)
-    df_te = read_nsl_kdd_txt(TEST_FILE)
+    # Parse once into the columnar cache (reused by every later stage)
+    print("[3/4] Parsing to columnar cache …")
+    df_tr = cached_read(TRAIN_FILE, read_nsl_kdd_txt, digest=digests[0])
+    df_te = cached_read(TEST_FILE, read_nsl_kdd_txt, digest=digests[1])
 
     if df_tr.empty or df_te.empty:
         raise RuntimeError("Downloaded files are empty or malformed.")
 
-    print("[4/4] Saving CSVs …")
-    out_train_csv = RAW / "KDDTrain+.csv"
-    out_test_csv  = RAW / "KDDTest+.csv"
-    df_tr.to_csv(out_train_csv, index=False)
-    df_te.to_csv(out_test_csv, index=False)
-
-    print("Done. Saved:", out_train_csv, out_test_csv)
+    print("[4/4] Done. Cached tables in:", CACHE)
     print("Train shape:", df_tr.shape, "| Test shape:", df_te.shape)
 
 if __name__ == "__main__":
@@ -3,6 +3,8 @@ from pathlib import Path
 import pandas as pd
 import numpy as np
 
+from app.data.cache import cached_read, compact_frame, save_table
+from app.data.download_nsl_kdd import read_nsl_kdd_txt
 from app.features.columns_nsl_kdd import *
 from app.utils.io import *
 
@@ -11,11 +13,18 @@ INTERIM = Path("data/interim")
 
 ATTACK_TOKEN = "normal"
 
+def load_raw(name: str) -> pd.DataFrame:
+    """Raw split from the columnar cache (parsed from the .txt, or a .csv export if that's all there is)."""
+    txt = RAW / f"{name}.txt"
+    if txt.exists():
+        return cached_read(txt, read_nsl_kdd_txt)
+    return cached_read(RAW / f"{name}.csv", pd.read_csv)
+
 def clean(df: pd.DataFrame) -> pd.DataFrame:
     if DIFFICULTY_COL in df.columns:
         df = df.drop(columns=[DIFFICULTY_COL])
         
-    df[LABEL_COL] = df[LABEL_COL].str.lower()
+    df[LABEL_COL] = df[LABEL_COL].astype(str).str.lower()
     return df
 
 def add_targets(df: pd.DataFrame, task: str) -> pd.DataFrame:
@@ -35,16 +44,16 @@ def add_targets(df: pd.DataFrame, task: str) -> pd.DataFrame:
 
 
 def main(task):
-    print(f"[make_dataset] Would process dataset for task: {task}")
+    """Build the interim train/test tables for `task` (or a list of tasks, reading the raw splits once)."""
+    tasks = [task] if isinstance(task, str) else list(task)
+    print(f"[make_dataset] Would process dataset for task: {', '.join(tasks)}")
     ensure_dir(INTERIM)
 
-    tr = pd.read_csv(RAW / "KDDTrain+.csv")
-    te = pd.read_csv(RAW / "KDDTest+.csv")
-
-    tr = add_targets(clean(tr), task)
-    te = add_targets(clean(te), task)
+    tr = clean(load_raw("KDDTrain+"))
+    te = clean(load_raw("KDDTest+"))
 
-    print("Saving cleaned datasets to interim folder")
-    tr.to_csv(INTERIM / f"train_{task}.csv", index=False)
-    te.to_csv(INTERIM / f"test_{task}.csv", index=False)
-    print("Wrote:", INTERIM / f"train_{task}.csv"," and ", INTERIM / f"test_{task}.csv")
+    for t in tasks:
+        print(f"Saving cleaned {t} datasets to interim folder")
+        out_tr = save_table(compact_frame(add_targets(tr.copy(), t)), INTERIM / f"train_{t}")
+        out_te = save_table(compact_frame(add_targets(te.copy(), t)), INTERIM / f"test_{t}")
+        print("Wrote:", out_tr, " and ", out_te)
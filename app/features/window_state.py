@@ -0,0 +1,255 @@
+"""
+Incremental NSL-KDD traffic features for live flows.
+
+Time-based features use the connections of the last `window` seconds, host-based
+(`dst_host_*`) features the last `host_window` connections to the same destination:
+
+- same host, past `window` s:     count, serror_rate, rerror_rate, same_srv_rate, diff_srv_rate
+- same service, past `window` s:  srv_count, srv_serror_rate, srv_rerror_rate, srv_diff_host_rate
+                                  (connections to that service on any host)
+- same host, last N connections:  dst_host_count, dst_host_srv_count, dst_host_same_srv_rate,
+                                  dst_host_diff_srv_rate, dst_host_same_src_port_rate,
+                                  dst_host_serror_rate, dst_host_rerror_rate,
+                                  dst_host_srv_serror_rate, dst_host_srv_rerror_rate
+- same service, last N connections: dst_host_srv_diff_host_rate
+
+Every window keeps running counters, so an update is O(1) amortized. Keys are kept in
+last-seen order: idle keys are expired from the front and `max_keys` caps each table.
+`max_events` caps the events held by all four tables together (each is a small tuple,
+~150 bytes with its share of the deque): past it, the least recently seen keys of any
+table are evicted first.
+"""
+from collections import OrderedDict, deque
+
+# NSL-KDD saturates count/srv_count at 511; time windows never hold more events than that
+MAX_COUNT = 511
+
+SERROR_FLAGS = frozenset(("S0", "S1", "S2", "S3"))
+RERROR_FLAGS = frozenset(("REJ",))
+
+TRAFFIC_FEATURES = [
+    "count", "srv_count", "serror_rate", "srv_serror_rate", "rerror_rate", "srv_rerror_rate",
+    "same_srv_rate", "diff_srv_rate", "srv_diff_host_rate", "dst_host_count", "dst_host_srv_count",
+    "dst_host_same_srv_rate", "dst_host_diff_srv_rate", "dst_host_same_src_port_rate",
+    "dst_host_srv_diff_host_rate", "dst_host_serror_rate", "dst_host_srv_serror_rate",
+    "dst_host_rerror_rate", "dst_host_srv_rerror_rate",
+]
+# computed from the service-keyed tables (srv_time, srv_conn), i.e. over every destination
+SERVICE_FEATURES = ["srv_count", "srv_serror_rate", "srv_rerror_rate", "srv_diff_host_rate",
+                    "dst_host_srv_diff_host_rate"]
+
+
+class _Window:
+    """Events of one key, (ts, a, b, serror, rerror), plus counters over them."""
+    __slots__ = ("events", "serror", "rerror", "by_a", "by_b", "last_seen")
+
+    def __init__(self):
+        self.events = deque()
+        self.serror = 0
+        self.rerror = 0
+        self.by_a = {}   # a -> [n, serror, rerror]
+        self.by_b = {}   # b -> n
+        self.last_seen = 0.0
+
+    def push(self, ts, a, b, serror, rerror):
+        self.events.append((ts, a, b, serror, rerror))
+        self.serror += serror
+        self.rerror += rerror
+        c = self.by_a.get(a)
+        if c is None:
+            self.by_a[a] = [1, serror, rerror]
+        else:
+            c[0] += 1
+            c[1] += serror
+            c[2] += rerror
+        if b is not None:
+            self.by_b[b] = self.by_b.get(b, 0) + 1
+
+    def pop(self):
+        _, a, b, serror, rerror = self.events.popleft()
+        self.serror -= serror
+        self.rerror -= rerror
+        c = self.by_a[a]
+        if c[0] == 1:
+            del self.by_a[a]
+        else:
+            c[0] -= 1
+            c[1] -= serror
+            c[2] -= rerror
+        if b is not None:
+            n = self.by_b[b]
+            if n == 1:
+                del self.by_b[b]
+            else:
+                self.by_b[b] = n - 1
+
+
+class _Table:
+    """Windows by key, bounded by age (`window` s) or length (`maxlen`)."""
+
+    def __init__(self, window=None, maxlen=None, idle_timeout=300.0, max_keys=100_000):
+        self.window = window
+        self.maxlen = maxlen
+        self.idle_timeout = idle_timeout
+        self.max_keys = max_keys
+        self.windows = OrderedDict()
+        self.n_events = 0
+        self.evicted_idle = 0
+        self.evicted_cap = 0
+        self.evicted_budget = 0
+
+    def push(self, key, ts, a, b, serror, rerror) -> _Window:
+        w = self.windows.get(key)
+        if w is None:
+            w = self.windows[key] = _Window()
+        else:
+            self.windows.move_to_end(key)
+        w.last_seen = ts
+        w.push(ts, a, b, serror, rerror)
+        self.n_events += 1
+        ev = w.events
+        if self.window is not None:
+            while ev and ts - ev[0][0] > self.window:
+                w.pop()
+                self.n_events -= 1
+        if self.maxlen is not None and len(ev) > self.maxlen:
+            w.pop()
+            self.n_events -= 1
+        self._expire(ts)
+        return w
+
+    def _expire(self, now):
+        windows = self.windows
+        while windows:
+            key = next(iter(windows))
+            if now - windows[key].last_seen <= self.idle_timeout:
+                break
+            self.n_events -= len(windows.popitem(last=False)[1].events)
+            self.evicted_idle += 1
+        while len(windows) > self.max_keys:
+            self.n_events -= len(windows.popitem(last=False)[1].events)
+            self.evicted_cap += 1
+
+    def oldest_seen(self):
+        return self.windows[next(iter(self.windows))].last_seen if self.windows else None
+
+    def evict_oldest(self):
+        self.n_events -= len(self.windows.popitem(last=False)[1].events)
+        self.evicted_budget += 1
+
+    def snapshot(self):
+        """[key, last_seen, events] per key, oldest first; expired time-window events are dropped."""
+        items = list(self.windows.items())
+        if self.window is not None and items:
+            horizon = max(w.last_seen for _, w in items) - self.window
+            return [[k, w.last_seen, [e for e in w.events if e[0] >= horizon]]
+                    for k, w in items if w.last_seen >= horizon]
+        return [[k, w.last_seen, list(w.events)] for k, w in items]
+
+    def restore(self, items):
+        self.windows.clear()
+        self.n_events = 0
+        for key, last_seen, events in items:
+            w = _Window()
+            for e in events:
+                w.push(*e)
+            w.last_seen = last_seen
+            self.windows[key] = w
+            self.n_events += len(w.events)
+
+    def stats(self) -> dict:
+        return {"keys": len(self.windows), "events": self.n_events, "evicted_idle": self.evicted_idle,
+                "evicted_cap": self.evicted_cap, "evicted_budget": self.evicted_budget}
+
+
+def _rate(num, den):
+    return round(num / den, 2) if den else 0.0
+
+
+class WindowState:
+    def __init__(self, window: float = 2.0, host_window: int = 100, idle_timeout: float = 300.0,
+                 max_keys: int = 100_000, max_events: int = 1_000_000):
+        self.window = window
+        self.host_window = host_window
+        self.max_events = max_events
+        # Time windows hold nothing once idle for longer than the window itself
+        self.host_time = _Table(window=window, maxlen=MAX_COUNT, idle_timeout=window, max_keys=max_keys)
+        self.srv_time = _Table(window=window, maxlen=MAX_COUNT, idle_timeout=window, max_keys=max_keys)
+        self.host_conn = _Table(maxlen=host_window, idle_timeout=idle_timeout, max_keys=max_keys)
+        self.srv_conn = _Table(maxlen=host_window, idle_timeout=idle_timeout, max_keys=max_keys)
+
+    def update(self, ev: dict) -> dict:
+        """Add one flow (needs ts, dst, service, flag, sp) and write its traffic features into it."""
+        ts, dst, service = ev["ts"], ev["dst"], ev["service"]
+        flag = ev.get("flag")
+        se = 1 if flag in SERROR_FLAGS else 0
+        re = 1 if flag in RERROR_FLAGS else 0
+
+        w = self.host_time.push(dst, ts, service, None, se, re)
+        n = len(w.events)
+        c = w.by_a[service]
+        ev["count"] = n
+        ev["serror_rate"] = _rate(w.serror, n)
+        ev["rerror_rate"] = _rate(w.rerror, n)
+        ev["same_srv_rate"] = _rate(c[0], n)
+        ev["diff_srv_rate"] = _rate(n - c[0], n)
+
+        w = self.srv_time.push(service, ts, dst, None, se, re)
+        n = len(w.events)
+        ev["srv_count"] = n
+        ev["srv_serror_rate"] = _rate(w.serror, n)
+        ev["srv_rerror_rate"] = _rate(w.rerror, n)
+        ev["srv_diff_host_rate"] = _rate(n - w.by_a[dst][0], n)
+
+        sp = ev.get("sp")
+        w = self.host_conn.push(dst, ts, service, sp, se, re)
+        n = len(w.events)
+        c = w.by_a[service]
+        ev["dst_host_count"] = n
+        ev["dst_host_srv_count"] = c[0]
+        ev["dst_host_same_srv_rate"] = _rate(c[0], n)
+        ev["dst_host_diff_srv_rate"] = _rate(n - c[0], n)
+        ev["dst_host_same_src_port_rate"] = _rate(w.by_b.get(sp, 0), n)
+        ev["dst_host_serror_rate"] = _rate(w.serror, n)
+        ev["dst_host_rerror_rate"] = _rate(w.rerror, n)
+        ev["dst_host_srv_serror_rate"] = _rate(c[1], c[0])
+        ev["dst_host_srv_rerror_rate"] = _rate(c[2], c[0])
+
+        w = self.srv_conn.push(service, ts, dst, None, se, re)
+        n = len(w.events)
+        ev["dst_host_srv_diff_host_rate"] = _rate(n - w.by_a[dst][0], n)
+        self._enforce_budget()
+        return ev
+
+    def n_events(self) -> int:
+        return self.host_time.n_events + self.srv_time.n_events + self.host_conn.n_events + self.srv_conn.n_events
+
+    def _enforce_budget(self):
+        if not self.max_events or self.n_events() <= self.max_events:
+            return
+        tables = list(self._tables().values())
+        while self.n_events() > self.max_events:
+            live = [t for t in tables if t.windows]
+            if not live:
+                break
+            min(live, key=_Table.oldest_seen).evict_oldest()
+
+    def _tables(self):
+        return {"host_time": self.host_time, "srv_time": self.srv_time,
+                "host_conn": self.host_conn, "srv_conn": self.srv_conn}
+
+    def snapshot(self) -> dict:
+        """JSON-serializable copy of the window contents (see restore)."""
+        return {name: t.snapshot() for name, t in self._tables().items()}
+
+    def restore(self, snap: dict):
+        for name, t in self._tables().items():
+            t.restore(snap.get(name, []))
+        self._enforce_budget()
+
+    def stats(self) -> dict:
+        out = {name: t.stats() for name, t in self._tables().items()}
+        out["keys"] = sum(s["keys"] for s in out.values())
+        out["events"] = self.n_events()
+        out["max_events"] = self.max_events
+        return out
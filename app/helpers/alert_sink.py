@@ -0,0 +1,197 @@
+"""
+Asynchronous alert output for the Suricata tailer.
+
+The detection loop hands alerts to `AlertSink.put` and moves on; a writer thread
+- drains the queue in batches (one write() and at most one stdout write per batch),
+- optionally folds repeats of the same flow key (src, dst, dp, proto, flag) seen within
+  `aggregate_window` seconds into one record carrying `repeats`, `first_ts` and `last_ts`
+  (`count` is already taken by the window feature),
+- rotates the JSONL file once it reaches `max_bytes` (<path>.1 .. <path>.<backups>).
+
+The queue is bounded: when the writer can't keep up, `put` waits up to `block` seconds
+for room (backpressure on the detection loop) and then drops the alerts, counting them.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from app.utils.metrics import METRICS, STAGE_SECONDS
+
+AGGREGATE_KEY = ("src", "dst", "dp", "proto", "flag")
+
+WRITTEN = METRICS.counter("ids_alert_records_written_total", "Alert records written (after aggregation)")
+DROPPED = METRICS.counter("ids_alerts_dropped_total", "Alerts dropped because the alert sink queue was full")
+ROTATIONS = METRICS.counter("ids_alert_file_rotations_total", "Alert file rotations")
+
+
+class AlertSink:
+    def __init__(self, path, echo=True, max_queue=100_000, block=0.5, batch_size=1024, flush_interval=0.2,
+                 aggregate_window=0.0, aggregate_key=AGGREGATE_KEY, max_bytes=0, backups=5):
+        self.path = Path(path)
+        self.echo = echo
+        self.max_queue = max(1, int(max_queue))
+        self.block = block
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.aggregate_window = aggregate_window
+        self.aggregate_key = tuple(aggregate_key)
+        self.max_bytes = max_bytes
+        self.backups = max(1, int(backups))
+        self._q = deque()
+        self._cond = threading.Condition()
+        self._pending = {}          # aggregate key -> open record
+        self._busy = False
+        self._flush_pending = False
+        self._closed = False
+        self._fh = open(self.path, "a", encoding="utf-8")
+        # stats
+        self.received = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.rotations = 0
+        self._thread = threading.Thread(target=self._run, name="alert-sink", daemon=True)
+        self._thread.start()
+
+    # --- producer side ---
+    def put(self, alerts, echo=None) -> int:
+        """Queue alerts for writing; returns how many were dropped (queue full after `block` s)."""
+        if not alerts:
+            return 0
+        echo = self.echo if echo is None else echo
+        with self._cond:
+            self.received += len(alerts)
+            if len(self._q) + len(alerts) > self.max_queue:
+                deadline = time.monotonic() + self.block
+                while len(self._q) + len(alerts) > self.max_queue and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            room = max(0, self.max_queue - len(self._q))
+            if self._closed:
+                room = 0
+            self._q.extend((a, echo) for a in alerts[:room])
+            dropped = len(alerts) - min(room, len(alerts))
+            self.dropped += dropped
+            self._cond.notify_all()
+        if dropped:
+            DROPPED.inc(dropped)
+        return dropped
+
+    def flush(self, timeout=None) -> bool:
+        """Wait until everything queued so far, including open aggregates, is on disk."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flush_pending = True
+            self._cond.notify_all()
+            while self._q or self._busy or self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=10.0):
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._fh.close()
+
+    # --- writer thread ---
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._q and not self._closed and not self._flush_pending:
+                    self._cond.wait(self._next_wakeup())
+                if self._closed and not self._q:
+                    return
+                batch = [self._q.popleft() for _ in range(min(len(self._q), self.batch_size))]
+                flush_all = self._flush_pending and not self._q
+                if flush_all:
+                    self._flush_pending = False
+                self._busy = True
+                self._cond.notify_all()
+            try:
+                self._write(self._aggregate(batch, flush_all))
+            except Exception as e:
+                sys.stderr.write(f"[!] Alert write error: {e}\n")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _next_wakeup(self):
+        if not self._pending:
+            return self.flush_interval
+        oldest = min(rec["_opened"] for rec, _ in self._pending.values())
+        return max(0.0, min(self.flush_interval, oldest + self.aggregate_window - time.monotonic()))
+
+    def _aggregate(self, batch, flush_all=False):
+        """Records to write now: the batch itself, or the aggregates whose window closed."""
+        if self.aggregate_window <= 0:
+            return batch
+        now = time.monotonic()
+        for alert, echo in batch:
+            key = tuple(alert.get(k) for k in self.aggregate_key)
+            open_rec = self._pending.get(key)
+            if open_rec is None:
+                self._pending[key] = (dict(alert, repeats=1, first_ts=alert.get("ts"), last_ts=alert.get("ts"),
+                                           _opened=now), echo)
+            else:
+                rec = open_rec[0]
+                rec["repeats"] += 1
+                rec["last_ts"] = alert.get("ts")
+        out = []
+        for key in [k for k, (rec, _) in self._pending.items()
+                    if flush_all or now - rec["_opened"] >= self.aggregate_window]:
+            rec, echo = self._pending.pop(key)
+            del rec["_opened"]
+            out.append((rec, echo))
+        return out
+
+    def _write(self, records):
+        if not records:
+            return
+        t0 = time.perf_counter()
+        self._fh.write("".join(json.dumps(rec) + "\n" for rec, _ in records))
+        self._fh.flush()
+        shown = [rec for rec, echo in records if echo]
+        if shown:
+            sys.stdout.write("".join(f"[ALERT] {rec}\n" for rec in shown))
+            sys.stdout.flush()
+        self.written += len(records)
+        self.batches += 1
+        WRITTEN.inc(len(records))
+        STAGE_SECONDS.observe(time.perf_counter() - t0, "alert_write")
+        if self.max_bytes and self._fh.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._fh.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i}")
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        self._fh = open(self.path, "a", encoding="utf-8")
+        self.rotations += 1
+        ROTATIONS.inc()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "received": self.received,
+                "queued": len(self._q),
+                "aggregating": len(self._pending),
+                "written": self.written,
+                "batches": self.batches,
+                "dropped": self.dropped,
+                "rotations": self.rotations,
+            }
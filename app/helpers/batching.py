@@ -0,0 +1,190 @@
+"""
+Size/age bounded micro-batching.
+
+MicroBatcher (live flow classifier, single thread): events are queued until either
+`max_size` are waiting or the oldest one has waited `max_delay` seconds; the caller then
+drains the batch and scores it with one model call.
+
+DynamicBatcher (HTTP server, many threads): concurrent callers submit samples to a
+bounded queue; one worker thread groups them into batches under the same size/age
+bounds, makes one vectorized call per batch and hands each caller its own results.
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    def __init__(self, max_size: int = 256, max_delay: float = 0.05):
+        self.max_size = max(1, int(max_size))
+        self.max_delay = max_delay
+        self.items = []
+        self.first_at = None
+        # stats
+        self.batches = 0
+        self.events = 0
+        self.max_seen = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item) -> bool:
+        """Queue one event; True when the batch is full and should be flushed."""
+        if not self.items:
+            self.first_at = time.monotonic()
+        self.items.append(item)
+        return len(self.items) >= self.max_size
+
+    def due(self, now=None) -> bool:
+        if not self.items:
+            return False
+        now = time.monotonic() if now is None else now
+        return now - self.first_at >= self.max_delay
+
+    def drain(self) -> list:
+        batch, self.items, self.first_at = self.items, [], None
+        if batch:
+            self.batches += 1
+            self.events += len(batch)
+            self.max_seen = max(self.max_seen, len(batch))
+        return batch
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "events": self.events,
+            "avg_batch": round(self.events / self.batches, 1) if self.batches else 0.0,
+            "max_batch": self.max_seen,
+        }
+
+
+class QueueFull(Exception):
+    """The DynamicBatcher queue is at capacity; the caller should back off."""
+
+
+class _Request:
+    __slots__ = ("samples", "future", "enqueued")
+
+    def __init__(self, samples):
+        self.samples = samples
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class DynamicBatcher:
+    def __init__(self, score_fn, max_size: int = 256, max_wait: float = 0.005, queue_depth: int = 1024,
+                 latency_window: int = 10_000):
+        self.score_fn = score_fn            # list of samples -> list of results (same order)
+        self.max_size = max(1, int(max_size))
+        self.max_wait = max_wait
+        self.queue_depth = queue_depth
+        self._q = queue.Queue(maxsize=queue_depth)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._latencies = deque(maxlen=latency_window)
+        # stats
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+        self.batches = 0
+        self.rows = 0
+        self.max_seen = 0
+
+    def _ensure_worker(self):
+        # started lazily so it lives in the process that serves (e.g. after a pre-fork)
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="dynamic-batcher", daemon=True)
+                    self._thread.start()
+
+    def submit(self, samples) -> Future:
+        """Queue a list of samples; the Future resolves to their results. Raises QueueFull."""
+        self._ensure_worker()
+        req = _Request(list(samples))
+        try:
+            self._q.put_nowait(req)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise QueueFull(f"batch queue is full ({self.queue_depth} requests waiting)")
+        return req.future
+
+    def predict(self, samples, timeout=None):
+        return self.submit(samples).result(timeout)
+
+    def _run(self):
+        while True:
+            first = self._q.get()
+            batch, rows = [first], len(first.samples)
+            deadline = first.enqueued + self.max_wait
+            while rows < self.max_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    # past the deadline, still take whatever is already waiting
+                    req = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(req)
+                rows += len(req.samples)
+            self._dispatch(batch, rows)
+
+    def _dispatch(self, batch, rows):
+        samples = [s for req in batch for s in req.samples]
+        try:
+            results = self.score_fn(samples)
+            outcomes = []
+            i = 0
+            for req in batch:
+                n = len(req.samples)
+                outcomes.append((req, results[i:i + n], None))
+                i += n
+        except Exception as e:
+            if len(batch) == 1:
+                outcomes = [(batch[0], None, e)]
+            else:
+                # one bad sample must not fail every request coalesced with it: score them one by one
+                outcomes = [self._score_one(req) for req in batch]
+        now = time.monotonic()
+        ok = [req for req, _, err in outcomes if err is None]
+        for req, res, err in outcomes:
+            if err is None:
+                req.future.set_result(res)
+            else:
+                req.future.set_exception(err)
+        with self._lock:
+            self.errors += len(batch) - len(ok)
+            self.requests += len(ok)
+            self.batches += 1
+            self.rows += rows
+            self.max_seen = max(self.max_seen, rows)
+            self._latencies.extend(now - req.enqueued for req in ok)
+
+    def _score_one(self, req):
+        try:
+            return req, self.score_fn(req.samples), None
+        except Exception as e:
+            return req, None, e
+
+    def queued(self) -> int:
+        return self._q.qsize()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lat = np.asarray(self._latencies) * 1000.0
+            return {
+                "settings": {"max_batch_size": self.max_size, "max_wait_ms": self.max_wait * 1000.0,
+                             "queue_depth": self.queue_depth},
+                "queued": self.queued(),
+                "requests": self.requests,
+                "rejected": self.rejected,
+                "errors": self.errors,
+                "batches": self.batches,
+                "avg_batch": round(self.rows / self.batches, 1) if self.batches else 0.0,
+                "max_batch": self.max_seen,
+                "latency_ms": {f"p{q}": round(float(np.percentile(lat, q)), 3) for q in (50, 90, 99)} if lat.size else {},
+            }
@@ -0,0 +1,458 @@
+"""
+Offline benchmark suite for the hot paths, with regression checks against a baseline.
+
+    python -m app.helpers.benchmark run                      # -> reports/bench/suite_<time>.json
+    python -m app.helpers.benchmark run --save-baseline
+    python -m app.helpers.benchmark compare reports/bench/suite_20250101_120000.json
+    python -m app.helpers.benchmark compare reports/bench/suite_2025010*.json   # median of several runs
+
+Everything runs in a scratch directory on the bundled data/raw/KDDTest+.txt (used as both
+the train and the test split), so no download, trained model or server is needed:
+- dataset: make_dataset.main for both tasks, cold (parsing the raw file) and warm (column cache),
+- train: train.grid_search wall time per model on the multiclass table,
+- load: model load time (plain and mmap) and peak allocations, for the trained pipeline and
+  its serving artifact (app.models.artifacts),
+- predict: infer.predict latency for single rows (prediction cache off),
+- http: POST /predict throughput for list payloads through the Flask test client,
+- tailer: per-event cost of the ids_suricata loop (parse_flow -> window features -> score_batch)
+  on synthetic eve flows built from the same rows.
+
+Timings are medians over --repeat runs, and a report holds the per-metric median of
+--suites whole suite runs (default 3): single suite runs differ by 15-50% on the same host,
+their median far less. `compare` checks the TRACKED metrics against the baseline
+(reports/bench/baseline.json unless given) and exits with status 1 when one got worse by
+more than its tolerance (TOLERANCES, default 15%; --tolerance sets one for all); several
+reports given to `compare` are combined by their median too. Baselines are machine
+specific, record one per host.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+from app.helpers.replay import REPORTS
+from app.utils.io import atomic_dump, ensure_dir, save_json
+
+ROOT = Path(__file__).resolve().parents[2]
+BUNDLED = ROOT / "data" / "raw" / "KDDTest+.txt"
+BASELINE = REPORTS / "baseline.json"
+# run options that change the numbers; `compare` warns when they differ
+CONFIG_KEYS = ("quick", "suites", "repeat", "models", "search", "model", "rows", "batch_rows", "events", "batch_size")
+
+# relative change counted as a regression, for medians of several suite runs
+DEFAULT_TOLERANCE = 0.15
+# metrics that stay noisier than that even as medians (millisecond loads, tail latency)
+TOLERANCES = {
+    "load.{variant}.load_ms": 0.3,
+    "load.{variant}.mmap_load_ms": 0.3,
+    "predict.{variant}.p99_us": 0.3,
+}
+# fewer suite runs than this behind a comparison draws a warning
+MIN_SUITES = 3
+
+# metric path -> which direction is better; what `compare` checks
+TRACKED = {
+    "dataset.cold_seconds": "lower",
+    "dataset.warm_seconds": "lower",
+    "train.{model}.seconds": "lower",
+    "load.{variant}.load_ms": "lower",
+    "load.{variant}.mmap_load_ms": "lower",
+    "load.{variant}.peak_alloc_mb": "lower",
+    "predict.{variant}.p50_us": "lower",
+    "predict.{variant}.p99_us": "lower",
+    "http.{variant}.rows_per_s": "higher",
+    "tailer.{variant}.us_per_event": "lower",
+    "tailer.{variant}.events_per_s": "higher",
+    "peak_rss_mb": "lower",
+}
+
+
+@contextmanager
+def scratch_dir(keep=False):
+    """Run in a temp directory holding data/raw/KDDTrain+.txt and KDDTest+.txt (both the bundled test split)."""
+    work = Path(tempfile.mkdtemp(prefix="ids_bench_"))
+    raw = ensure_dir(work / "data" / "raw")
+    for name in ("KDDTrain+.txt", "KDDTest+.txt"):
+        shutil.copyfile(BUNDLED, raw / name)
+    cwd = os.getcwd()
+    os.chdir(work)
+    try:
+        yield work
+    finally:
+        os.chdir(cwd)
+        if not keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+def _median(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times))
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+
+def bench_dataset(repeat):
+    from app.data import make_dataset
+
+    tasks = ["binary", "multiclass"]
+    cold = []
+    for _ in range(repeat):
+        shutil.rmtree("data/cache", ignore_errors=True)
+        t0 = time.perf_counter()
+        make_dataset.main(tasks)
+        cold.append(time.perf_counter() - t0)
+    warm = _median(lambda: make_dataset.main(tasks), repeat)
+    return {"tasks": tasks, "cold_seconds": round(float(np.median(cold)), 3), "warm_seconds": round(warm, 3)}
+
+
+def bench_train(models, search):
+    """Wall time of train.grid_search per model; returns (results, path of the last best pipeline)."""
+    from joblib import Memory
+
+    from app.data.cache import load_interim
+    from app.models import train
+
+    df = load_interim(train.INTERIM / "train_multiclass")
+    X, y = df.drop(columns=["target"]), df["target"].values
+    ensure_dir(train.MODELS)
+    res, path = {}, None
+    for name in models:
+        cache_dir = tempfile.mkdtemp(prefix="ids_pre_cache_")
+        try:
+            t0 = time.perf_counter()
+            gs = train.grid_search(name, train.build_preprocessor(X), X, y, search=search,
+                                   memory=Memory(cache_dir, verbose=0))
+            seconds = time.perf_counter() - t0
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        path = train.MODELS / f"best_{name}.joblib"
+        atomic_dump(gs.best_estimator_, path)
+        res[name] = {"rows": len(df), "search": search, "candidates": len(gs.cv_results_["params"]),
+                     "seconds": round(seconds, 3), "best_score": round(float(gs.best_score_), 4)}
+    return res, path
+
+
+def bench_load(path, repeat):
+    from joblib import load
+
+    # loads take milliseconds: many more runs than the other timings to steady the median
+    load_s = _median(lambda: load(path), repeat * 10)
+    mmap_s = _median(lambda: load(path, mmap_mode="c"), repeat * 10)
+    # separate pass: tracemalloc slows the load down
+    tracemalloc.start()
+    load(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"path": str(path), "size_mb": round(Path(path).stat().st_size / 2 ** 20, 3),
+            "load_ms": round(load_s * 1000, 2), "mmap_load_ms": round(mmap_s * 1000, 2),
+            "peak_alloc_mb": round(peak / 2 ** 20, 2)}
+
+
+def sample_rows(n):
+    from app.data.cache import load_interim
+    from app.models.train import INTERIM
+
+    df = load_interim(INTERIM / "test_multiclass").drop(columns=["target", "label"], errors="ignore")
+    df = df.astype({c: str for c in df.columns if df[c].dtype.kind not in "biuf"})
+    return df.head(n).to_dict("records")
+
+
+def bench_predict(path, rows):
+    from app.models import infer
+
+    infer.PRED_CACHE_SIZE = 0  # a cache would hide model cost
+    for r in rows[:50]:
+        infer.predict(str(path), r)
+    lat = []
+    for r in rows:
+        t0 = time.perf_counter()
+        infer.predict(str(path), r)
+        lat.append(time.perf_counter() - t0)
+    lat = np.asarray(lat) * 1e6
+    return {"calls": len(lat), "mean_us": round(float(lat.mean()), 1),
+            **{f"p{q}_us": round(float(np.percentile(lat, q)), 1) for q in (50, 90, 99)}}
+
+
+def load_server():
+    """The Flask app from app.py (importing `app` would pick up the package)."""
+    spec = importlib.util.spec_from_file_location("ids_server", ROOT / "app.py")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def bench_http(server, path, rows, batch_rows, repeat):
+    server.MODEL_PATH = str(path)
+    client = server.app.test_client()
+    body = json.dumps(rows[:batch_rows])
+    n = len(rows[:batch_rows])
+
+    def post():
+        r = client.post("/predict", data=body, content_type="application/json")
+        if r.status_code != 200:
+            raise RuntimeError(f"/predict returned {r.status_code}: {r.get_data(as_text=True)[:200]}")
+
+    post()
+    seconds = _median(post, repeat)
+    return {"batch_rows": n, "request_ms": round(seconds * 1000, 2), "rows_per_s": round(n / seconds, 1)}
+
+
+def eve_lines(n):
+    """`n` eve flow lines from app.helpers.replay.synthetic_events, 5k flows/s of event time."""
+    from app.helpers.replay import synthetic_events
+
+    events = synthetic_events()
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    lines = []
+    for i in range(n):
+        ev = next(events)
+        ts = (base + timedelta(microseconds=200 * i)).strftime("%Y-%m-%dT%H:%M:%S.%f") + "+0000"
+        ev["timestamp"] = ev["flow"]["start"] = ev["flow"]["end"] = ts
+        lines.append(json.dumps(ev, separators=(",", ":")).encode())
+    return lines
+
+
+def bench_tailer(path, lines, batch_size, repeat):
+    from joblib import load
+
+    from app.features.window_state import WindowState
+    from app.helpers.ids_suricata import get_expected_columns, parse_flow, score_batch
+
+    model = load(path, mmap_mode="c")
+    cols = get_expected_columns(model)
+
+    def run_once():
+        windows = WindowState(2.0, 100, 300.0, 100000)
+        batch, score_s, alerts = [], 0.0, 0
+        t0 = time.perf_counter()
+        for i, line in enumerate(lines):
+            item = parse_flow(line, windows, cols)
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= batch_size or (batch and i == len(lines) - 1):
+                t1 = time.perf_counter()
+                alerts += len(score_batch(model, batch))
+                score_s += time.perf_counter() - t1
+                batch = []
+        total = time.perf_counter() - t0
+        # everything outside score_batch is parsing and window features
+        return total, total - score_s, score_s, alerts
+
+    runs = sorted((run_once() for _ in range(repeat)), key=lambda r: r[0])
+    total, parse_s, score_s, alerts = runs[len(runs) // 2]
+    n = len(lines)
+    return {"events": n, "batch_size": batch_size, "alerts": alerts,
+            "us_per_event": round(total / n * 1e6, 2), "parse_features_us": round(parse_s / n * 1e6, 2),
+            "predict_us": round(score_s / n * 1e6, 2), "events_per_s": round(n / total, 1)}
+
+
+def run(args) -> dict:
+    from app.models.artifacts import export
+
+    if not BUNDLED.exists():
+        raise SystemExit(f"Missing {BUNDLED}; the suite runs on the bundled test split")
+    res = {"created": datetime.now(timezone.utc).isoformat(timespec="seconds"), "host": os.uname().nodename,
+           "cpus": os.cpu_count(), "python": sys.version.split()[0],
+           "config": {k: getattr(args, k) for k in CONFIG_KEYS}}
+    with scratch_dir(args.keep) as work:
+        print(f"[bench] Working in {work}")
+        print("[bench] dataset …")
+        res["dataset"] = bench_dataset(args.repeat)
+        print("[bench] train …")
+        res["train"], model_path = bench_train(args.models, args.search)
+        variants = {"pipeline": Path(args.model) if args.model else model_path}
+        variants["artifact"], _ = export(variants["pipeline"], Path("models") / "bench.artifact.joblib")
+        rows = sample_rows(max(args.rows, args.batch_rows))
+        lines = eve_lines(args.events)
+        server = load_server()
+        res["models"] = {k: str(v) for k, v in variants.items()}
+        for section in ("load", "predict", "http", "tailer"):
+            res[section] = {}
+        for variant, path in variants.items():
+            print(f"[bench] {variant}: load, predict, http, tailer …")
+            res["load"][variant] = bench_load(path, args.repeat)
+            res["predict"][variant] = bench_predict(path, rows[:args.rows])
+            res["http"][variant] = bench_http(server, path, rows, args.batch_rows, args.repeat)
+            res["tailer"][variant] = bench_tailer(path, lines, args.batch_size, args.repeat)
+    res["peak_rss_mb"] = _peak_rss_mb()
+    return res
+
+
+def flatten(res) -> dict:
+    """Values of the TRACKED metrics in a report, keyed by concrete path (e.g. predict.artifact.p50_us)."""
+    out = {}
+    for pattern, better in TRACKED.items():
+        parts = pattern.split(".")
+        tolerance = TOLERANCES.get(pattern, DEFAULT_TOLERANCE)
+
+        def walk(node, i, path):
+            if i == len(parts):
+                if isinstance(node, (int, float)):
+                    out[".".join(path)] = (float(node), better, tolerance)
+                return
+            if not isinstance(node, dict):
+                return
+            keys = node.keys() if parts[i].startswith("{") else [parts[i]] if parts[i] in node else []
+            for k in keys:
+                walk(node[k], i + 1, path + [k])
+
+        walk(res, 0, [])
+    return out
+
+
+def flatten_median(reports) -> dict:
+    """flatten() of several reports: per metric the median over the reports that have it."""
+    flat = [flatten(r) for r in reports]
+    out = {}
+    for key in set().union(*flat):
+        values = [f[key][0] for f in flat if key in f]
+        _, better, tolerance = next(f[key] for f in flat if key in f)
+        out[key] = (float(np.median(values)), better, tolerance)
+    return out
+
+
+def median_report(reports) -> dict:
+    """The first report with every TRACKED metric replaced by its median over `reports`."""
+    res = json.loads(json.dumps(reports[0]))
+    for key, (value, _, _) in flatten_median(reports).items():
+        *parents, leaf = key.split(".")
+        node = res
+        for p in parents:
+            node = node.setdefault(p, {})
+        node[leaf] = round(value, 6)
+    return res
+
+
+def compare(current, baseline, tolerance=None) -> list:
+    """Rows (metric, baseline, current, relative change, status) for metrics present in both.
+
+    `current` is a report or a list of reports (compared by their per-metric median);
+    `tolerance` overrides the per-metric TOLERANCES.
+    """
+    cur = flatten(current) if isinstance(current, dict) else flatten_median(current)
+    base = flatten(baseline)
+    rows = []
+    for key in sorted(cur.keys() & base.keys()):
+        (c, better, tol), (b, _, _) = cur[key], base[key]
+        tol = tol if tolerance is None else tolerance
+        change = (c - b) / b if b else 0.0
+        worse = change > tol if better == "lower" else change < -tol
+        better_by = change < -tol if better == "lower" else change > tol
+        rows.append((key, b, c, change, "REGRESSION" if worse else "improved" if better_by else "ok"))
+    return rows
+
+
+def print_comparison(rows):
+    print(f"{'metric':<42}{'baseline':>12}{'current':>12}{'change':>9}  status")
+    for key, b, c, change, status in rows:
+        print(f"{key:<42}{b:>12.4g}{c:>12.4g}{change:>+9.1%}  {status}")
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="Run the suite and save its JSON report")
+    r.add_argument("--quick", action="store_true", help="Fewer rows/events/repeats (a smoke run, noisier)")
+    r.add_argument("--suites", type=int, help="Whole suite runs, per-metric median reported (default 3, quick 1)")
+    r.add_argument("--repeat", type=int, help="Runs per timing, median reported (default 5, quick 2)")
+    r.add_argument("--models", nargs="+", default=["dt"], help="Models to time train.grid_search for (dt, svm, ksvm)")
+    r.add_argument("--search", default="grid", choices=["grid", "halving"])
+    r.add_argument("--model", help="Benchmark this saved pipeline instead of the one trained by the suite")
+    r.add_argument("--rows", type=int, help="Single-row predict calls (default 2000, quick 300)")
+    r.add_argument("--batch-rows", type=int, default=1000, help="Rows per /predict request")
+    r.add_argument("--events", type=int, help="Eve flows through the tailer loop (default 50000, quick 5000)")
+    r.add_argument("--batch-size", type=int, default=256, help="Tailer micro-batch size (ids_suricata --batch-size)")
+    r.add_argument("--out", help=f"Report path (default: {REPORTS}/suite_<time>.json)")
+    r.add_argument("--save-baseline", action="store_true", help=f"Also store the report as {BASELINE}")
+    r.add_argument("--compare", action="store_true", help="Compare against the baseline when done")
+    r.add_argument("--tolerance", type=float,
+                   help="Relative change counted as a regression for every metric (default: TOLERANCES)")
+    r.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    c = sub.add_parser("compare", help="Flag regressions of a report against a baseline")
+    c.add_argument("reports", nargs="+", help="Report(s) written by `run`; several are compared by their median")
+    c.add_argument("--baseline", default=str(BASELINE))
+    c.add_argument("--tolerance", type=float,
+                   help="Relative change counted as a regression for every metric (default: TOLERANCES)")
+    args = ap.parse_args(argv)
+    if args.cmd == "run":
+        args.suites = args.suites or (1 if args.quick else 3)
+        args.repeat = args.repeat or (2 if args.quick else 5)
+        args.rows = args.rows or (300 if args.quick else 2000)
+        args.events = args.events or (5000 if args.quick else 50000)
+    return args
+
+
+def compare_files(reports, baseline, tolerance) -> int:
+    current = []
+    for report in reports:
+        with open(report) as f:
+            current.append(json.load(f))
+    with open(baseline) as f:
+        base = json.load(f)
+    rows = compare(current, base, tolerance)
+    what = reports[0] if len(reports) == 1 else f"median of {len(reports)} reports"
+    limit = f"tolerance {tolerance:.0%}" if tolerance is not None else \
+        f"tolerance {DEFAULT_TOLERANCE:.0%}, noisy metrics up to {max(TOLERANCES.values()):.0%}"
+    print(f"Comparing {what} against {baseline} ({limit})")
+    suites = sum(cur.get("config", {}).get("suites", 1) for cur in current)
+    for name, n in ((what, suites), (baseline, base.get("config", {}).get("suites", 1))):
+        if n < MIN_SUITES:
+            print(f"[!] {name} holds {n} suite run(s); single runs differ by 15-50%, "
+                  f"expect false alarms (run with --suites {MIN_SUITES} or more)")
+    for key in ("host", "cpus", "config"):
+        for report, cur in zip(reports, current):
+            if cur.get(key) != base.get(key):
+                print(f"[!] {key} of {report} differs from the baseline: {cur.get(key)} vs {base.get(key)}")
+    print_comparison(rows)
+    regressions = [r[0] for r in rows if r[4] == "REGRESSION"]
+    if regressions:
+        print(f"[!] {len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    print("No regressions.")
+    return 0
+
+
+def main():
+    args = parse_args()
+    if args.cmd == "compare":
+        sys.exit(compare_files(args.reports, args.baseline, args.tolerance))
+    out = Path(args.out).resolve() if args.out else ensure_dir(REPORTS).resolve() / f"suite_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    baseline = BASELINE.resolve()
+    if args.model:
+        args.model = str(Path(args.model).resolve())
+    runs = []
+    for i in range(args.suites):
+        print(f"[bench] suite run {i + 1}/{args.suites}")
+        runs.append(run(args))
+    res = median_report(runs) if len(runs) > 1 else runs[0]
+    save_json(res, out)
+    print("Saved:", out)
+    if args.save_baseline:
+        save_json(res, baseline)
+        print("Saved baseline:", baseline)
+    elif args.compare:
+        if not baseline.exists():
+            raise SystemExit(f"No baseline at {baseline}; run with --save-baseline first")
+        sys.exit(compare_files([out], baseline, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Offline bulk scoring of archived eve.json files and flow CSVs (incident retros).
+
+    python -m app.helpers.bulk_score --model models/best_dt.artifact.joblib \
+        --input '/var/log/suricata/eve.json*' --out scored.jsonl
+    python -m app.helpers.bulk_score --model models/best_svm.joblib --input flows.csv.gz --alerts-only --out alerts.jsonl
+
+Inputs:
+- eve.json, plain or .gz: flow events become model rows exactly like in the live tailer
+  (ids_suricata.parse_flow: port_to_service, suri_state_to_flag, WindowState counts);
+- CSV, plain or .gz, holding model feature columns: scored as they are.
+
+Every file is a work unit; plain eve files larger than --partition-mb are split into byte
+ranges at line boundaries. eve.json is time-ordered, so the worker of a range first feeds
+the lines before it through the window state without scoring them: at least --warmup-mb
+and at least max(--window, --idle-timeout) seconds of traffic. count/srv_count then match
+a sequential pass exactly; a dst_host_* window (last --host-window connections) matches
+when those connections fall inside the replayed span, so a destination contacted less
+often than that can start a range with a shorter history than a sequential pass gives it.
+Units are scored in a process pool, --chunk-size rows per model call, each into a part
+file; the parts are joined in input order at the end and removed if a unit fails.
+
+Output is JSONL: every scored row (flow metadata, model features and `pred`), or with
+--alerts-only the tailer's alert records.
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from app.utils.io import ensure_dir, save_json
+
+REPORTS = Path("reports/bulk")
+# flow metadata kept next to the features in scored output
+META = ("ts_str", "src", "dst", "sp", "dp")
+
+_models = {}
+
+
+def expand_inputs(patterns):
+    from app.models.incremental import expand_sources
+
+    paths = expand_sources(patterns)
+    if not paths:
+        raise FileNotFoundError(f"No inputs match: {' '.join(map(str, patterns))}")
+    missing = [p for p in paths if not os.path.exists(p)]
+    if missing:
+        raise FileNotFoundError(f"No such input: {', '.join(missing)}")
+    return paths
+
+
+def is_csv(path) -> bool:
+    return str(path).endswith((".csv", ".csv.gz"))
+
+
+def plan_units(paths, partition_bytes):
+    """(path, start, end) work units; end None means to the end of the file."""
+    units = []
+    for path in paths:
+        size = os.path.getsize(path)
+        if is_csv(path) or str(path).endswith(".gz") or not partition_bytes or size <= partition_bytes:
+            units.append((path, 0, None))
+            continue
+        for start in range(0, size, partition_bytes):
+            units.append((path, start, min(start + partition_bytes, size)))
+    return units
+
+
+def _align(fh, offset) -> int:
+    """Offset of the first line starting at or after `offset`."""
+    if offset <= 0:
+        return 0
+    fh.seek(offset - 1)
+    fh.readline()
+    return fh.tell()
+
+
+def _line_ts(fh, pos):
+    from app.helpers.eve_reader import parse_ts
+
+    fh.seek(pos)
+    try:
+        return parse_ts(json.loads(fh.readline())["timestamp"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _warmup_start(fh, own, warmup, window):
+    """Start of the lines replayed before `own`: at least `warmup` bytes and `window` seconds back."""
+    back, ts_own = warmup, _line_ts(fh, own)
+    while True:
+        pos = _align(fh, own - back)
+        ts = _line_ts(fh, pos) if pos and ts_own is not None else None
+        if ts is None or ts <= ts_own - window:
+            return pos
+        back *= 2
+
+
+def iter_eve_lines(path, start=0, end=None, warmup=0, window=0.0):
+    """(line, scored) for the lines of a byte range; the lines replayed before it come first with scored=False."""
+    if str(path).endswith(".gz"):
+        with gzip.open(path, "rb") as fh:
+            for line in fh:
+                yield line, True
+        return
+    with open(path, "rb") as fh:
+        own = _align(fh, start)
+        stop = _align(fh, end) if end is not None else None
+        pos = _warmup_start(fh, own, warmup, window) if warmup and own else own
+        fh.seek(pos)
+        for line in fh:
+            if stop is not None and pos >= stop:
+                break
+            yield line, pos >= own
+            pos += len(line)
+
+
+def _model(path):
+    if path not in _models:
+        import joblib
+
+        from app.helpers.ids_suricata import get_expected_columns
+
+        # copy-on-write mmap: workers share one physical copy of an uncompressed artifact
+        model = joblib.load(path, mmap_mode="c")
+        _models[path] = (model, get_expected_columns(model))
+    return _models[path]
+
+
+def _eve_records(rows, evs, preds, alerts_only):
+    from app.helpers.ids_suricata import make_alert
+
+    if alerts_only:
+        return [make_alert(ev) for ev, p in zip(evs, preds) if int(p) == 1]
+    return [dict({k: ev[k] for k in META}, **row, pred=int(p)) for row, ev, p in zip(rows, evs, preds)]
+
+
+def score_eve(unit, opts, out_fh):
+    from app.features.window_state import WindowState
+    from app.helpers.ids_suricata import parse_flow, predict_rows
+
+    path, start, end = unit
+    model, cols = _model(opts["model"])
+    windows = WindowState(opts["window"], opts["host_window"], opts["idle_timeout"], opts["max_keys"],
+                          opts["max_events"])
+    n_rows = n_out = 0
+    evs, rows = [], []
+
+    def flush():
+        nonlocal n_rows, n_out
+        records = _eve_records(rows, evs, predict_rows(model, rows), opts["alerts_only"])
+        out_fh.write("".join(json.dumps(r) + "\n" for r in records))
+        n_rows += len(rows)
+        n_out += len(records)
+        evs.clear()
+        rows.clear()
+
+    # idle keys are only forgotten after idle_timeout, so replay at least that much history
+    warmup_s = max(opts["window"], opts["idle_timeout"])
+    for line, scored in iter_eve_lines(path, start, end, opts["warmup_bytes"], warmup_s):
+        if b'"flow"' not in line:
+            continue
+        item = parse_flow(line, windows, cols)
+        if item is None or not scored:
+            continue
+        evs.append(item[0])
+        rows.append(item[1])
+        if len(rows) >= opts["chunk_size"]:
+            flush()
+    if rows:
+        flush()
+    return n_rows, n_out
+
+
+def score_csv(unit, opts, out_fh):
+    model, _ = _model(opts["model"])
+    n_rows = n_out = 0
+    for chunk in pd.read_csv(unit[0], chunksize=opts["chunk_size"]):
+        n_rows += len(chunk)
+        chunk = chunk.assign(pred=model.predict(chunk))
+        if opts["alerts_only"]:
+            chunk = chunk[chunk["pred"] == 1]
+        if len(chunk):
+            out_fh.write(chunk.to_json(orient="records", lines=True).rstrip("\n") + "\n")
+        n_out += len(chunk)
+    return n_rows, n_out
+
+
+def part_path(out, idx) -> str:
+    return f"{out}.part-{idx:05d}"
+
+
+def score_unit(idx, unit, opts):
+    """Score one unit into its part file; returns its stats."""
+    t0 = time.perf_counter()
+    part = part_path(opts["out"], idx)
+    with open(part, "w", encoding="utf-8") as out_fh:
+        if is_csv(unit[0]):
+            rows, written = score_csv(unit, opts, out_fh)
+        else:
+            rows, written = score_eve(unit, opts, out_fh)
+    return {"unit": idx, "path": str(unit[0]), "start": unit[1], "end": unit[2], "part": part,
+            "rows": rows, "written": written, "seconds": round(time.perf_counter() - t0, 3)}
+
+
+def run(inputs, opts, jobs=None):
+    units = plan_units(expand_inputs(inputs), opts["partition_bytes"])
+    ensure_dir(Path(opts["out"]).parent)
+    print(f"[bulk] {len(units)} work units from {len(inputs)} input pattern(s), {jobs or os.cpu_count()} workers")
+    t0 = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=min(len(units), jobs or os.cpu_count() or 1)) as pool:
+            futures = [pool.submit(score_unit, i, unit, opts) for i, unit in enumerate(units)]
+            stats = []
+            try:
+                for fut in futures:
+                    stats.append(fut.result())
+                    s = stats[-1]
+                    print(f"[bulk] {s['path']} [{s['start']}:{s['end'] or 'end'}] {s['rows']} rows "
+                          f"in {s['seconds']:.1f}s")
+            except BaseException:
+                # don't start units whose output would be thrown away
+                for fut in futures:
+                    fut.cancel()
+                raise
+        # join the parts in input order
+        with open(opts["out"], "w", encoding="utf-8") as out_fh:
+            for s in stats:
+                with open(s["part"], encoding="utf-8") as part_fh:
+                    shutil.copyfileobj(part_fh, out_fh, 1 << 20)
+    finally:
+        for i in range(len(units)):
+            try:
+                os.remove(part_path(opts["out"], i))
+            except FileNotFoundError:
+                pass
+    wall = time.perf_counter() - t0
+    rows = sum(s["rows"] for s in stats)
+    res = {"model": opts["model"], "inputs": list(inputs), "out": opts["out"], "alerts_only": opts["alerts_only"],
+           "units": stats, "rows": rows, "written": sum(s["written"] for s in stats),
+           "wall_seconds": round(wall, 3), "rows_per_s": round(rows / max(wall, 1e-9), 1)}
+    return res
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", required=True, help="Saved sklearn Pipeline, compiled engine or artifact (joblib)")
+    ap.add_argument("--input", nargs="+", required=True, help="eve.json / CSV files, plain or .gz (globs allowed)")
+    ap.add_argument("--out", required=True, help="Output JSONL")
+    ap.add_argument("--alerts-only", action="store_true", help="Write only alert records (pred == 1)")
+    ap.add_argument("--jobs", type=int, help="Worker processes (default: CPU count)")
+    ap.add_argument("--chunk-size", type=int, default=4096, help="Rows per model call")
+    ap.add_argument("--partition-mb", type=float, default=256, help="Split plain eve files into ranges of this size")
+    ap.add_argument("--warmup-mb", type=float, default=8, help="Min. eve bytes replayed into the windows before a range")
+    ap.add_argument("--window", type=float, default=2.0, help="Seconds for count/srv_count window")
+    ap.add_argument("--host-window", type=int, default=100, help="Connections per destination for dst_host_* features")
+    ap.add_argument("--idle-timeout", type=float, default=300.0, help="Forget destinations/services idle for this many seconds")
+    ap.add_argument("--max-keys", type=int, default=100000, help="Max destinations/services tracked per window table")
+    ap.add_argument("--max-events", type=int, default=1000000,
+                    help="Max events held by all window tables together (least recently seen keys go first)")
+    ap.add_argument("--report", help="Run report JSON (default reports/bulk/<out name>.json)")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    opts = {"model": args.model, "out": args.out, "alerts_only": args.alerts_only, "chunk_size": args.chunk_size,
+            "partition_bytes": int(args.partition_mb * (1 << 20)), "warmup_bytes": int(args.warmup_mb * (1 << 20)),
+            "window": args.window, "host_window": args.host_window, "idle_timeout": args.idle_timeout,
+            "max_keys": args.max_keys, "max_events": args.max_events}
+    res = run(args.input, opts, args.jobs)
+    print(f"[bulk] {res['rows']} rows scored, {res['written']} records written to {res['out']} "
+          f"in {res['wall_seconds']:.1f}s ({res['rows_per_s']:.0f} rows/s)")
+    dest = Path(args.report) if args.report else REPORTS / f"{Path(args.out).name}.json"
+    save_json(res, dest)
+    print("Saved report:", dest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Resume points for the Suricata tailer.
+
+A checkpoint records the eve.json inode and the offset just past the last flow whose
+batch was scored, plus a compacted copy of the window state. It is written atomically
+(temp file + rename) so a crash mid-write leaves the previous checkpoint intact.
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+VERSION = 1
+
+
+def save_checkpoint(path, eve, inode, offset, windows) -> None:
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    state = {
+        "version": VERSION,
+        "eve": os.path.abspath(eve),
+        "inode": inode,
+        "offset": offset,
+        "saved_at": time.time(),
+        "windows": windows.snapshot(),
+    }
+    tmp = p.with_suffix(p.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, separators=(",", ":"))
+    os.replace(tmp, p)
+
+
+def load_checkpoint(path, eve):
+    """The saved state for `eve`, or None if there is no usable checkpoint."""
+    p = Path(path)
+    if not p.exists():
+        return None
+    try:
+        state = json.loads(p.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        print(f"[checkpoint] Ignoring unreadable checkpoint {p}: {e}")
+        return None
+    if state.get("version") != VERSION or state.get("eve") != os.path.abspath(eve):
+        print(f"[checkpoint] {p} belongs to another eve file/version; starting fresh")
+        return None
+    return state
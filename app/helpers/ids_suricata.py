@@ -4,25 +4,49 @@ NOTE:
 - Tails Suricata's eve.json and classifies each flow (event_type=flow) using a saved sklearn Pipeline.
 - Designed for IDS models trained on NSL-KDD-like features (protocol_type, service, flag, duration, src_bytes, dst_bytes, count, srv_count).
 - Start Suricata first: sudo suricata -i <iface> -l /var/log/suricata -D
-- Then run: sudo python3 live_ids_suricata.py --model models/best_dt.joblib --eve /var/log/suricata/eve.json
+- Then run (from the repo root): sudo python3 -m app.helpers.ids_suricata --model models/best_dt.joblib --eve /var/log/suricata/eve.json
+- A compiled NumPy engine (python -m app.models.compiled --model models/best_dt.joblib) can be passed as --model too.
 
 NOTE:
 - The pipeline should use OneHotEncoder(handle_unknown="ignore") for categorical columns.
 - We approximate KDD flags from Suricata flow/tcp state.
-- We keep 2-second sliding windows per dst host and per (dst, service) to compute count and srv_count.
+- Traffic features (count, srv_count, *_rate and the dst_host_* 100-connection features) come from
+  app.features.window_state; idle destinations expire and --max-keys/--max-events bound memory.
+- --metrics-port exposes per-stage latency histograms, flow/alert counters and rates in
+  Prometheus text format (app.utils.metrics); with --workers N the parent merges the workers'.
 """
 
 import argparse
+import itertools
 import json
 import time
-from collections import defaultdict, deque
 from datetime import datetime, timezone
 import os
+import signal
 import sys
 
 import joblib
 import pandas as pd
 
+from app.features.window_state import WindowState
+from app.helpers.alert_sink import AlertSink
+from app.helpers.batching import MicroBatcher
+from app.helpers.checkpoint import load_checkpoint, save_checkpoint
+from app.helpers.eve_reader import EveReader, parse_ts
+from app.models.compiled import CompiledModel
+from app.models.pred_cache import PredictionCache
+from app.utils.metrics import METRICS, STAGE_SECONDS, serve_metrics
+
+EVENTS = METRICS.counter("ids_flows_scored_total", "Flows scored by the tailer")
+ALERTS = METRICS.counter("ids_alerts_total", "Alerts accepted by the alert sink (not dropped)")
+DROPPED = METRICS.counter("ids_flows_dropped_total", "Flows dropped on prediction errors")
+METRICS.rate("ids_flows_per_second", "Flows scored per second over the last 10 s", EVENTS)
+METRICS.rate("ids_alerts_per_second", "Alerts per second over the last 10 s", ALERTS)
+# per-event stages (eve_parse, window_update, features) are timed on every Nth event;
+# timing every one of them costs ~5% of the parse path, sampling ~0.5%
+STAGE_SAMPLE = 16
+_parse_tick = itertools.count()
+
 # --- basic port->service mapping to approximate NSL-KDD 'service' ---
 PORT_SERVICE = {
     20: 'ftp_data', 21: 'ftp', 22: 'ssh', 23: 'telnet', 25: 'smtp', 53: 'domain_u',
@@ -76,12 +100,47 @@ def parse_args():
         help='Path to Suricata eve.json'
     )
     ap.add_argument('--window', type=float, default=2.0, help='Seconds for count/srv_count window')
+    ap.add_argument('--host-window', type=int, default=100, help='Connections per destination for dst_host_* features')
+    ap.add_argument('--idle-timeout', type=float, default=300.0, help='Forget destinations/services idle for this many seconds')
+    ap.add_argument('--max-keys', type=int, default=100000, help='Max destinations/services tracked per window table')
+    ap.add_argument('--max-events', type=int, default=1000000,
+                    help='Max events held by all window tables together (least recently seen keys go first)')
     ap.add_argument('--print-cols', action='store_true', help='Print expected model input columns and exit')
     ap.add_argument('--alert-file', default='ids_alerts.jsonl', help='Write alerts to this JSONL file')
+    ap.add_argument('--alert-aggregate', type=float, default=0.0,
+                    help='Fold repeated alerts (same src, dst, dp, proto, flag) within this many seconds into one record')
+    ap.add_argument('--alert-max-bytes', type=int, default=0, help='Rotate the alert file at this size (0 disables)')
+    ap.add_argument('--alert-backups', type=int, default=5, help='Rotated alert files to keep')
+    ap.add_argument('--alert-queue', type=int, default=100000, help='Alerts buffered for the writer thread')
+    ap.add_argument('--alert-block', type=float, default=0.5,
+                    help='Seconds to wait for room in a full alert queue before dropping alerts')
+    ap.add_argument('--batch-size', type=int, default=256, help='Flush a micro-batch once it holds this many flows')
+    ap.add_argument('--batch-delay', type=float, default=0.05, help='Flush a micro-batch once its oldest flow waited this many seconds')
+    ap.add_argument('--block-size', type=int, default=1 << 20, help='Bytes per eve.json read')
+    ap.add_argument('--poll-interval', type=float, default=0.05, help='Polling interval when inotify is unavailable')
+    ap.add_argument('--checkpoint', help='Save/resume the eve.json offset and window state at this path')
+    ap.add_argument('--checkpoint-interval', type=float, default=10.0, help='Seconds between checkpoints')
+    ap.add_argument('--catchup-batch-size', type=int, default=4096, help='Batch size while catching up after a resume')
+    ap.add_argument('--workers', type=int, default=1,
+                    help="Worker processes; flows are sharded by dest_ip, so the srv_* features only see "
+                         "each worker's destinations")
+    ap.add_argument('--stats-interval', type=float, default=10.0, help='Seconds between [stats] lines (0 disables)')
+    ap.add_argument('--pred-cache', type=int, default=0,
+                    help='Cache predictions of up to this many distinct feature rows (0 disables)')
+    ap.add_argument('--pred-cache-digits', type=int,
+                    help='Round numeric features to this many significant digits in the cache key')
+    ap.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics at http://127.0.0.1:<port>/metrics')
+    ap.add_argument('--feature-log', help='Append every scored flow (model features + ts + pred) to this JSONL file; '
+                                          'with --workers N each worker writes <path>.<i>')
     return ap.parse_args()
 
 
 def get_expected_columns(pipeline):
+    if isinstance(pipeline, CompiledModel):
+        return pipeline.columns
+    if hasattr(pipeline, 'first') and hasattr(pipeline, 'second'):
+        # app.models.cascade.CascadeModel: inputs of both stages
+        return list(dict.fromkeys(get_expected_columns(pipeline.first) + get_expected_columns(pipeline.second)))
     # Try to introspect the first ColumnTransformer in the pipeline
     expected = []
     try:
@@ -95,30 +154,184 @@ def get_expected_columns(pipeline):
         pass
     return list(dict.fromkeys(expected))
 
-def tail_f(path):
-    # Like `tail -F`: follow file as it grows; handle rotations by reopening
-    with open(path, 'r') as f:
-        f.seek(0, os.SEEK_END)
-        inode = os.fstat(f.fileno()).st_ino
-        while True:
-            line = f.readline()
-            if line:
-                yield line
-            else:
-                time.sleep(0.2)
-                try:
-                    if os.stat(path).st_ino != inode:
-                        # rotated
-                        f.close()
-                        f = open(path, 'r')
-                        inode = os.fstat(f.fileno()).st_ino
-                except FileNotFoundError:
-                    time.sleep(0.5)
+def extract_flow(rec):
+    """Per-flow features and alert metadata from one eve `flow` record."""
+    flow = rec.get('flow', {})
+    dp = rec.get('dest_port')
+    state = flow.get('state') or (rec.get('tcp', {}) or {}).get('state')
+
+    # timestamps
+    ts_str = rec.get('timestamp')
+    try:
+        ts = parse_ts(ts_str) if ts_str else time.time()
+    except Exception:
+        ts = time.time()
+
+    # Duration
+    # Suricata flow may include "start" and "end"/"age" or "duration"
+    start = flow.get('start')
+    end = flow.get('end')
+    age = flow.get('age')
+    if start and end:
+        try:
+            t0 = parse_ts(start)
+            t1 = parse_ts(end)
+            duration = max(0.0, t1 - t0)
+        except Exception:
+            duration = float(age) if age is not None else 0.0
+    else:
+        duration = float(age) if age is not None else 0.0
+
+    src, dst, sp = rec.get('src_ip'), rec.get('dest_ip'), rec.get('src_port')
+    return {
+        "ts": ts, "ts_str": ts_str,
+        "src": src, "dst": dst, "sp": sp, "dp": dp,
+        "protocol_type": proto_to_protocol_type(rec.get('proto')),
+        "service": port_to_service(dp) if dp is not None else 'other',
+        "flag": suri_state_to_flag(state),
+        "duration": duration,
+        # Bytes
+        "src_bytes": int(flow.get('bytes_toserver', 0)),
+        "dst_bytes": int(flow.get('bytes_toclient', 0)),
+        "land": 1 if src == dst and sp == dp else 0,
+    }
+
+DEFAULT_COLS = ['protocol_type','service','flag','duration','src_bytes','dst_bytes','count','srv_count']
+
+def build_row(ev, expected_cols):
+    # Build input row with expected columns; unknown columns get a benign default (numeric 0)
+    return {c: ev.get(c, 0) for c in expected_cols or DEFAULT_COLS}
+
+def predict_rows(pipeline, rows):
+    t0 = time.perf_counter()
+    if isinstance(pipeline, CompiledModel):
+        X, model = pipeline.transform(rows), pipeline.predict_matrix
+    elif hasattr(pipeline, 'steps') and len(pipeline.steps) > 1:
+        X, model = pipeline[:-1].transform(pd.DataFrame(rows)), pipeline.steps[-1][1].predict
+    else:
+        X, model = pd.DataFrame(rows), pipeline.predict
+    t1 = time.perf_counter()
+    preds = model(X)
+    STAGE_SECONDS.observe(t1 - t0, "preprocess")
+    STAGE_SECONDS.observe(time.perf_counter() - t1, "classify")
+    return preds
+
+def make_alert(ev):
+    return {
+        "ts": ev["ts_str"] or datetime.now(timezone.utc).isoformat(),
+        "src": ev["src"], "dst": ev["dst"], "sp": ev["sp"], "dp": ev["dp"],
+        "proto": ev["protocol_type"], "service": ev["service"], "flag": ev["flag"],
+        "duration": ev["duration"], "src_bytes": ev["src_bytes"], "dst_bytes": ev["dst_bytes"],
+        "count": ev["count"], "srv_count": ev["srv_count"],
+        "pred": "ATTACK"
+    }
+
+def parse_flow(raw, windows, expected_cols):
+    """One eve line -> (event, model row) with window features, or None if it is not a flow."""
+    timed = next(_parse_tick) % STAGE_SAMPLE == 0
+    if timed:
+        t0 = time.perf_counter()
+    try:
+        rec = json.loads(raw)
+    except Exception:
+        return None
+    # The reader already dropped non-flow lines; this guards against look-alikes
+    if rec.get('event_type') != 'flow':
+        return None
+    ev = extract_flow(rec)
+    if not timed:
+        # Windows are updated as events are parsed so counts stay per-event
+        windows.update(ev)
+        return ev, build_row(ev, expected_cols)
+    t1 = time.perf_counter()
+    windows.update(ev)
+    t2 = time.perf_counter()
+    row = build_row(ev, expected_cols)
+    t3 = time.perf_counter()
+    STAGE_SECONDS.observe(t1 - t0, "eve_parse")
+    STAGE_SECONDS.observe(t2 - t1, "window_update")
+    STAGE_SECONDS.observe(t3 - t2, "features")
+    return ev, row
+
+def log_features(rows, evs, preds, feature_fh):
+    """Feature rows for later (incremental) training; label them by adding a `target`/`label` field."""
+    feature_fh.write("".join(
+        json.dumps(dict(row, ts=ev["ts_str"], pred=int(pred))) + "\n" for row, ev, pred in zip(rows, evs, preds)))
+
+def open_pred_cache(args):
+    return PredictionCache(args.pred_cache, args.pred_cache_digits) if args.pred_cache > 0 else None
+
+def score_batch(pipeline, batch, feature_fh=None, cache=None):
+    """Score a micro-batch with one predict call; returns its alerts in event order."""
+    if not batch:
+        return []
+    evs, rows = zip(*batch)
+    try:
+        if cache is not None:
+            # only rows the cache has not seen reach the model (the model never reloads here)
+            preds = cache.lookup(rows, id(pipeline), lambda missing: predict_rows(pipeline, missing))
+        else:
+            preds = predict_rows(pipeline, list(rows))
+    except Exception as e:
+        # Model threw due to unknown columns? Report and drop this batch.
+        sys.stderr.write(f"[!] Prediction error ({len(batch)} flows dropped): {e}\n")
+        DROPPED.inc(len(batch))
+        time.sleep(0.2)
+        return []
+    EVENTS.inc(len(batch))
+    if feature_fh is not None:
+        log_features(rows, evs, preds, feature_fh)
+    return [make_alert(ev) for ev, pred in zip(evs, preds) if int(pred) == 1]
+
+def open_alert_sink(args, echo=True):
+    return AlertSink(args.alert_file, echo=echo, max_queue=args.alert_queue, block=args.alert_block,
+                     aggregate_window=args.alert_aggregate, max_bytes=args.alert_max_bytes,
+                     backups=args.alert_backups)
+
+def write_alerts(alerts, sink, echo=True):
+    """Hand alerts to the sink's writer thread (it batches, aggregates and prints them); returns how many it accepted."""
+    if not alerts:
+        return 0
+    # a full sink drops the overflow (counted in ids_alerts_dropped_total); only the rest is counted here
+    accepted = len(alerts) - sink.put(alerts, echo)
+    ALERTS.inc(accepted)
+    return accepted
+
+def flush_batch(pipeline, batch, sink, echo=True, feature_fh=None, cache=None):
+    return write_alerts(score_batch(pipeline, batch, feature_fh, cache), sink, echo)
+
+class _StopRequested:
+    """Signal handler that only sets a flag; the main loop stops between events.
+
+    Raising from the handler could interrupt a half-applied window update, which the
+    final checkpoint would then save. A second signal stops at once (no checkpoint).
+    """
+
+    def __init__(self):
+        self.requested = False
+
+    def __call__(self, signum, frame):
+        if self.requested:
+            raise KeyboardInterrupt
+        print(f"[i] {signal.Signals(signum).name} received, stopping after the current event", flush=True)
+        self.requested = True
 
 def main():
     args = parse_args()
+    if args.workers > 1 and args.checkpoint:
+        sys.exit("[!] --checkpoint is only supported with --workers 1")
+    if args.metrics_port and not args.print_cols:
+        serve_metrics(args.metrics_port)
+        print(f"[+] Metrics: http://127.0.0.1:{args.metrics_port}/metrics")
+    if args.workers > 1 and not args.print_cols:
+        from app.helpers.sharded import run
+        print(f"[+] Tail Suricata eve: {args.eve}")
+        run(args)
+        return
+
     print(f"[+] Loading model: {args.model}")
-    pipeline = joblib.load(args.model)
+    # mmap (copy-on-write): uncompressed artifacts share one physical copy with other processes
+    pipeline = joblib.load(args.model, mmap_mode='c')
 
     expected_cols = get_expected_columns(pipeline)
     if args.print_cols:
@@ -129,116 +342,108 @@ def main():
     print("[i] Start Suricata with: sudo suricata -i <iface> -l /var/log/suricata -D")
     print("[i] Press Ctrl+C to stop.")
 
-    # Sliding windows for count/srv_count
-    by_host = defaultdict(deque)         # dst_ip -> deque[timestamps]
-    by_host_srv = defaultdict(deque)     # (dst_ip, service) -> deque[timestamps]
+    # Sliding windows for count/srv_count and the other traffic features
+    windows = WindowState(args.window, args.host_window, args.idle_timeout, args.max_keys, args.max_events)
 
-    # Open alert output
-    alert_fh = open(args.alert_file, 'a', buffering=1)
+    # Resume from the last checkpoint (offset + window state) instead of the end of the file
+    ckpt = load_checkpoint(args.checkpoint, args.eve) if args.checkpoint else None
+    stop = _StopRequested()
+    if args.checkpoint:
+        # Ctrl+C/SIGTERM finish the current event so the final checkpoint sees consistent state
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+    if ckpt is not None:
+        windows.restore(ckpt["windows"])
+        print(f"[checkpoint] Resuming {args.eve} at offset {ckpt['offset']} "
+              f"(saved {time.time() - ckpt['saved_at']:.0f}s ago)")
 
-    for raw in tail_f(args.eve):
-        try:
-            rec = json.loads(raw)
-        except Exception:
-            continue
-        if rec.get('event_type') != 'flow':
-            continue
-
-        flow = rec.get('flow', {})
-        src = rec.get('src_ip')
-        dst = rec.get('dest_ip')
-        sp = rec.get('src_port')
-        dp = rec.get('dest_port')
-        proto = rec.get('proto')
-        state = flow.get('state') or (rec.get('tcp', {}) or {}).get('state')
-
-        # timestamps
-        ts_str = rec.get('timestamp')
-        try:
-            ts = datetime.fromisoformat(ts_str.replace('Z', '+00:00')).timestamp() if ts_str else time.time()
-        except Exception:
-            ts = time.time()
-
-        # Compute features
-        protocol_type = proto_to_protocol_type(proto)
-        service = port_to_service(dp) if dp is not None else 'other'
-        flag = suri_state_to_flag(state)
-
-        # Duration
-        # Suricata flow may include "start" and "end"/"age" or "duration"
-        start = flow.get('start')
-        end = flow.get('end')
-        age = flow.get('age')
-        if start and end:
-            try:
-                t0 = datetime.fromisoformat(start.replace('Z','+00:00')).timestamp()
-                t1 = datetime.fromisoformat(end.replace('Z','+00:00')).timestamp()
-                duration = max(0.0, t1 - t0)
-            except Exception:
-                duration = float(age) if age is not None else 0.0
-        else:
-            duration = float(age) if age is not None else 0.0
+    # Alert output: written, aggregated and rotated by a background thread
+    sink = open_alert_sink(args)
+    feature_fh = open(args.feature_log, 'a') if args.feature_log else None
+    cache = open_pred_cache(args)
 
-        # Bytes
-        src_bytes = int(flow.get('bytes_toserver', 0))
-        dst_bytes = int(flow.get('bytes_toclient', 0))
-
-        # Sliding-window counts
-        win = args.window
-        dq_h = by_host[dst]
-        dq_h.append(ts)
-        while dq_h and ts - dq_h[0] > win:
-            dq_h.popleft()
-        count = len(dq_h)
-
-        key_srv = (dst, service)
-        dq_hs = by_host_srv[key_srv]
-        dq_hs.append(ts)
-        while dq_hs and ts - dq_hs[0] > win:
-            dq_hs.popleft()
-        srv_count = len(dq_hs)
-
-        # Build input row with expected columns (fill defaults)
-        row = {}
-        for c in expected_cols or ['protocol_type','service','flag','duration','src_bytes','dst_bytes','count','srv_count']:
-            if c == 'protocol_type':
-                row[c] = protocol_type
-            elif c == 'service':
-                row[c] = service
-            elif c == 'flag':
-                row[c] = flag
-            elif c == 'duration':
-                row[c] = duration
-            elif c == 'src_bytes':
-                row[c] = src_bytes
-            elif c == 'dst_bytes':
-                row[c] = dst_bytes
-            elif c == 'count':
-                row[c] = count
-            elif c == 'srv_count':
-                row[c] = srv_count
-            else:
-                # Unknown column: put a benign default (numeric 0 / categorical 'other')
-                row[c] = 0
-
-        df = pd.DataFrame([row])
-        try:
-            pred = int(pipeline.predict(df)[0])
-            if pred == 1:
-                alert = {
-                    "ts": ts_str or datetime.now(timezone.utc).isoformat(),
-                    "src": src, "dst": dst, "sp": sp, "dp": dp,
-                    "proto": protocol_type, "service": service, "flag": flag,
-                    "duration": duration, "src_bytes": src_bytes, "dst_bytes": dst_bytes,
-                    "count": count, "srv_count": srv_count,
-                    "pred": "ATTACK"
-                }
-                print(f"[ALERT] {alert}")
-                alert_fh.write(json.dumps(alert) + "\n")
-        except Exception as e:
-            # Model threw due to unknown columns? Print once then continue.
-            sys.stderr.write(f"[!] Prediction error: {e}\n")
-            time.sleep(0.2)
+    # Catch-up: big batches and no per-alert printing until the reader reaches the live head
+    catching_up = ckpt is not None
+    batcher = MicroBatcher(args.catchup_batch_size if catching_up else args.batch_size, args.batch_delay)
+    tail = EveReader(args.eve, block_size=args.block_size, idle_timeout=min(0.2, max(args.batch_delay, 0.005)),
+                     poll_interval=args.poll_interval,
+                     offset=ckpt["offset"] if ckpt else None, inode=ckpt["inode"] if ckpt else None)
+    METRICS.gauge("ids_eve_lag_bytes", "Bytes of eve.json not read yet", fn=tail.lag_bytes)
+    METRICS.gauge("ids_window_keys", "Destinations/services tracked by the window tables",
+                  fn=lambda: windows.stats()["keys"])
+    n_alerts = 0
+    stats_at = ckpt_at = catchup_t0 = time.monotonic()
+    events_at_last = 0
+    catchup_bytes = None
+    seen = 0
+    clean = False
+
+    def checkpoint():
+        nonlocal n_alerts
+        # Only offsets whose flows were scored and whose alerts are on disk are recorded
+        n_alerts += flush_batch(pipeline, batcher.drain(), sink, echo=not catching_up,
+                                feature_fh=feature_fh, cache=cache)
+        sink.flush()
+        save_checkpoint(args.checkpoint, args.eve, tail.inode, tail.offset, windows)
+
+    try:
+        for raw in tail:
+            if catching_up and catchup_bytes is None:
+                catchup_bytes = (tail.offset, tail.offset + tail.lag_bytes())
+            item = None
+            if raw is not None:
+                seen += 1
+                item = parse_flow(raw, windows, expected_cols)
+            if item is not None and batcher.add(item):
+                n_alerts += flush_batch(pipeline, batcher.drain(), sink, echo=not catching_up,
+                                        feature_fh=feature_fh, cache=cache)
+            if catching_up and raw is None:
+                n_alerts += flush_batch(pipeline, batcher.drain(), sink, echo=False, feature_fh=feature_fh, cache=cache)
+                dt = time.monotonic() - catchup_t0
+                n = batcher.events
+                print(f"[catchup] Reached live head: {n} flows, {catchup_bytes[1] - catchup_bytes[0]} bytes "
+                      f"in {dt:.1f}s ({n / max(dt, 1e-9):.0f} flows/s)", flush=True)
+                catching_up = False
+                batcher.max_size = max(1, args.batch_size)
+            if not catching_up and batcher.due():
+                n_alerts += flush_batch(pipeline, batcher.drain(), sink, feature_fh=feature_fh, cache=cache)
+
+            if args.stats_interval > 0 and (raw is None or seen % 1024 == 0):
+                now = time.monotonic()
+                if now - stats_at >= args.stats_interval:
+                    st = batcher.stats()
+                    rate = (st["events"] - events_at_last) / (now - stats_at)
+                    if catching_up:
+                        start, end = catchup_bytes
+                        done = (tail.offset - start) / max(end - start, 1)
+                        print(f"[catchup] {min(done, 1.0) * 100:.1f}% events={st['events']} "
+                              f"lag_bytes={tail.lag_bytes()} flows/s={rate:.0f}", flush=True)
+                    else:
+                        print(f"[stats] events={st['events']} batches={st['batches']} avg_batch={st['avg_batch']} "
+                              f"max_batch={st['max_batch']} alerts={n_alerts} alerts_dropped={sink.dropped} "
+                              f"lag_bytes={tail.lag_bytes()} flows/s={rate:.0f} "
+                              f"window_keys={windows.stats()['keys']}"
+                              + (f" cache_hit_rate={cache.stats()['hit_rate']}" if cache else ""), flush=True)
+                    stats_at = now
+                    events_at_last = st["events"]
+
+            if args.checkpoint and (raw is None or seen % 1024 == 0) and time.monotonic() - ckpt_at >= args.checkpoint_interval:
+                checkpoint()
+                ckpt_at = time.monotonic()
+            # the reader yields None at least every idle_timeout, so this is reached while idle too
+            if stop.requested:
+                break
+        clean = True
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # an exception may have left a window update half-applied: keep the last periodic checkpoint
+        if args.checkpoint and tail.inode is not None and clean:
+            checkpoint()
+            print(f"[checkpoint] Saved {args.checkpoint} at offset {tail.offset}")
+        sink.close()
+        if feature_fh is not None:
+            feature_fh.close()
 
 if __name__ == "__main__":
     main()
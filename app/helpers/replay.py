@@ -0,0 +1,260 @@
+"""
+Replay eve.json traffic into a file and benchmark the live tailer against it.
+
+    # synthetic flows built from the NSL-KDD test split, 5k events/s, rotate every 50k
+    python -m app.helpers.replay write --out /tmp/eve.json --rate 5000 --count 200000 --rotate-every 50000
+
+    # start ids_suricata on a scratch eve.json, replay as fast as possible and report
+    # sustained flows/s, write->alert latency percentiles and RSS growth
+    python -m app.helpers.replay bench --model models/best_dt.joblib --count 100000 -- --workers 2
+
+Every replayed event is stamped with its write time, so an alert's `ts` tells when the
+flow that caused it was written.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from app.helpers.eve_reader import EveReader, parse_ts
+from app.helpers.ids_suricata import PORT_SERVICE
+from app.utils.io import ensure_dir, save_json
+
+REPORTS = Path("reports/bench")
+
+# first port of every NSL-KDD service we know a port for
+SERVICE_PORT = {}
+for _port, _svc in sorted(PORT_SERVICE.items()):
+    SERVICE_PORT.setdefault(_svc, _port)
+# flow states that suri_state_to_flag maps back onto the KDD flag
+FLAG_STATE = {"SF": "closed", "S0": "syn_sent", "REJ": "rst"}
+
+STATS_EVENTS = re.compile(r"^\[(?:stats|catchup)\].*?\bevents=(\d+)")
+
+
+def now_ts() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f") + "+0000"
+
+
+def synthetic_events(split: str = "KDDTest+", hosts: int = 256, seed: int = 42):
+    """Endless eve `flow` records shaped after the NSL-KDD rows (protocol, service, flag, bytes)."""
+    from app.data.make_dataset import load_raw
+
+    df = load_raw(split)[["duration", "protocol_type", "service", "flag", "src_bytes", "dst_bytes"]]
+    rows = df.astype({"protocol_type": str, "service": str, "flag": str}).to_dict("records")
+    rng = random.Random(seed)
+    flow_id = 0
+    while True:
+        for r in rows:
+            flow_id += 1
+            dp = SERVICE_PORT.get(r["service"], 1024 + zlib.crc32(r["service"].encode()) % 60000)
+            host = rng.randrange(hosts)
+            yield {
+                "flow_id": flow_id,
+                "event_type": "flow",
+                "src_ip": f"10.{rng.randrange(4)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+                "src_port": rng.randrange(1024, 65535),
+                "dest_ip": f"192.168.{host // 256}.{host % 256}",
+                "dest_port": dp,
+                "proto": r["protocol_type"].upper(),
+                "flow": {
+                    "bytes_toserver": int(r["src_bytes"]),
+                    "bytes_toclient": int(r["dst_bytes"]),
+                    "age": int(r["duration"]),
+                    "state": FLAG_STATE.get(r["flag"], "new"),
+                },
+            }
+
+
+def recorded_events(path):
+    """Records of an existing eve.json (optionally .gz), looped forever."""
+    opener = gzip.open if str(path).endswith(".gz") else open
+    while True:
+        with opener(path, "rt") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def replay(events, out, rate: float = 0.0, count: int = 100_000, rotate_every: int = 0, chunk: int = 1000) -> dict:
+    """Append `count` events to `out` at `rate` events/s (0 = as fast as possible), restamping each one."""
+    out = Path(out)
+    # rate-limited writes go out in ~1 ms slices; unlimited ones in `chunk`-line blocks
+    step = max(1, int(rate / 1000)) if rate > 0 else chunk
+    f = open(out, "a")
+    t0 = time.monotonic()
+    written = flows = rotations = 0
+    try:
+        while written < count:
+            n = min(step, count - written)
+            ts = now_ts()
+            lines = []
+            for _ in range(n):
+                ev = next(events)
+                ev["timestamp"] = ts
+                if ev.get("event_type") == "flow":
+                    flows += 1
+                    if isinstance(ev.get("flow"), dict):
+                        ev["flow"]["start"] = ev["flow"]["end"] = ts
+                lines.append(json.dumps(ev, separators=(",", ":")))
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            written += n
+            if rotate_every and written % rotate_every < n:
+                f.close()
+                os.replace(out, out.with_name(out.name + ".1"))
+                f = open(out, "a")
+                rotations += 1
+            if rate > 0:
+                delay = t0 + written / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+    finally:
+        f.close()
+    elapsed = time.monotonic() - t0
+    return {"events": written, "flows": flows, "rotations": rotations, "seconds": round(elapsed, 3),
+            "events_per_s": round(written / max(elapsed, 1e-9), 1)}
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def bench(args, tailer_args) -> dict:
+    work = Path(tempfile.mkdtemp(prefix="ids_replay_"))
+    eve, alerts = work / "eve.json", work / "alerts.jsonl"
+    eve.touch()
+    alerts.touch()
+    cmd = [sys.executable, "-m", "app.helpers.ids_suricata", "--model", args.model, "--eve", str(eve),
+           "--alert-file", str(alerts), "--stats-interval", "0.5", *tailer_args]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+    state = {"events": 0, "ready": False}
+
+    def read_stdout():
+        for line in proc.stdout:
+            if line.startswith("[i] Press Ctrl+C") or line.startswith("[+] Started"):
+                state["ready"] = True
+            m = STATS_EVENTS.match(line)
+            if m:
+                state["events"] = int(m.group(1))
+
+    latencies = []
+    stop = threading.Event()
+
+    def read_alerts():
+        for line in EveReader(str(alerts), event_type=None, idle_timeout=0.05, offset=0):
+            if stop.is_set():
+                break
+            if line:
+                seen = time.time()
+                try:
+                    latencies.append(seen - parse_ts(json.loads(line)["ts"]))
+                except (ValueError, KeyError):
+                    pass
+
+    threading.Thread(target=read_stdout, daemon=True).start()
+    threading.Thread(target=read_alerts, daemon=True).start()
+    deadline = time.monotonic() + 120
+    while not state["ready"] and proc.poll() is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.5)
+    rss_start = _rss_kb(proc.pid)
+    rss_peak = rss_start or 0
+
+    events = synthetic_events(hosts=args.hosts) if args.source == "synthetic" else recorded_events(args.source)
+    t0 = time.monotonic()
+    written = {}
+    writer = threading.Thread(target=lambda: written.update(
+        replay(events, eve, args.rate, args.count, args.rotate_every)))
+    writer.start()
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline and proc.poll() is None:
+        rss_peak = max(rss_peak, _rss_kb(proc.pid) or 0)
+        if not writer.is_alive() and state["events"] >= written.get("flows", 0):
+            break
+        time.sleep(0.1)
+    elapsed = time.monotonic() - t0
+    writer.join()
+    rss_end = _rss_kb(proc.pid)
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+    stop.set()
+
+    lat = np.asarray(latencies) * 1000.0
+    report = {
+        "model": args.model,
+        "tailer_args": tailer_args,
+        "writer": written,
+        "flows_processed": state["events"],
+        "seconds": round(elapsed, 3),
+        "sustained_flows_per_s": round(state["events"] / max(elapsed, 1e-9), 1),
+        "alerts": int(lat.size),
+        "latency_ms": {f"p{q}": round(float(np.percentile(lat, q)), 2) for q in (50, 90, 99)} if lat.size else {},
+        "rss_kb": {"start": rss_start, "peak": rss_peak, "end": rss_end,
+                   "growth": (rss_end - rss_start) if rss_start and rss_end else None},
+    }
+    return report
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for name in ("write", "bench"):
+        p = sub.add_parser(name)
+        p.add_argument("--source", default="synthetic", help="'synthetic' (from KDDTest+) or a recorded eve.json[.gz]")
+        p.add_argument("--rate", type=float, default=0.0, help="Events per second (0 = as fast as possible)")
+        p.add_argument("--count", type=int, default=100_000, help="Events to write")
+        p.add_argument("--rotate-every", type=int, default=0, help="Rotate the output every N events (0 = never)")
+        p.add_argument("--hosts", type=int, default=256, help="Distinct destination hosts in synthetic traffic")
+    sub.choices["write"].add_argument("--out", required=True, help="eve.json to append to")
+    b = sub.choices["bench"]
+    b.add_argument("--model", default="models/best_dt.joblib")
+    b.add_argument("--timeout", type=float, default=300.0, help="Give up waiting for the tailer after this many seconds")
+    b.add_argument("--report", help=f"Write the JSON report here (default: {REPORTS}/replay_<time>.json)")
+    argv = sys.argv[1:] if argv is None else argv
+    extra = []
+    if "--" in argv:
+        i = argv.index("--")
+        argv, extra = argv[:i], argv[i + 1:]
+    return ap.parse_args(argv), extra
+
+
+def main():
+    args, extra = parse_args()
+    if args.cmd == "write":
+        events = synthetic_events(hosts=args.hosts) if args.source == "synthetic" else recorded_events(args.source)
+        print(replay(events, args.out, args.rate, args.count, args.rotate_every))
+        return
+    report = bench(args, extra)
+    out = Path(args.report) if args.report else ensure_dir(REPORTS) / f"replay_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    save_json(report, out)
+    print(json.dumps(report, indent=2))
+    print("Saved:", out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Multi-process mode of the Suricata tailer (--workers N).
+
+The parent reads eve.json and routes each flow line to a worker by a stable hash of
+its dest_ip, so every worker owns the window state of its destinations and needs no
+locking. Workers parse, compute features, score in micro-batches and send alerts back;
+a writer thread in the parent merges them into the single alert file.
+
+Service-keyed features (window_state.SERVICE_FEATURES: srv_count, srv_serror_rate,
+srv_rerror_rate, srv_diff_host_rate, dst_host_srv_diff_host_rate) only see the flows of
+the worker's own destinations: srv_count drops to roughly 1/N of its single-process value
+and the rates are taken over that share, so predictions can differ from --workers 1.
+A warning is printed at startup; use --workers 1 where exact features matter.
+"""
+import multiprocessing as mp
+import queue
+import re
+import sys
+import threading
+import time
+import zlib
+
+DEST_IP = re.compile(rb'"dest_ip":\s*"([^"]*)"')
+
+# lines per message sent to a worker (amortizes queue/pickle overhead)
+ROUTE_CHUNK = 512
+# seconds a put into a full worker queue waits before checking the worker is still alive
+PUT_TIMEOUT = 1.0
+
+
+class WorkerDied(RuntimeError):
+    def __init__(self, idx, exitcode):
+        super().__init__(f"worker {idx} exited with code {exitcode}")
+        self.idx = idx
+        self.exitcode = exitcode
+
+
+def _check_workers(workers):
+    for i, w in enumerate(workers):
+        if not w.is_alive():
+            raise WorkerDied(i, w.exitcode)
+
+
+def _put(q, item, worker, idx):
+    """Blocking put that gives up when the worker on the other end is gone."""
+    while True:
+        try:
+            q.put(item, timeout=PUT_TIMEOUT)
+            return
+        except queue.Full:
+            if not worker.is_alive():
+                raise WorkerDied(idx, worker.exitcode)
+
+
+def shard_of(line, n_workers: int) -> int:
+    m = DEST_IP.search(line)
+    return zlib.crc32(m.group(1)) % n_workers if m else 0
+
+
+def _worker(idx, args, in_q, out_q):
+    import joblib
+
+    from app.features.window_state import WindowState
+    from app.helpers.batching import MicroBatcher
+    from app.helpers.ids_suricata import get_expected_columns, open_pred_cache, parse_flow, score_batch
+    from app.utils.metrics import METRICS
+
+    # every worker maps the same file: one physical copy of the model arrays
+    pipeline = joblib.load(args.model, mmap_mode="c")
+    expected_cols = get_expected_columns(pipeline)
+    windows = WindowState(args.window, args.host_window, args.idle_timeout, args.max_keys, args.max_events)
+    batcher = MicroBatcher(args.batch_size, args.batch_delay)
+    feature_fh = open(f"{args.feature_log}.{idx}", "a") if getattr(args, "feature_log", None) else None
+    cache = open_pred_cache(args)
+    timeout = max(args.batch_delay, 0.005)
+    stats_at = time.monotonic()
+    n_alerts = 0
+
+    def flush():
+        nonlocal n_alerts
+        alerts = score_batch(pipeline, batcher.drain(), feature_fh, cache)
+        if alerts:
+            n_alerts += len(alerts)
+            out_q.put(("alerts", idx, alerts))
+
+    while True:
+        try:
+            lines = in_q.get(timeout=timeout)
+        except queue.Empty:
+            lines = ()
+        if lines is None:
+            break
+        for raw in lines:
+            item = parse_flow(raw, windows, expected_cols)
+            if item is not None and batcher.add(item):
+                flush()
+        if batcher.due():
+            flush()
+        now = time.monotonic()
+        if now - stats_at >= 1.0:
+            out_q.put(("stats", idx, dict(batcher.stats(), alerts=n_alerts, window_keys=windows.stats()["keys"],
+                                          metrics=METRICS.snapshot())))
+            stats_at = now
+    flush()
+    if feature_fh is not None:
+        feature_fh.close()
+    out_q.put(("stats", idx, dict(batcher.stats(), alerts=n_alerts, window_keys=windows.stats()["keys"],
+                                  metrics=METRICS.snapshot())))
+    out_q.put(("done", idx, None))
+
+
+def _writer(out_q, sink, stats, workers):
+    from app.helpers.ids_suricata import write_alerts
+    from app.utils.metrics import METRICS
+
+    done = set()
+    while len(done) < len(workers):
+        try:
+            kind, idx, payload = out_q.get(timeout=0.5)
+        except queue.Empty:
+            # a worker that died never sends "done"; whatever it sent before is drained by now
+            done.update(i for i, w in enumerate(workers) if not w.is_alive() and w.exitcode != 0)
+            continue
+        if kind == "alerts":
+            write_alerts(payload, sink)
+        elif kind == "stats":
+            # worker counters/histograms show up in the parent's /metrics
+            METRICS.merge(("worker", idx), payload.pop("metrics", {}))
+            stats[idx] = payload
+        elif kind == "done":
+            done.add(idx)
+
+
+def run(args):
+    from app.features.window_state import SERVICE_FEATURES
+    from app.helpers.eve_reader import EveReader
+    from app.helpers.ids_suricata import open_alert_sink
+    from app.utils.metrics import METRICS
+
+    n = args.workers
+    ctx = mp.get_context()
+    # Bounded queues: a slow worker back-pressures the reader instead of growing memory
+    in_qs = [ctx.Queue(maxsize=64) for _ in range(n)]
+    out_q = ctx.Queue()
+    workers = [ctx.Process(target=_worker, args=(i, args, in_qs[i], out_q), daemon=True) for i in range(n)]
+    for w in workers:
+        w.start()
+    print(f"[+] Started {n} workers (sharded by dest_ip)")
+    print(f"[!] With --workers {n} the service-keyed features ({', '.join(SERVICE_FEATURES)}) only count "
+          f"each worker's destinations (srv_count ~1/{n} of a single-process run); predictions may differ "
+          f"from --workers 1", file=sys.stderr, flush=True)
+
+    sink = open_alert_sink(args)
+    stats = {}
+    writer = threading.Thread(target=_writer, args=(out_q, sink, stats, workers), daemon=True)
+    writer.start()
+
+    tail = EveReader(args.eve, block_size=args.block_size, idle_timeout=min(0.2, max(args.batch_delay, 0.005)),
+                     poll_interval=args.poll_interval)
+    METRICS.gauge("ids_eve_lag_bytes", "Bytes of eve.json not read yet", fn=tail.lag_bytes)
+    METRICS.gauge("ids_window_keys", "Destinations/services tracked by the window tables",
+                  fn=lambda: {str(i): s["window_keys"] for i, s in list(stats.items())}, label="worker")
+    pending = [[] for _ in range(n)]
+    routed = 0
+    stats_at = time.monotonic()
+    events_at_last = 0
+    died = None
+    try:
+        for raw in tail:
+            if raw is not None:
+                k = shard_of(raw, n)
+                pending[k].append(raw)
+                routed += 1
+                if len(pending[k]) >= ROUTE_CHUNK:
+                    _put(in_qs[k], pending[k], workers[k], k)
+                    pending[k] = []
+            else:
+                # idle: hand partial chunks over so workers can flush on age
+                _check_workers(workers)
+                for k in range(n):
+                    if pending[k]:
+                        _put(in_qs[k], pending[k], workers[k], k)
+                        pending[k] = []
+            if args.stats_interval > 0 and (raw is None or routed % 4096 == 0):
+                now = time.monotonic()
+                if now - stats_at >= args.stats_interval:
+                    snap = [stats[i] for i in sorted(stats)]
+                    events = sum(s["events"] for s in snap)
+                    rate = (events - events_at_last) / (now - stats_at)
+                    per_worker = " ".join(str(s["events"]) for s in snap)
+                    print(f"[stats] routed={routed} events={events} alerts={sum(s['alerts'] for s in snap)} "
+                          f"alerts_dropped={sink.dropped} lag_bytes={tail.lag_bytes()} flows/s={rate:.0f} "
+                          f"window_keys={sum(s['window_keys'] for s in snap)} per_worker=[{per_worker}]", flush=True)
+                    stats_at, events_at_last = now, events
+    except KeyboardInterrupt:
+        pass
+    except WorkerDied as e:
+        died = e
+        print(f"[!] {e}; shutting down", file=sys.stderr, flush=True)
+    finally:
+        if died is None:
+            # graceful: hand over what is pending and let every worker drain its queue
+            for k in range(n):
+                try:
+                    if pending[k]:
+                        _put(in_qs[k], pending[k], workers[k], k)
+                    _put(in_qs[k], None, workers[k], k)
+                except WorkerDied:
+                    pass
+            for w in workers:
+                w.join(timeout=10)
+        for k, w in enumerate(workers):
+            if w.is_alive():
+                w.terminate()
+                w.join(timeout=5)
+            # lines still buffered for a dead worker must not block interpreter exit
+            in_qs[k].cancel_join_thread()
+        writer.join(timeout=5)
+        sink.close()
+        sys.stdout.flush()
+    if died is not None:
+        # killed by a signal: exitcode is -signum, report it shell-style
+        code = died.exitcode
+        sys.exit(code if code and code > 0 else 128 - code if code else 1)
@@ -0,0 +1,178 @@
+"""
+Serving artifacts: small, memory-mappable exports of the trained models.
+
+joblib stores numpy arrays of an uncompressed dump as raw buffers, so the file can be
+loaded with `joblib.load(path, mmap_mode="c")`: the arrays become copy-on-write views
+of the page cache, every process that maps the file shares one physical copy (nothing
+writes to model arrays) and a load costs page-table setup instead of deserialization. The registry and the Suricata
+tailer load models this way.
+
+`export` makes the artifact mmap-friendly and as small as exact predictions allow:
+- the pipeline is compiled (app.models.compiled) when supported, so the large state is
+  a handful of plain arrays (support vectors, dual weights, tree arrays, landmarks),
+- float64 arrays are stored as float32, except where that changes predictions: the
+  preprocessing scale/shift of every kind (a float32 rounding of a scaled feature moves
+  rows across tree thresholds), tree thresholds (sklearn compares float32 inputs against
+  float64 thresholds), the SVC support vectors/dual weights (the ||x||^2 + ||sv||^2 -
+  2 x.sv kernel expansion cancels badly on NSL-KDD's huge byte counts) and the ksvm
+  landmarks/weights (the folded Nystroem normalization is ill-conditioned),
+- training-only estimator attributes are dropped from pipelines that can't be compiled.
+
+An SVC keeps nearly all of its state in float64, so its artifact is about the size of
+the source model (slightly larger); the report says so, and the gain is the mmap load.
+
+    python -m app.models.artifacts --model models/best_svm.joblib --check data/interim/test_multiclass
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+from joblib import load
+
+from app.data.cache import table_exists
+from app.models.compiled import CompiledModel, compile_pipeline
+from app.utils.io import atomic_dump, save_json
+
+REPORTS = Path("reports/artifacts")
+# arrays that must keep full precision to reproduce the source model: the preprocessing
+# arrays for every kind (a few KB), plus per compiled kind
+KEEP_FLOAT64_ALL = {"scale", "shift"}
+KEEP_FLOAT64 = {"dt": {"threshold"}, "svm": {"support_vectors", "sv_sq", "weights", "intercept"},
+                "ksvm": {"components", "comp_sq", "weights"}}
+# compared against when --check is not given
+DEFAULT_CHECKS = [Path("data/interim/test_multiclass"), Path("data/interim/test_binary")]
+# attributes only needed to keep training (SGD averaging state, solver diagnostics)
+TRAINING_ONLY = {"_standard_coef", "_standard_intercept", "_average_coef", "_average_intercept",
+                 "n_iter_", "t_", "loss_curve_", "best_loss_", "validation_scores_"}
+
+
+def artifact_path(model_path) -> Path:
+    p = Path(model_path)
+    return p.with_name(p.stem + ".artifact.joblib")
+
+
+def to_float32(compiled: CompiledModel) -> CompiledModel:
+    keep = KEEP_FLOAT64_ALL | KEEP_FLOAT64.get(compiled.kind, set())
+    for name, value in vars(compiled).items():
+        if isinstance(value, np.ndarray) and value.dtype == np.float64 and name not in keep:
+            setattr(compiled, name, np.ascontiguousarray(value, dtype=np.float32))
+    return compiled
+
+
+def strip_training_state(estimator):
+    """Drop TRAINING_ONLY attributes from every step of a (nested) Pipeline/ColumnTransformer."""
+    for step in _estimators(estimator):
+        for attr in TRAINING_ONLY & set(vars(step)):
+            delattr(step, attr)
+    return estimator
+
+
+def _estimators(est):
+    yield est
+    for _, sub in getattr(est, "steps", []):
+        yield from _estimators(sub)
+    for _, sub, _ in getattr(est, "transformers_", []):
+        if hasattr(sub, "get_params"):
+            yield from _estimators(sub)
+    for attr in ("estimator", "base_estimator"):
+        sub = getattr(est, attr, None)
+        if hasattr(sub, "get_params") and hasattr(sub, "__dict__"):
+            yield from _estimators(sub)
+    for cc in getattr(est, "calibrated_classifiers_", []):
+        yield from _estimators(cc.estimator)
+
+
+def timed_load(path, mmap_mode=None):
+    t0 = time.perf_counter()
+    obj = load(path, mmap_mode=mmap_mode)
+    return obj, (time.perf_counter() - t0) * 1000.0
+
+
+def _export_model(model, float32, compile_model):
+    if hasattr(model, "first") and hasattr(model, "second"):
+        # app.models.cascade.CascadeModel: export each stage
+        model.first = _export_model(model.first, float32, compile_model)
+        model.second = _export_model(model.second, float32, compile_model)
+        return model
+    exported = None
+    if compile_model:
+        try:
+            exported = compile_pipeline(model)
+        except ValueError as e:
+            print(f"[artifacts] Not compilable ({e}); exporting the pipeline itself")
+    if exported is not None and float32:
+        to_float32(exported)
+    if exported is None:
+        exported = strip_training_state(model)
+    return exported
+
+
+def export(model_path, out=None, float32: bool = True, compile_model: bool = True):
+    """Write the serving artifact for `model_path`; returns (artifact path, exported model)."""
+    exported = _export_model(load(model_path), float32, compile_model)
+    out = Path(out) if out else artifact_path(model_path)
+    # compress=0: arrays must be stored raw to be memory-mappable
+    atomic_dump(exported, out, compress=0)
+    return out, exported
+
+
+def report(model_path, out, check=None) -> dict:
+    src, src_ms = timed_load(model_path)
+    _, src_mmap_ms = timed_load(model_path, mmap_mode="c")
+    art, art_ms = timed_load(out)
+    art_mmap, art_mmap_ms = timed_load(out, mmap_mode="c")
+    res = {
+        "model": str(model_path),
+        "artifact": str(out),
+        "kind": getattr(art, "kind", type(art).__name__),
+        "size_bytes": {"model": Path(model_path).stat().st_size, "artifact": Path(out).stat().st_size},
+        "load_ms": {"model": round(src_ms, 2), "model_mmap": round(src_mmap_ms, 2),
+                    "artifact": round(art_ms, 2), "artifact_mmap": round(art_mmap_ms, 2)},
+    }
+    if check:
+        from app.data.cache import load_interim
+
+        df = load_interim(check).drop(columns=["target"], errors="ignore")
+        ref = np.asarray(src.predict(df))
+        pred = np.asarray(art_mmap.predict(df))
+        res["check"] = {"rows": len(df), "agreement": float(np.mean(ref == pred))}
+        if hasattr(src, "predict_proba") and hasattr(art_mmap, "predict_proba"):
+            res["check"]["max_proba_diff"] = float(np.abs(src.predict_proba(df) - art_mmap.predict_proba(df)).max())
+    return res
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", required=True, help="Saved sklearn Pipeline (joblib)")
+    ap.add_argument("--out", help="Output path (default: <model>.artifact.joblib)")
+    ap.add_argument("--float64", action="store_true", help="Keep float64 arrays")
+    ap.add_argument("--no-compile", action="store_true", help="Export the sklearn pipeline instead of the compiled engine")
+    ap.add_argument("--check", help="Interim dataset to compare artifact predictions against the source model "
+                                    "(default: the first of data/interim/test_{multiclass,binary} that exists)")
+    args = ap.parse_args()
+
+    check = args.check or next((str(p) for p in DEFAULT_CHECKS if table_exists(p)), None)
+    out, _ = export(args.model, args.out, float32=not args.float64, compile_model=not args.no_compile)
+    res = report(args.model, out, check)
+    sizes, times = res["size_bytes"], res["load_ms"]
+    change = sizes["artifact"] / sizes["model"] - 1.0
+    print(f"Saved {res['kind']} artifact: {out}")
+    print(f"  size  {sizes['model'] / 1e6:.2f} MB -> {sizes['artifact'] / 1e6:.2f} MB ({change:+.1%})")
+    if change >= 0:
+        print(f"[!] The artifact is not smaller than {args.model}; its gain is the mmap load only")
+    print(f"  load  {times['model']:.1f} ms -> {times['artifact']:.1f} ms ({times['artifact_mmap']:.1f} ms mmap)")
+    if "check" in res:
+        print("  check", res["check"])
+        if res["check"]["agreement"] < 1.0:
+            print(f"[!] Artifact disagrees with {args.model} on {1 - res['check']['agreement']:.4%} of rows; "
+                  "consider --float64")
+    else:
+        print("[!] No interim test set found; agreement with the source model was not checked (pass --check)")
+    dest = REPORTS / f"{Path(out).stem}.json"
+    save_json(res, dest)
+    print("Saved report:", dest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Cascaded DT -> SVM inference.
+
+The decision tree scores every flow; only flows whose leaf confidence (the largest class
+probability of their leaf) is below `threshold` are escalated to the SVM. Confident
+flows cost a tree walk, uncertain ones get the SVM's answer.
+
+The report scores the test set with both models once and, for each threshold, computes
+the accuracy/F1 of the cascade, the fraction of rows escalated and the estimated cost
+per row, so a threshold can be picked that keeps SVM quality at close to tree cost:
+
+    python -m app.models.cascade --task multiclass
+    python -m app.models.cascade --task multiclass --threshold 0.9 --out models/best_cascade.joblib
+
+The saved CascadeModel is served like any other model (IDS_MODEL_PATH / --model);
+app.models.artifacts exports it with both stages compiled.
+"""
+import argparse
+
+import numpy as np
+from joblib import load
+from matplotlib.figure import Figure
+from sklearn.metrics import accuracy_score, f1_score
+
+from app.data.cache import iter_chunks
+from app.models.evaluate import CHUNK_ROWS, INTERIM, MODELS, REPORTS, score_chunks
+from app.utils.io import atomic_dump, ensure_dir, save_json
+from app.utils.metrics import METRICS
+
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0]
+ROWS = METRICS.counter("ids_cascade_rows_total", "Rows scored by the cascade model")
+ESCALATED = METRICS.counter("ids_cascade_escalated_total", "Rows the cascade escalated to the second model")
+
+
+def _take(X, mask):
+    if hasattr(X, "iloc"):
+        return X.iloc[np.flatnonzero(mask)]
+    return [x for x, m in zip(X, mask) if m]
+
+
+class CascadeModel:
+    def __init__(self, first, second, threshold: float):
+        if not np.array_equal(np.asarray(first.classes_), np.asarray(second.classes_)):
+            raise ValueError("Both stages must be trained on the same classes")
+        self.first = first
+        self.second = second
+        self.threshold = threshold
+        self.classes_ = np.asarray(first.classes_)
+
+    def predict_with_proba(self, X):
+        proba = np.array(self.first.predict_proba(X), dtype=np.float64)
+        pred = self.classes_[np.argmax(proba, axis=1)]
+        escalate = proba.max(axis=1) < self.threshold
+        if escalate.any():
+            sub = _take(X, escalate)
+            if hasattr(self.second, "predict_with_proba"):
+                pred2, proba2 = self.second.predict_with_proba(sub)
+            else:
+                pred2 = self.second.predict(sub)
+                proba2 = self.second.predict_proba(sub) if hasattr(self.second, "predict_proba") else None
+            pred[escalate] = pred2
+            if proba2 is not None:
+                proba[escalate] = proba2
+        ROWS.inc(len(pred))
+        ESCALATED.inc(int(escalate.sum()))
+        return pred, proba
+
+    def predict(self, X):
+        return self.predict_with_proba(X)[0]
+
+    def predict_proba(self, X):
+        return self.predict_with_proba(X)[1]
+
+
+def threshold_report(task, first="dt", second="svm", thresholds=THRESHOLDS, source=None, chunk_size=CHUNK_ROWS):
+    """Accuracy/F1, escalated fraction and estimated cost per row of the cascade at each threshold."""
+    source = source or INTERIM / f"test_{task}"
+    y, pred1, proba1, is_proba, rows, sec1 = score_chunks(load(MODELS / f"best_{first}.joblib"),
+                                                          iter_chunks(source, chunk_size))
+    _, pred2, _, _, _, sec2 = score_chunks(load(MODELS / f"best_{second}.joblib"), iter_chunks(source, chunk_size))
+    if proba1 is None or not is_proba:
+        raise ValueError(f"{first} has no predict_proba; it can't be the first stage")
+    conf = proba1.max(axis=1)
+    us1, us2 = sec1 / rows * 1e6, sec2 / rows * 1e6
+
+    def point(pred, escalated, us):
+        return {"accuracy": float(accuracy_score(y, pred)),
+                "f1_macro": float(f1_score(y, pred, average="macro", zero_division=0)),
+                "escalated": round(float(escalated), 4),
+                "us_per_row": round(us, 2)}
+
+    res = {"task": task, "rows": int(rows), "first": first, "second": second,
+           first: point(pred1, 0.0, us1), second: point(pred2, 1.0, us2), "thresholds": {}}
+    for t in thresholds:
+        esc = conf < t
+        # the second stage only sees escalated rows, so its cost scales with their fraction
+        res["thresholds"][str(t)] = point(np.where(esc, pred2, pred1), esc.mean(), us1 + esc.mean() * us2)
+    return res
+
+
+def pick_threshold(res, tolerance=0.002):
+    """Lowest-cost threshold whose accuracy is within `tolerance` of the second model's."""
+    target = res[res["second"]]["accuracy"] - tolerance
+    ok = [(p["us_per_row"], float(t)) for t, p in res["thresholds"].items() if p["accuracy"] >= target]
+    return min(ok)[1] if ok else None
+
+
+def plot_report(res, outpath):
+    fig = Figure(figsize=(5, 4))
+    ax = fig.subplots()
+    pts = sorted(res["thresholds"].items(), key=lambda kv: kv[1]["escalated"])
+    ax.plot([p["escalated"] for _, p in pts], [p["accuracy"] for _, p in pts], marker="o", label="cascade")
+    for t, p in pts:
+        ax.annotate(t, (p["escalated"], p["accuracy"]), fontsize=7, xytext=(3, -8), textcoords="offset points")
+    for name in (res["first"], res["second"]):
+        ax.axhline(res[name]["accuracy"], linestyle="--", linewidth=1, label=f"{name} only",
+                   color="gray" if name == res["first"] else "black")
+    ax.set(xlabel="Fraction escalated", ylabel="Accuracy", title=f"Cascade {res['first']} -> {res['second']}")
+    ax.legend(loc="lower right")
+    fig.tight_layout()
+    fig.savefig(outpath, dpi=160, bbox_inches="tight")
+
+
+def _print_row(name, p):
+    print(f"{name:<12}{p['accuracy']:>10.4f}{p['f1_macro']:>10.4f}{p['escalated']:>11.3f}{p['us_per_row']:>9.1f}")
+
+
+def main(task, first="dt", second="svm", thresholds=THRESHOLDS, tolerance=0.002, threshold=None, out=None):
+    ensure_dir(REPORTS)
+    res = threshold_report(task, first, second, thresholds)
+    res["recommended_threshold"] = pick_threshold(res, tolerance)
+    print(f"{'threshold':<12}{'accuracy':>10}{'f1_macro':>10}{'escalated':>11}{'us/row':>9}")
+    for name in (first, second):
+        _print_row(f"{name} only", res[name])
+    for t, p in res["thresholds"].items():
+        _print_row(t, p)
+    print("Recommended threshold:", res["recommended_threshold"])
+    out_json = REPORTS / f"cascade_{first}_{second}_{task}.json"
+    save_json(res, out_json)
+    plot_report(res, REPORTS / f"cascade_{first}_{second}_{task}.png")
+    print("Saved cascade report →", out_json)
+    if out:
+        threshold = threshold if threshold is not None else res["recommended_threshold"]
+        if threshold is None:
+            raise SystemExit("No threshold reaches the second model's accuracy; pass --threshold")
+        # via the module so the pickle refers to app.models.cascade, not __main__, under `python -m`
+        from app.models import cascade
+
+        model = cascade.CascadeModel(load(MODELS / f"best_{first}.joblib"), load(MODELS / f"best_{second}.joblib"),
+                                     threshold)
+        atomic_dump(model, out)
+        print(f"Saved cascade (threshold {threshold}):", out)
+    return res
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--task", default="multiclass", choices=["binary", "multiclass"])
+    ap.add_argument("--first", default="dt", help="Cheap first-stage model (models/best_<name>.joblib)")
+    ap.add_argument("--second", default="svm", help="Model the uncertain rows are escalated to")
+    ap.add_argument("--thresholds", type=float, nargs="+", default=THRESHOLDS, help="Leaf confidences to report")
+    ap.add_argument("--tolerance", type=float, default=0.002,
+                    help="Accuracy the recommended threshold may give up versus the second model")
+    ap.add_argument("--threshold", type=float, help="Threshold of the saved cascade (default: recommended)")
+    ap.add_argument("--out", help="Save a CascadeModel here, e.g. models/best_cascade.joblib")
+    args = ap.parse_args()
+    main(args.task, args.first, args.second, args.thresholds, args.tolerance, args.threshold, args.out)
@@ -0,0 +1,410 @@
+"""
+Compile a trained `pre -> clf` Pipeline into a pandas/sklearn-free NumPy scorer.
+
+Supported pipelines are the ones built by app.models.train: a ColumnTransformer of
+OneHotEncoder(handle_unknown="ignore") + StandardScaler followed by an RBF SVC, a
+DecisionTreeClassifier or the approximate-kernel "ksvm" (Nystroem -> calibrated
+linear classifier). The compiled model keeps only:
+- a category -> output-index table per categorical column,
+- fused scale/shift arrays for the numeric columns,
+- flattened tree arrays, or the support-vector matrix with dual coefficients laid out
+  as one (n_SV, n_pairs) matrix so all one-vs-one decisions are a single matmul,
+- for ksvm, the Nystroem landmarks with the normalization and linear weights folded
+  into one (n_components, n_classes) matrix plus the sigmoid calibrators.
+
+Predictions match the original pipeline (SVC probabilities use libsvm's pairwise
+coupling). Usage:
+    python -m app.models.compiled --model models/best_dt.joblib --check data/interim/test_multiclass
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+MIN_PROB = 1e-7  # same clipping as libsvm's svm_predict_probability
+
+
+class CompiledModel:
+    kind = None
+
+    def __init__(self, categorical, cat_index, numeric, num_pos, scale, shift, n_features, classes):
+        self.categorical = list(categorical)
+        self.cat_index = cat_index          # one {category: output column} dict per categorical column
+        self.numeric = list(numeric)
+        self.num_pos = num_pos              # output column of each numeric feature
+        self.scale = scale                  # 1 / StandardScaler.scale_
+        self.shift = shift                  # -mean_ / scale_
+        self.n_features = int(n_features)
+        self.classes_ = classes
+
+    @property
+    def columns(self):
+        return self.categorical + self.numeric
+
+    # --- preprocessing ---
+    def transform(self, data, dtype=np.float64) -> np.ndarray:
+        """Dense feature matrix from a list of dicts or a column mapping (e.g. a DataFrame)."""
+        if isinstance(data, dict):
+            data = [data]
+        if isinstance(data, (list, tuple)):
+            return self._transform_records(data, dtype)
+        return self._transform_columns(data, dtype)
+
+    def _transform_records(self, records, dtype):
+        n = len(records)
+        X = np.zeros((n, self.n_features), dtype=dtype)
+        for col, table in zip(self.categorical, self.cat_index):
+            for i, r in enumerate(records):
+                k = table.get(r.get(col))
+                if k is not None:
+                    X[i, k] = 1.0
+        num = np.array([[r.get(c) or 0 for c in self.numeric] for r in records], dtype=np.float64)
+        self._place_numeric(X, num.reshape(n, len(self.numeric)))
+        return X
+
+    def _transform_columns(self, cols, dtype):
+        # same contract as the source ColumnTransformer: every input column must be present
+        missing = [c for c in self.columns if c not in cols]
+        if missing:
+            raise ValueError(f"columns are missing: {missing}")
+        n = len(cols[self.columns[0]]) if self.columns else 0
+        X = np.zeros((n, self.n_features), dtype=dtype)
+        for col, table in zip(self.categorical, self.cat_index):
+            idx = np.fromiter((table.get(v, -1) for v in cols[col]), dtype=np.intp, count=n)
+            hit = idx >= 0
+            X[np.flatnonzero(hit), idx[hit]] = 1.0
+        num = np.zeros((n, len(self.numeric)), dtype=np.float64)
+        for j, c in enumerate(self.numeric):
+            num[:, j] = np.asarray(cols[c], dtype=np.float64)
+        self._place_numeric(X, num)
+        return X
+
+    def _place_numeric(self, X, num):
+        num[np.isnan(num)] = 0.0
+        X[:, self.num_pos] = num * self.scale + self.shift
+
+    # --- scoring ---
+    def score_matrix(self, X):
+        """(predictions, class probabilities) for an already transformed feature matrix."""
+        raise NotImplementedError
+
+    def predict_with_proba(self, data):
+        """(predictions, class probabilities) from a single pass over the model."""
+        return self.score_matrix(self.transform(data))
+
+    def predict_matrix(self, X):
+        return self.score_matrix(X)[0]
+
+    def predict(self, data):
+        return self.predict_matrix(self.transform(data))
+
+    def predict_proba(self, data):
+        return self.predict_with_proba(data)[1]
+
+
+class CompiledTree(CompiledModel):
+    kind = "dt"
+
+    def __init__(self, tree, **kw):
+        super().__init__(**kw)
+        self.left = tree.children_left.astype(np.intp)
+        self.right = tree.children_right.astype(np.intp)
+        self.feature = tree.feature.astype(np.intp)
+        self.threshold = tree.threshold.astype(np.float64)
+        value = tree.value[:, 0, :].astype(np.float64)
+        norm = value.sum(axis=1, keepdims=True)
+        norm[norm == 0.0] = 1.0
+        self.leaf_proba = value / norm
+
+    def apply(self, X):
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        n = X.shape[0]
+        node = np.zeros(n, dtype=np.intp)
+        if n == 1:
+            x, k = X[0], 0
+            left, right, feature, threshold = self.left, self.right, self.feature, self.threshold
+            while left[k] != -1:
+                k = left[k] if x[feature[k]] <= threshold[k] else right[k]
+            node[0] = k
+            return node
+        active = np.arange(n)
+        while active.size:
+            nd = node[active]
+            inner = self.left[nd] != -1
+            active, nd = active[inner], nd[inner]
+            go_left = X[active, self.feature[nd]] <= self.threshold[nd]
+            node[active] = np.where(go_left, self.left[nd], self.right[nd])
+        return node
+
+    def score_matrix(self, X):
+        proba = self.leaf_proba[self.apply(X)]
+        return self.classes_[np.argmax(proba, axis=1)], proba
+
+
+class CompiledSVC(CompiledModel):
+    kind = "svm"
+
+    def __init__(self, svc, **kw):
+        super().__init__(**kw)
+        k = len(svc.classes_)
+        coef = np.asarray(svc.dual_coef_, dtype=np.float64)
+        intercept = np.asarray(svc.intercept_, dtype=np.float64)
+        if k == 2:
+            # sklearn flips the sign of the public binary coefficients; undo it to get libsvm's decision
+            coef, intercept = -coef, -intercept
+        starts = np.concatenate([[0], np.cumsum(svc.n_support_)])
+        pairs = [(i, j) for i in range(k) for j in range(i + 1, k)]
+        weights = np.zeros((coef.shape[1], len(pairs)), dtype=np.float64)
+        for p, (i, j) in enumerate(pairs):
+            si, sj = slice(starts[i], starts[i + 1]), slice(starts[j], starts[j + 1])
+            weights[si, p] = coef[j - 1, si]
+            weights[sj, p] = coef[i, sj]
+        self.support_vectors = np.asarray(svc.support_vectors_, dtype=np.float64)
+        self.sv_sq = np.einsum("ij,ij->i", self.support_vectors, self.support_vectors)
+        self.weights = weights
+        self.intercept = intercept
+        self.gamma = float(svc._gamma)
+        self.pair_i = np.array([i for i, _ in pairs], dtype=np.intp)
+        self.pair_j = np.array([j for _, j in pairs], dtype=np.intp)
+        self.probA = np.asarray(getattr(svc, "probA_", np.empty(0)), dtype=np.float64)
+        self.probB = np.asarray(getattr(svc, "probB_", np.empty(0)), dtype=np.float64)
+
+    def ovo_decision(self, X):
+        # float64 even for float32 exports: the expansion below cancels on large byte counts
+        X = np.asarray(X, dtype=np.float64)
+        d2 = np.einsum("ij,ij->i", X, X)[:, None] + self.sv_sq[None, :] - 2.0 * (X @ self.support_vectors.T)
+        np.maximum(d2, 0.0, out=d2)
+        K = np.exp(-self.gamma * d2, out=d2)
+        return K @ self.weights + self.intercept
+
+    def _votes(self, dec):
+        n, k = dec.shape[0], len(self.classes_)
+        votes = np.zeros((n, k), dtype=np.intp)
+        pos = dec > 0
+        for p in range(dec.shape[1]):
+            votes[:, self.pair_i[p]] += pos[:, p]
+            votes[:, self.pair_j[p]] += ~pos[:, p]
+        return np.argmax(votes, axis=1)
+
+    def _pairwise_proba(self, dec):
+        f = dec * self.probA + self.probB
+        out = np.empty_like(f)
+        ge = f >= 0
+        e = np.exp(-np.abs(f))
+        out[ge] = e[ge] / (1.0 + e[ge])
+        out[~ge] = 1.0 / (1.0 + e[~ge])
+        return np.clip(out, MIN_PROB, 1 - MIN_PROB)
+
+    def _couple(self, r):
+        """Vectorized libsvm multiclass_probability (Wu, Lin & Weng pairwise coupling)."""
+        n, k = r.shape[0], r.shape[1]
+        Q = -r * r.transpose(0, 2, 1)
+        diag = (r * r).sum(axis=1)
+        idx = np.arange(k)
+        Q[:, idx, idx] = diag
+        p = np.full((n, k), 1.0 / k)
+        active = np.arange(n)
+        eps = 0.005 / k
+        for _ in range(max(100, k)):
+            Qa, pa = Q[active], p[active]
+            Qp = np.einsum("ntj,nj->nt", Qa, pa)
+            pQp = (pa * Qp).sum(axis=1)
+            todo = np.abs(Qp - pQp[:, None]).max(axis=1) >= eps
+            active, Qa, pa, Qp, pQp = active[todo], Qa[todo], pa[todo], Qp[todo], pQp[todo]
+            if not active.size:
+                break
+            for t in range(k):
+                qtt = Qa[:, t, t]
+                diff = (-Qp[:, t] + pQp) / qtt
+                pa[:, t] += diff
+                pQp = (pQp + diff * (diff * qtt + 2 * Qp[:, t])) / (1 + diff) / (1 + diff)
+                Qp = (Qp + diff[:, None] * Qa[:, t, :]) / (1 + diff)[:, None]
+                pa /= (1 + diff)[:, None]
+            p[active] = pa
+        return p
+
+    def proba_from_decision(self, dec):
+        if not self.probA.size:
+            raise AttributeError("SVC was trained without probability=True")
+        n, k = dec.shape[0], len(self.classes_)
+        pw = self._pairwise_proba(dec)
+        # sklearn's libsvm couples pairwise estimates for binary problems too
+        r = np.zeros((n, k, k))
+        r[:, self.pair_i, self.pair_j] = pw
+        r[:, self.pair_j, self.pair_i] = 1 - pw
+        return self._couple(r)
+
+    def score_matrix(self, X):
+        dec = self.ovo_decision(X)
+        pred = self.classes_[self._votes(dec)]
+        return pred, (self.proba_from_decision(dec) if self.probA.size else None)
+
+    def predict_matrix(self, X):
+        return self.classes_[self._votes(self.ovo_decision(X))]
+
+
+class CompiledKernelLinear(CompiledModel):
+    kind = "ksvm"
+
+    def __init__(self, kmap, calibrated, **kw):
+        super().__init__(**kw)
+        if len(calibrated.calibrated_classifiers_) != 1:
+            raise ValueError("Only CalibratedClassifierCV(ensemble=False) is supported")
+        cc = calibrated.calibrated_classifiers_[0]
+        if cc.method != "sigmoid":
+            raise ValueError("Only sigmoid calibration is supported")
+        lin = cc.estimator
+        coef = np.atleast_2d(np.asarray(lin.coef_, dtype=np.float64))
+        self.components = np.asarray(kmap.components_, dtype=np.float64)
+        self.comp_sq = np.einsum("ij,ij->i", self.components, self.components)
+        self.gamma = float(kmap.gamma) if kmap.gamma is not None else 1.0 / self.components.shape[1]
+        # K(x, landmarks) @ normalization.T @ coef.T  ==  K(x, landmarks) @ weights
+        self.weights = np.asarray(kmap.normalization_, dtype=np.float64).T @ coef.T
+        self.intercept = np.atleast_1d(np.asarray(lin.intercept_, dtype=np.float64))
+        self.cal_a = np.array([c.a_ for c in cc.calibrators], dtype=np.float64)
+        self.cal_b = np.array([c.b_ for c in cc.calibrators], dtype=np.float64)
+
+    def decision_function(self, X):
+        X = np.asarray(X, dtype=self.components.dtype)
+        d2 = np.einsum("ij,ij->i", X, X)[:, None] + self.comp_sq[None, :] - 2.0 * (X @ self.components.T)
+        np.maximum(d2, 0.0, out=d2)
+        K = np.exp(-self.gamma * d2, out=d2)
+        return K @ self.weights + self.intercept
+
+    def proba_from_decision(self, dec):
+        k = len(self.classes_)
+        p = 1.0 / (1.0 + np.exp(dec * self.cal_a + self.cal_b))
+        if k == 2:
+            return np.column_stack([1.0 - p[:, 0], p[:, 0]])
+        norm = p.sum(axis=1, keepdims=True)
+        proba = np.divide(p, norm, out=np.full_like(p, 1.0 / k), where=norm != 0)
+        proba[(proba > 1.0) & (proba <= 1.0 + 1e-5)] = 1.0
+        return proba
+
+    def score_matrix(self, X):
+        proba = self.proba_from_decision(self.decision_function(X))
+        return self.classes_[np.argmax(proba, axis=1)], proba
+
+
+def _preprocessor_layout(pre):
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    categorical, cat_index, numeric, num_pos, scale, shift = [], [], [], [], [], []
+    offset = 0
+    for name, step, cols in pre.transformers_:
+        if step == "drop":
+            continue
+        cols = list(cols)
+        if isinstance(step, OneHotEncoder):
+            if step.drop is not None or getattr(step, "infrequent_categories_", None) is not None:
+                raise ValueError("OneHotEncoder with drop/infrequent categories is not supported")
+            for col, cats in zip(cols, step.categories_):
+                categorical.append(col)
+                cat_index.append({c: offset + i for i, c in enumerate(cats.tolist())})
+                offset += len(cats)
+        elif isinstance(step, StandardScaler):
+            mean = step.mean_ if step.mean_ is not None else np.zeros(len(cols))
+            sc = step.scale_ if step.scale_ is not None else np.ones(len(cols))
+            numeric.extend(cols)
+            num_pos.extend(range(offset, offset + len(cols)))
+            scale.append(1.0 / sc)
+            shift.append(-mean / sc)
+            offset += len(cols)
+        else:
+            raise ValueError(f"Unsupported preprocessing step {name!r}: {type(step).__name__}")
+    return dict(
+        categorical=categorical, cat_index=cat_index, numeric=numeric,
+        num_pos=np.asarray(num_pos, dtype=np.intp),
+        scale=np.concatenate(scale) if scale else np.empty(0),
+        shift=np.concatenate(shift) if shift else np.empty(0),
+        n_features=offset,
+    )
+
+
+def compile_pipeline(pipeline) -> CompiledModel:
+    if isinstance(pipeline, CompiledModel):
+        return pipeline
+    steps = getattr(pipeline, "named_steps", None)
+    if not steps or list(steps) != ["pre", "clf"]:
+        raise ValueError("Expected a Pipeline with 'pre' and 'clf' steps")
+    return _compile_classifier(steps["clf"], _preprocessor_layout(steps["pre"]))
+
+
+def compile_classifier(clf, n_features: int) -> CompiledModel:
+    """Engine for the classifier alone: only `score_matrix`/`predict_matrix` on already transformed input."""
+    layout = dict(categorical=[], cat_index=[], numeric=[], num_pos=np.empty(0, dtype=np.intp),
+                  scale=np.empty(0), shift=np.empty(0), n_features=n_features)
+    return _compile_classifier(clf, layout)
+
+
+def _compile_classifier(clf, layout) -> CompiledModel:
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.kernel_approximation import Nystroem
+    from sklearn.pipeline import Pipeline
+    from sklearn.svm import SVC
+    from sklearn.tree import DecisionTreeClassifier
+
+    layout = dict(layout, classes=np.asarray(clf.classes_))
+    if isinstance(clf, DecisionTreeClassifier):
+        return CompiledTree(clf.tree_, **layout)
+    if isinstance(clf, SVC) and clf.kernel == "rbf":
+        return CompiledSVC(clf, **layout)
+    if isinstance(clf, Pipeline) and list(clf.named_steps) == ["kmap", "linear"]:
+        kmap, cal = clf.named_steps["kmap"], clf.named_steps["linear"]
+        if isinstance(kmap, Nystroem) and kmap.kernel == "rbf" and isinstance(cal, CalibratedClassifierCV):
+            return CompiledKernelLinear(kmap, cal, **layout)
+    raise ValueError(f"Unsupported classifier: {type(clf).__name__}")
+
+
+def check(pipeline, compiled, df, n_latency: int = 200) -> dict:
+    """Agreement with the source pipeline plus single-row latency for both."""
+    ref_pred = np.asarray(pipeline.predict(df))
+    pred, proba = compiled.predict_with_proba(df)
+    out = {"rows": len(df), "agreement": float(np.mean(ref_pred == pred))}
+    if proba is not None and hasattr(pipeline, "predict_proba"):
+        out["max_proba_diff"] = float(np.abs(pipeline.predict_proba(df) - proba).max())
+    records = df.head(n_latency).to_dict("records")
+    t0 = time.perf_counter()
+    for i in range(len(records)):
+        pipeline.predict(df.iloc[i:i + 1])
+    t1 = time.perf_counter()
+    for r in records:
+        compiled.predict([r])
+    t2 = time.perf_counter()
+    out["pipeline_us_per_row"] = round((t1 - t0) / len(records) * 1e6, 1)
+    out["compiled_us_per_row"] = round((t2 - t1) / len(records) * 1e6, 1)
+    return out
+
+
+def main():
+    import pandas as pd
+    from joblib import load
+
+    from app.utils.io import atomic_dump
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", required=True, help="Saved sklearn Pipeline (joblib)")
+    ap.add_argument("--out", help="Output path (default: <model>.compiled.joblib)")
+    ap.add_argument("--check", help="Interim dataset (or CSV) to verify predictions against the source pipeline")
+    args = ap.parse_args()
+
+    # Compile through the importable module so the pickle does not reference __main__
+    from app.models.compiled import compile_pipeline as _compile
+
+    pipeline = load(args.model)
+    compiled = _compile(pipeline)
+    out = Path(args.out) if args.out else Path(args.model).with_suffix(".compiled.joblib")
+    atomic_dump(compiled, out)
+    print(f"Saved {compiled.kind} engine:", out)
+    if args.check:
+        from app.data.cache import load_interim
+
+        df = pd.read_csv(args.check) if args.check.endswith(".csv") else load_interim(args.check)
+        df = df.drop(columns=["target"], errors="ignore")
+        print("Check:", check(pipeline, compiled, df))
+
+
+if __name__ == "__main__":
+    main()
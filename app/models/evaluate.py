@@ -1,4 +1,8 @@
 import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import pandas as pd
 import numpy as np
@@ -7,21 +11,30 @@ from sklearn.metrics import (
     accuracy_score, precision_recall_fscore_support,
     roc_auc_score, confusion_matrix, classification_report
 )
-import matplotlib.pyplot as plt
+from sklearn.preprocessing import label_binarize
+from matplotlib.figure import Figure
 
+from app.data.cache import iter_chunks
+from app.models.compiled import compile_classifier, compile_pipeline
 from app.utils.io import *
 
 INTERIM = Path("data/interim")
 MODELS = Path("models")
 REPORTS = Path("reports/metrics")
+MODEL_SETS = {"both": ["svm", "dt"], "all": ["svm", "dt", "ksvm"]}
+CHUNK_ROWS = 50_000  # test rows scored per call (bounds memory on large external test sets)
+COMPARE_KEYS = ["accuracy", "precision_macro", "recall_macro", "f1_macro", "roc_auc_ovr", "rows_per_s"]
 
 def plot_confusion(cm, labels, outpath):
-    fig, ax = plt.subplots(figsize=(4,4))
+    # Figure API instead of pyplot: no global state, so models can be evaluated concurrently
+    fig = Figure(figsize=(4,4))
+    ax = fig.subplots()
     im = ax.imshow(cm, interpolation='nearest')
-    plt.colorbar(im, ax=ax)
+    fig.colorbar(im, ax=ax)
     ax.set(xticks=np.arange(cm.shape[1]), yticks=np.arange(cm.shape[0]),
            xticklabels=labels, yticklabels=labels, ylabel='True label', xlabel='Predicted label')
-    plt.setp(ax.get_xticklabels(), rotation=45, ha="right", rotation_mode="anchor")
+    for tick in ax.get_xticklabels():
+        tick.set(rotation=45, ha="right", rotation_mode="anchor")
     thresh = cm.max() / 2.
     for i in range(cm.shape[0]):
         for j in range(cm.shape[1]):
@@ -29,44 +42,139 @@ def plot_confusion(cm, labels, outpath):
                     color="white" if cm[i, j] > thresh else "black")
     fig.tight_layout()
     fig.savefig(outpath, dpi=160, bbox_inches='tight')
-    plt.close(fig)
 
 
-def main(task, model):
+def one_pass_scorer(clf):
+    """fn(X) -> (labels, proba or None) from a single evaluation of the model, or None.
+
+    Labels follow the model's own rule (one-vs-one votes for an SVC, not the argmax of
+    its probabilities), exactly like clf.predict.
+    """
+    try:
+        return compile_pipeline(clf).predict_with_proba
+    except (ValueError, AttributeError):
+        pass
+    steps = getattr(clf, "steps", None)
+    if not steps:
+        return None
+    # preprocessing the engine can't express: sklearn transforms, the engine scores
+    pre, final = clf[:-1], steps[-1][1]
+    try:
+        engine = compile_classifier(final, getattr(final, "n_features_in_", 0))
+    except (ValueError, AttributeError):
+        return None
+
+    def score(X):
+        Xt = pre.transform(X)
+        return engine.score_matrix(Xt.toarray() if hasattr(Xt, "toarray") else np.asarray(Xt))
+    return score
+
+
+def auc_scores(clf, X):
+    """Scores for the AUC: predict_proba, else decision_function (None if neither exists)."""
+    if hasattr(clf, "predict_proba"):
+        return clf.predict_proba(X)
+    if hasattr(clf, "decision_function"):
+        return clf.decision_function(X)
+    return None
+
+
+def score_chunks(clf, chunks):
+    """
+    (y_true, y_pred, scores or None, scores_are_proba, rows, seconds), scored chunk by chunk.
+
+    Models the compiled engine supports (svm, dt, ksvm) yield labels and probabilities
+    from one kernel/tree evaluation. Other models are labelled with clf.predict, and
+    predict_proba or decision_function supply the AUC scores.
+    """
+    scorer = one_pass_scorer(clf)
+    ys, preds, scores = [], [], []
+    is_proba = True
+    seconds, rows = 0.0, 0
+    for chunk in chunks:
+        y = chunk["target"].to_numpy()
+        X = chunk.drop(columns=["target"])
+        t0 = time.perf_counter()
+        pred, s = scorer(X) if scorer is not None else (clf.predict(X), None)
+        if s is None:
+            s = auc_scores(clf, X)
+            is_proba = hasattr(clf, "predict_proba")
+        seconds += time.perf_counter() - t0
+        rows += len(y)
+        ys.append(y)
+        preds.append(np.asarray(pred))
+        if s is not None:
+            scores.append(np.asarray(s, dtype=np.float64))
+    s = np.concatenate(scores) if scores and len(scores) == len(preds) else None
+    return np.concatenate(ys), np.concatenate(preds), s, is_proba, rows, seconds
+
+
+def roc_auc(y, scores, is_proba, classes):
+    """Binary AUC, or macro one-vs-rest AUC; decision values work too (per-class ranking)."""
+    if scores.ndim == 1:
+        return float(roc_auc_score(y, scores))
+    if scores.shape[1] == 2:
+        return float(roc_auc_score(y, scores[:, 1]))
+    if is_proba:
+        return float(roc_auc_score(y, scores, multi_class="ovr", labels=classes))
+    # the multi_class="ovr" path insists on probabilities; the binarized macro average is the same AUC
+    return float(roc_auc_score(label_binarize(y, classes=classes), scores, average="macro"))
+
+
+def evaluate_model(task, name, source=None, chunk_size=CHUNK_ROWS):
+    """Score `name` on the test set chunk by chunk and write its metrics, report and confusion matrix."""
+    source = source or INTERIM / f"test_{task}"
+    clf = load(MODELS / f"best_{name}.joblib")
+    y_te, y_pred, scores, is_proba, rows, seconds = score_chunks(clf, iter_chunks(source, chunk_size))
+    metrics = {}
+    metrics["accuracy"] = float(accuracy_score(y_te, y_pred))
+    pr, rc, f1, _ = precision_recall_fscore_support(y_te, y_pred, average="macro", zero_division=0)
+    metrics.update({"precision_macro": float(pr), "recall_macro": float(rc), "f1_macro": float(f1)})
+    try:
+        if scores is not None:
+            metrics["roc_auc_ovr"] = roc_auc(y_te, scores, is_proba, np.asarray(clf.classes_))
+    except Exception:
+        pass
+    metrics.update({"rows": int(rows), "score_seconds": round(seconds, 4),
+                    "rows_per_s": round(rows / max(seconds, 1e-9), 1)})
+    cm = confusion_matrix(y_te, y_pred)
+    labels = ["0","1"] if task=="binary" else [str(i) for i in sorted(np.unique(y_te))]
+    plot_confusion(cm, labels, REPORTS / f"cm_{name}_{task}.png")
+    report = classification_report(y_te, y_pred, zero_division=0)
+    with open(REPORTS / f"report_{name}_{task}.txt", "w", encoding="utf-8") as f:
+        f.write(str(report))
+    save_json(metrics, REPORTS / f"metrics_{name}_{task}.json")
+    print(f"Saved metrics for {name} ({metrics['rows_per_s']:.0f} rows/s) →", REPORTS / f"metrics_{name}_{task}.json")
+    return metrics
+
+
+def main(task, model, source=None, chunk_size=CHUNK_ROWS, jobs=None):
+    """Evaluate one model, "both" (svm, dt) or "all" (+ ksvm); several models are scored in parallel processes."""
     ensure_dir(REPORTS)
-    df_te = pd.read_csv(INTERIM / f"test_{task}.csv")
-    X_te = df_te.drop(columns=["target"])
-    y_te = df_te["target"].to_numpy()
-    model_names = ([model] if model != "both" else ["svm","dt"])
-    for name in model_names:
-        clf = load(Path("models") / f"best_{name}.joblib")
-        y_pred = clf.predict(X_te)
-        y_pred = np.asarray(y_pred)
-        metrics = {}
-        metrics["accuracy"] = float(accuracy_score(y_te, y_pred))
-        pr, rc, f1, _ = precision_recall_fscore_support(y_te, y_pred, average="macro", zero_division=0)
-        metrics.update({"precision_macro": float(pr), "recall_macro": float(rc), "f1_macro": float(f1)})
-        try:
-            if hasattr(clf, "predict_proba"):
-                proba = clf.predict_proba(X_te)
-                if proba.ndim == 1 or proba.shape[1] == 2:
-                    pos = proba[:, 1] if proba.ndim > 1 else proba
-                    metrics["roc_auc_ovr"] = float(roc_auc_score(np.asarray(y_te), np.asarray(pos)))
-                else:
-                    metrics["roc_auc_ovr"] = float(roc_auc_score(np.asarray(y_te), np.asarray(proba), multi_class="ovr"))
-            else:
-                scores = clf.decision_function(X_te)
-                if scores.ndim == 1:
-                    metrics["roc_auc_ovr"] = float(roc_auc_score(np.asarray(y_te), np.asarray(scores)))
-                else:
-                    metrics["roc_auc_ovr"] = float(roc_auc_score(np.asarray(y_te), np.asarray(scores), multi_class="ovr"))
-        except Exception:
-            pass
-        cm = confusion_matrix(np.asarray(y_te), np.asarray(y_pred))
-        labels = ["0","1"] if task=="binary" else [str(i) for i in sorted(np.unique(np.asarray(y_te)))]
-        plot_confusion(cm, labels, REPORTS / f"cm_{name}_{task}.png")
-        report = classification_report(np.asarray(y_te), np.asarray(y_pred), zero_division=0)
-        with open(REPORTS / f"report_{name}_{task}.txt", "w", encoding="utf-8") as f:
-            f.write(str(report))
-        save_json(metrics, REPORTS / f"metrics_{name}_{task}.json")
-        print(f"Saved metrics for {name} →", REPORTS / f"metrics_{name}_{task}.json")
+    model_names = MODEL_SETS.get(model, [model])
+    if len(model_names) == 1 or jobs == 1:
+        return {name: evaluate_model(task, name, source, chunk_size) for name in model_names}
+    with ProcessPoolExecutor(max_workers=min(len(model_names), jobs or os.cpu_count() or 1)) as pool:
+        futures = {name: pool.submit(evaluate_model, task, name, source, chunk_size) for name in model_names}
+        return {name: fut.result() for name, fut in futures.items()}
+
+
+def compare(task, models=("svm", "ksvm")):
+    """Side-by-side metrics (and model size) of already evaluated models, e.g. exact vs approximate SVM."""
+    rows = {}
+    for name in models:
+        path = REPORTS / f"metrics_{name}_{task}.json"
+        if not path.exists():
+            print(f"[compare] No metrics for {name} ({path}); evaluate it first")
+            continue
+        metrics = json.loads(path.read_text(encoding="utf-8"))
+        model_file = MODELS / f"best_{name}.joblib"
+        rows[name] = {k: metrics.get(k) for k in COMPARE_KEYS}
+        rows[name]["model_mb"] = round(model_file.stat().st_size / 1e6, 2) if model_file.exists() else None
+    print(f"{'metric':<16}" + "".join(f"{n:>12}" for n in rows))
+    for k in COMPARE_KEYS + ["model_mb"]:
+        print(f"{k:<16}" + "".join(f"{'-' if r[k] is None else round(r[k], 4):>12}" for r in rows.values()))
+    out = REPORTS / f"compare_{'_'.join(rows)}_{task}.json"
+    save_json(rows, out)
+    print("Saved comparison →", out)
+    return rows
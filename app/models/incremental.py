@@ -0,0 +1,218 @@
+"""
+Out-of-core incremental training.
+
+Streams labeled rows in fixed-size chunks from interim column tables, CSVs or JSONL
+feature logs (ids_suricata --feature-log) and trains an SGDClassifier with partial_fit:
+
+    pass 1    collect categories, class counts and StandardScaler statistics (partial_fit)
+    pass 2..  `epochs` passes of SGD partial_fit, one chunk at a time
+
+Only one chunk is materialized at a time, so memory does not grow with the dataset.
+The model is checkpointed every `checkpoint_every` chunks and --resume continues from
+the checkpoint. With --init an existing incremental model is updated in place: its
+preprocessing is kept and only the classifier keeps learning from the new rows.
+
+The result is a regular `pre -> clf` Pipeline saved with joblib, so infer.predict and
+ids_suricata load it like the grid-searched models:
+
+    python -m app.models.incremental --task multiclass --source data/interim/train_multiclass
+    python -m app.models.incremental --task binary --source 'logs/features*.jsonl' --init models/best_sgd.joblib
+"""
+import argparse
+import glob
+import json
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import load
+from sklearn.compose import ColumnTransformer
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+from app.data.cache import iter_chunks
+from app.features.columns_nsl_kdd import CATEGORICAL, FAMILY_MAP, LABEL_COL
+from app.utils.io import atomic_dump
+
+INTERIM = Path("data/interim")
+MODELS = Path("models")
+ATTACK_TOKEN = "normal"
+# columns of feature logs / datasets that are never model inputs
+NON_FEATURES = {LABEL_COL, "target", "difficulty", "ts", "pred"}
+
+
+def expand_sources(sources):
+    """Paths for each source; shell-style patterns are expanded (sorted)."""
+    out = []
+    for s in sources:
+        matches = sorted(glob.glob(s)) if any(ch in s for ch in "*?[") else [s]
+        out.extend(matches)
+    return out
+
+
+def stream(sources, chunk_size: int):
+    for src in sources:
+        yield from iter_chunks(src, chunk_size)
+
+
+def load_label_map(task):
+    """family -> class id for multiclass (written by make_dataset), None for binary."""
+    if task != "multiclass":
+        return None
+    path = INTERIM / "label_map_multiclass.json"
+    if not path.exists():
+        raise FileNotFoundError(f"{path} not found; run make_dataset for the multiclass task first")
+    return {family: int(k) for k, family in json.loads(path.read_text(encoding="utf-8")).items()}
+
+
+def targets_of(chunk: pd.DataFrame, task, label_col, label_map) -> np.ndarray:
+    """Integer targets of a chunk: `label_col` as-is if numeric, else attack names mapped like make_dataset."""
+    if label_col in chunk.columns and chunk[label_col].dtype.kind in "biu":
+        return chunk[label_col].to_numpy()
+    col = label_col if label_col in chunk.columns else LABEL_COL
+    if col not in chunk.columns:
+        raise KeyError(f"Rows carry neither {label_col!r} nor {LABEL_COL!r}")
+    labels = chunk[col].astype(str).str.lower()
+    if task == "binary":
+        return np.where(labels == ATTACK_TOKEN, 0, 1)
+    families = labels.map(lambda x: x if x == ATTACK_TOKEN else FAMILY_MAP.get(x, "OtherAttack"))
+    return families.map(label_map).fillna(-1).astype(int).to_numpy()
+
+
+def feature_columns(chunk: pd.DataFrame, label_col):
+    categorical = [c for c in CATEGORICAL if c in chunk.columns]
+    numeric = [c for c in chunk.columns
+               if c not in categorical and c not in NON_FEATURES and c != label_col and chunk[c].dtype.kind in "biuf"]
+    return categorical, numeric
+
+
+def scan(sources, chunk_size, task, label_col, label_map):
+    """Pass 1: categories, streamed scaler statistics and class counts."""
+    categories, counts = {}, Counter()
+    scaler = StandardScaler()
+    categorical = numeric = None
+    rows = 0
+    for chunk in stream(sources, chunk_size):
+        if categorical is None:
+            categorical, numeric = feature_columns(chunk, label_col)
+            categories = {c: set() for c in categorical}
+        for c in categorical:
+            categories[c].update(chunk[c].astype(str).unique())
+        scaler.partial_fit(chunk[numeric].astype(np.float64))
+        counts.update(targets_of(chunk, task, label_col, label_map).tolist())
+        rows += len(chunk)
+    if not rows:
+        raise ValueError("No rows in the given sources")
+    counts.pop(-1, None)
+    return categorical, numeric, {c: sorted(v) for c, v in categories.items()}, scaler, counts, rows
+
+
+def build_pipeline(first_chunk, categorical, numeric, categories, scaler, alpha):
+    """`pre -> clf` Pipeline whose preprocessing is fixed up front (categories + streamed scaler)."""
+    pre = ColumnTransformer([
+        ("categorical_col", OneHotEncoder(categories=[categories[c] for c in categorical],
+                                          handle_unknown="ignore", sparse_output=False), categorical),
+        ("numerical_col", StandardScaler(), numeric),
+    ])
+    pre.fit(first_chunk)
+    # swap in the scaler fitted over the whole stream
+    pre.transformers_ = [(n, scaler if n == "numerical_col" else t, c) for n, t, c in pre.transformers_]
+    # modified_huber: outlier-robust, and predict_proba stays finite for extreme byte counts
+    clf = SGDClassifier(loss="modified_huber", alpha=alpha, average=True, random_state=42)
+    return Pipeline([("pre", pre), ("clf", clf)])
+
+
+def balanced_weights(counts, classes):
+    n, k = sum(counts.values()), len(classes)
+    return {c: n / (k * counts[c]) if counts.get(c) else 1.0 for c in classes}
+
+
+def train_stream(sources, task, out, chunk_size=20_000, epochs=3, alpha=1e-5, label_col="target",
+                 checkpoint=None, checkpoint_every=10, resume=False, init=None):
+    sources = expand_sources(sources)
+    label_map = load_label_map(task)
+    state = None
+    if resume and checkpoint and Path(checkpoint).exists():
+        state = load(checkpoint)
+        if state["sources"] != sources or state["task"] != task:
+            raise ValueError(f"{checkpoint} was written for other sources/task; drop --resume to start over")
+        print(f"[incremental] Resuming from {checkpoint} (epoch {state['epoch'] + 1}, chunk {state['chunk']})")
+    else:
+        t0 = time.perf_counter()
+        categorical, numeric, categories, scaler, counts, rows = scan(sources, chunk_size, task, label_col, label_map)
+        classes = sorted(set(label_map.values()) if label_map else {0, 1})
+        print(f"[incremental] Scanned {rows} rows in {time.perf_counter() - t0:.1f}s; "
+              f"class counts {dict(sorted(counts.items()))}")
+        if init:
+            pipeline = load(init)
+            print(f"[incremental] Updating {init} in place (preprocessing kept)")
+        else:
+            pipeline = build_pipeline(next(stream(sources, chunk_size)), categorical, numeric,
+                                      categories, scaler, alpha)
+        state = {"pipeline": pipeline, "task": task, "sources": sources, "classes": classes,
+                 "weights": balanced_weights(counts, classes), "epoch": 0, "chunk": 0, "rows_seen": 0}
+
+    pipeline = state["pipeline"]
+    pre, clf = pipeline.named_steps["pre"], pipeline.named_steps["clf"]
+    classes = np.asarray(state["classes"])
+    weights = state["weights"]
+    for epoch in range(state["epoch"], epochs):
+        t0, n = time.perf_counter(), 0
+        for i, chunk in enumerate(stream(sources, chunk_size)):
+            if i < state["chunk"]:
+                continue
+            y = targets_of(chunk, task, label_col, label_map)
+            keep = y >= 0
+            rng = np.random.default_rng(epoch * 1_000_003 + i)
+            order = rng.permutation(np.flatnonzero(keep))
+            if not order.size:
+                continue
+            X = pre.transform(chunk.iloc[order])
+            y = y[order]
+            clf.partial_fit(X, y, classes=classes, sample_weight=np.array([weights[v] for v in y]))
+            n += len(y)
+            state["chunk"] = i + 1
+            state["rows_seen"] += len(y)
+            if checkpoint and state["chunk"] % checkpoint_every == 0:
+                atomic_dump(state, checkpoint)
+        dt = time.perf_counter() - t0
+        print(f"[incremental] epoch {epoch + 1}/{epochs}: {n} rows in {dt:.1f}s ({n / max(dt, 1e-9):.0f} rows/s)")
+        state["epoch"], state["chunk"] = epoch + 1, 0
+        if checkpoint:
+            atomic_dump(state, checkpoint)
+
+    atomic_dump(pipeline, out)
+    print("Saved:", out)
+    return pipeline
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--task", default="multiclass", choices=["binary", "multiclass"])
+    ap.add_argument("--source", nargs="+", help="Column tables, CSVs or JSONL feature logs (globs allowed); "
+                                                "default data/interim/train_<task>")
+    ap.add_argument("--out", default=str(MODELS / "best_sgd.joblib"))
+    ap.add_argument("--chunk-size", type=int, default=20_000, help="Rows per partial_fit call")
+    ap.add_argument("--epochs", type=int, default=3)
+    ap.add_argument("--alpha", type=float, default=1e-5, help="SGD L2 regularization")
+    ap.add_argument("--label-col", default="target", help="Integer target column; falls back to attack names in 'label'")
+    ap.add_argument("--checkpoint", help="Checkpoint file (default <out>.ckpt)")
+    ap.add_argument("--checkpoint-every", type=int, default=10, help="Chunks between checkpoints")
+    ap.add_argument("--resume", action="store_true", help="Continue from the checkpoint")
+    ap.add_argument("--init", help="Existing incremental model to keep training")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    sources = args.source or [str(INTERIM / f"train_{args.task}")]
+    train_stream(sources, args.task, args.out, chunk_size=args.chunk_size, epochs=args.epochs, alpha=args.alpha,
+                 label_col=args.label_col, checkpoint=args.checkpoint or f"{args.out}.ckpt",
+                 checkpoint_every=args.checkpoint_every, resume=args.resume, init=args.init)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,93 @@
-from joblib import load
+import os
+import time
+
 import pandas as pd
 
-def predict(model_path, sample_dict):
-    
-    clf = load(model_path)
-    # Ensure required categorical keys exist; missing numerics default to 0
-    for k in ["protocol_type","service","flag"]:
-        sample_dict.setdefault(k, "unknown")
-    df = pd.DataFrame([sample_dict])
+from app.models.compiled import CompiledModel
+from app.models.pred_cache import PredictionCache
+from app.models.registry import REGISTRY
+from app.utils.metrics import METRICS, STAGE_SECONDS
+
+ROWS_SCORED = METRICS.counter("ids_rows_scored_total", "Rows scored by infer.predict_batch")
+SCORE_CALLS = METRICS.counter("ids_score_calls_total", "Model calls made by infer.predict_batch")
+
+CATEGORICAL_DEFAULTS = ["protocol_type", "service", "flag"]
+
+# Optional prediction cache (one per model path); IDS_PRED_CACHE=<max rows> enables it,
+# IDS_PRED_CACHE_DIGITS=<n> rounds numeric features to n significant digits in the key
+PRED_CACHE_SIZE = int(os.environ.get("IDS_PRED_CACHE", "0"))
+PRED_CACHE_DIGITS = int(os.environ.get("IDS_PRED_CACHE_DIGITS", "0")) or None
+_pred_caches = {}
+
+def to_frame(samples) -> pd.DataFrame:
+    """One columnar frame for a list of sample dicts (missing categoricals -> 'unknown', numerics -> 0)."""
+    df = pd.DataFrame.from_records(samples)
+    for k in CATEGORICAL_DEFAULTS:
+        if k in df.columns:
+            df[k] = df[k].fillna("unknown")
+        else:
+            df[k] = "unknown"
     for c in df.columns:
         if df[c].dtype.kind in "biufc":
             df[c] = df[c].fillna(0)
-    y = int(clf.predict(df)[0])
-    out = {"prediction": y}
-    if hasattr(clf, "predict_proba"):
-        proba = clf.predict_proba(df)
-        if proba.ndim == 2 and proba.shape[1] > 1:
-            out["score_attack"] = int(proba[0, -1])
+    return df
+
+def _score(clf, samples):
+    t0 = time.perf_counter()
+    if isinstance(clf, CompiledModel):
+        # NumPy engine: builds the scaled/one-hot matrix straight from the dicts
+        X = clf.transform(samples)
+        t1 = time.perf_counter()
+        STAGE_SECONDS.observe(t1 - t0, "preprocess")
+        y, proba = clf.score_matrix(X)
+    else:
+        df = to_frame(samples)
+        t1 = time.perf_counter()
+        STAGE_SECONDS.observe(t1 - t0, "features")
+        est = clf
+        if hasattr(clf, "steps") and len(clf.steps) > 1:
+            # transform once, then time the classifier step on its own
+            df, est = clf[:-1].transform(df), clf.steps[-1][1]
+            t0, t1 = t1, time.perf_counter()
+            STAGE_SECONDS.observe(t1 - t0, "preprocess")
+        if hasattr(est, "predict_with_proba"):
+            # e.g. the DT -> SVM cascade: labels and probabilities from one pass
+            y, proba = est.predict_with_proba(df)
+        else:
+            y = est.predict(df)
+            proba = est.predict_proba(df) if hasattr(est, "predict_proba") else None
+    STAGE_SECONDS.observe(time.perf_counter() - t1, "classify")
+    ROWS_SCORED.inc(len(samples))
+    SCORE_CALLS.inc()
+    out = [{"prediction": int(v)} for v in y]
+    if proba is not None and proba.ndim == 2 and proba.shape[1] > 1:
+        for o, s in zip(out, proba[:, -1]):
+            o["score_attack"] = float(s)
     return out
+
+def pred_cache_stats() -> dict:
+    return {path: cache.stats() for path, cache in _pred_caches.items()}
+
+def predict_batch(model_path, samples, max_batch_size=None):
+    """Score a list of sample dicts with one predict/predict_proba call per chunk."""
+    entry = REGISTRY.get_entry(model_path)
+    clf = entry.model
+    samples = list(samples)
+    step = max_batch_size or len(samples) or 1
+    cache = None
+    if PRED_CACHE_SIZE > 0:
+        cache = _pred_caches.get(model_path)
+        if cache is None:
+            cache = _pred_caches.setdefault(model_path, PredictionCache(PRED_CACHE_SIZE, PRED_CACHE_DIGITS))
+    results = []
+    for i in range(0, len(samples), step):
+        chunk = samples[i:i + step]
+        if cache is None:
+            results.extend(_score(clf, chunk))
+        else:
+            # keyed on the registry version: a hot reload starts an empty cache
+            results.extend(dict(r) for r in cache.lookup(chunk, entry.version, lambda rows: _score(clf, rows)))
+    return results
+
+def predict(model_path, sample_dict):
+    return predict_batch(model_path, [sample_dict])[0]
@@ -0,0 +1,135 @@
+"""
+Bounded LRU cache of predictions keyed by the feature values of a row.
+
+Flood traffic (SYN floods, port scans) produces huge numbers of identical or nearly
+identical rows: same protocol_type/service/flag, zero bytes, saturated counts. With the
+cache each distinct row is scored once; repeats (within a batch too) are dict lookups.
+
+The key is the row's values in sorted column order (the column tuple itself is shared by
+all rows with the same columns, so it costs nothing per entry). With `digits` set, numbers are
+rounded to that many significant digits first, so near-identical rows share an entry
+(and its prediction); leave it unset for exact keys. A cache belongs to one model: it
+is cleared whenever it is used with a different model id (e.g. the registry version
+after a hot reload).
+
+    cache = PredictionCache(max_entries=100_000, digits=3)
+    preds = cache.lookup(rows, model_id, lambda missing: model.predict(missing))
+"""
+import math
+import sys
+import threading
+from collections import OrderedDict
+
+from app.utils.metrics import METRICS
+
+HITS = METRICS.counter("ids_pred_cache_hits_total", "Rows answered from the prediction cache")
+MISSES = METRICS.counter("ids_pred_cache_misses_total", "Rows sent to the model by the prediction cache")
+_CACHES = []
+METRICS.gauge("ids_pred_cache_entries", "Rows held in prediction caches", fn=lambda: sum(len(c) for c in _CACHES))
+METRICS.gauge("ids_pred_cache_bytes", "Approximate memory held by prediction caches",
+              fn=lambda: sum(c.bytes for c in _CACHES))
+
+
+def _size(obj) -> int:
+    if isinstance(obj, tuple):
+        return sys.getsizeof(obj) + sum(_size(x) for x in obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(_size(k) + _size(v) for k, v in obj.items())
+    return sys.getsizeof(obj)
+
+
+class PredictionCache:
+    def __init__(self, max_entries: int = 100_000, digits: int = None):
+        self.max_entries = max(1, int(max_entries))
+        self.digits = digits
+        self.model_id = None
+        self._data = OrderedDict()      # key -> (result, approx bytes)
+        self._orders = {}               # row column order -> (sorted columns, positions)
+        self._lock = threading.Lock()
+        # stats
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.bytes = 0
+        _CACHES.append(self)
+
+    def __len__(self):
+        return len(self._data)
+
+    def _quantize(self, v):
+        if v and isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v):
+            return round(v, self.digits - 1 - math.floor(math.log10(abs(v))))
+        return v
+
+    def key(self, row: dict) -> tuple:
+        cols = tuple(row)
+        order = self._orders.get(cols)
+        if order is None:
+            if len(self._orders) >= 1024:
+                self._orders.clear()
+            names = tuple(sorted(cols))
+            order = self._orders[cols] = (names, [cols.index(c) for c in names])
+        names, pos = order
+        values = tuple(row.values())
+        if self.digits:
+            return (names,) + tuple(self._quantize(values[i]) for i in pos)
+        return (names,) + tuple(values[i] for i in pos)
+
+    def _check_model(self, model_id):
+        if model_id != self.model_id:
+            if self.model_id is not None:
+                self.invalidations += 1
+            self._data.clear()
+            self.bytes = 0
+            self.model_id = model_id
+
+    def lookup(self, rows, model_id, score_fn) -> list:
+        """Results for `rows`, in order; `score_fn(rows)` scores the distinct uncached ones."""
+        keys = [self.key(r) for r in rows]
+        out = [None] * len(rows)
+        missing = {}        # key -> positions
+        with self._lock:
+            self._check_model(model_id)
+            for i, k in enumerate(keys):
+                hit = self._data.get(k)
+                if hit is not None:
+                    self._data.move_to_end(k)
+                    out[i] = hit[0]
+                else:
+                    missing.setdefault(k, []).append(i)
+        if missing:
+            results = score_fn([rows[pos[0]] for pos in missing.values()])
+            with self._lock:
+                # a reload while scoring: don't mix the new model's cache with old results
+                store = self.model_id == model_id
+                for (k, pos), res in zip(missing.items(), results):
+                    for i in pos:
+                        out[i] = res
+                    if store and k not in self._data:
+                        size = sys.getsizeof(k) + sum(_size(x) for x in k[1:]) + _size(res)
+                        self._data[k] = (res, size)
+                        self.bytes += size
+                while len(self._data) > self.max_entries:
+                    _, (_, size) = self._data.popitem(last=False)
+                    self.bytes -= size
+        with self._lock:
+            # rows repeated within the batch but scored once count as hits
+            self.hits += len(rows) - len(missing)
+            self.misses += len(missing)
+        HITS.inc(len(rows) - len(missing))
+        MISSES.inc(len(missing))
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "digits": self.digits,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+                "approx_bytes": self.bytes,
+            }
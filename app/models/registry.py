@@ -0,0 +1,213 @@
+"""
+Process-wide cache of loaded models.
+
+Each model path is deserialized once per process and shared by every caller.
+On access the file is stat()-ed (at most every `check_interval` seconds); when its
+mtime/size changes the content hash is compared and, if it differs, the model is
+reloaded and swapped in atomically. Models that have not been used for `idle_ttl`
+seconds are evicted.
+
+Loading and hashing run outside the registry lock, so a slow (re)load of one model never
+stalls lookups of the others; a per-path lock makes concurrent misses load it only once.
+A load is accepted only if the file's stat (mtime, size, inode) is the same before and
+after it, so the digest and the model always come from the same file.
+
+Models are loaded with joblib's mmap_mode="c" by default: arrays of uncompressed dumps
+(see app.models.artifacts) are mapped copy-on-write from the page cache, so processes
+serving the same file share one physical copy and loading skips the array copies.
+Copy-on-write rather than "r" because libsvm's predict wants writeable buffers (it never
+writes, so the pages stay shared). IDS_MODEL_MMAP="" disables mapping.
+
+A mapped file must never be rewritten in place (the mapping then faults with SIGBUS):
+every writer in the repo goes through app.utils.io.atomic_dump (temp file + rename), and
+models deployed by hand should be moved into place (`mv`), not copied over (`cp`).
+"""
+import os
+import threading
+import time
+from pathlib import Path
+
+from joblib import load
+
+from app.utils.io import file_digest
+
+
+class _Entry:
+    __slots__ = ("model", "stat_key", "digest", "loaded_at", "last_used", "last_checked", "load_seconds", "version")
+
+    def __init__(self, model, stat_key, digest, load_seconds, version):
+        now = time.monotonic()
+        self.model = model
+        self.stat_key = stat_key
+        self.digest = digest
+        self.loaded_at = now
+        self.last_used = now
+        self.last_checked = now
+        self.load_seconds = load_seconds
+        self.version = version
+
+
+class ModelRegistry:
+    def __init__(self, check_interval: float = 1.0, idle_ttl: float = 3600.0, verify_hash: bool = True,
+                 mmap_mode="c"):
+        self.check_interval = check_interval
+        self.mmap_mode = mmap_mode
+        self.idle_ttl = idle_ttl
+        self.verify_hash = verify_hash
+        self._entries = {}
+        self._lock = threading.RLock()
+        self._load_locks = {}     # key -> Lock held while that path is (re)loaded
+        self._versions = 0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+        self.load_errors = 0
+
+    @staticmethod
+    def _key(path) -> str:
+        return str(Path(path).resolve())
+
+    @staticmethod
+    def _stat_key(path):
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _load(self, path, attempts: int = 3):
+        """Load and hash `path` (no registry lock held); retried if the file is replaced meanwhile."""
+        for _ in range(attempts):
+            stat_key = self._stat_key(path)
+            digest = file_digest(path) if self.verify_hash else None
+            t0 = time.perf_counter()
+            model = load(path, mmap_mode=self.mmap_mode)
+            load_seconds = time.perf_counter() - t0
+            if self._stat_key(path) == stat_key:
+                break
+            print(f"[registry] {path} changed while loading, retrying")
+        else:
+            raise RuntimeError(f"{path} kept changing while being loaded")
+        with self._lock:
+            self._versions += 1
+            version = self._versions
+        print(f"[registry] Loaded {path} in {load_seconds * 1000:.1f} ms")
+        return _Entry(model, stat_key, digest, load_seconds, version)
+
+    def _load_lock(self, key):
+        with self._lock:
+            return self._load_locks.setdefault(key, threading.Lock())
+
+    def _refresh(self, key, entry, path):
+        """Reload `entry` if the file on disk changed; keep the old model on failure."""
+        try:
+            stat_key = self._stat_key(path)
+        except FileNotFoundError:
+            return entry
+        if stat_key == entry.stat_key:
+            return entry
+        load_lock = self._load_lock(key)
+        if not load_lock.acquire(blocking=False):
+            # another thread is reloading it: serve the current model meanwhile
+            return entry
+        try:
+            if self.verify_hash and entry.digest is not None and file_digest(path) == entry.digest:
+                entry.stat_key = stat_key
+                return entry
+            try:
+                fresh = self._load(path)
+            except Exception as e:
+                with self._lock:
+                    self.load_errors += 1
+                print(f"[registry] Reload of {path} failed, keeping previous model: {e}")
+                entry.stat_key = stat_key
+                return entry
+            with self._lock:
+                self.reloads += 1
+                fresh.last_used = entry.last_used
+                self._entries[key] = fresh
+            return fresh
+        finally:
+            load_lock.release()
+
+    def _evict_idle(self, now):
+        if self.idle_ttl is None:
+            return
+        for key in [k for k, e in self._entries.items() if now - e.last_used > self.idle_ttl]:
+            del self._entries[key]
+            self.evictions += 1
+
+    def get_entry(self, path) -> _Entry:
+        key = self._key(path)
+        with self._lock:
+            now = time.monotonic()
+            self._evict_idle(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                entry.last_used = now
+                due = now - entry.last_checked >= self.check_interval
+                if due:
+                    # claimed under the lock: one caller per interval does the stat/reload
+                    entry.last_checked = now
+        if entry is not None:
+            return self._refresh(key, entry, path) if due else entry
+        with self._load_lock(key):
+            # a concurrent miss may have loaded it while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            if entry is None:
+                entry = self._load(path)
+                with self._lock:
+                    self._entries[key] = entry
+            entry.last_used = time.monotonic()
+            return entry
+
+    def get(self, path):
+        return self.get_entry(path).model
+
+    def version(self, path) -> int:
+        """Monotonic id of the model currently cached for `path` (changes on reload)."""
+        return self.get_entry(path).version
+
+    def evict(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._key(path), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "mmap_mode": self.mmap_mode,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+                "load_errors": self.load_errors,
+                "models": {
+                    key: {
+                        "version": e.version,
+                        "load_seconds": round(e.load_seconds, 6),
+                        "age_seconds": round(now - e.loaded_at, 3),
+                        "idle_seconds": round(now - e.last_used, 3),
+                        "sha256": e.digest,
+                    }
+                    for key, e in self._entries.items()
+                },
+            }
+
+
+REGISTRY = ModelRegistry(
+    check_interval=float(os.environ.get("IDS_MODEL_CHECK_INTERVAL", "1.0")),
+    idle_ttl=float(os.environ.get("IDS_MODEL_IDLE_TTL", "3600")),
+    mmap_mode=os.environ.get("IDS_MODEL_MMAP", "c") or None,
+)
+
+
+def get_model(path):
+    return REGISTRY.get(path)
@@ -1,20 +1,44 @@
 import argparse
+import shutil
+import tempfile
+import time
 from pathlib import Path
 import pandas as pd
-from joblib import dump
+from joblib import Memory
 
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.pipeline import Pipeline
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.kernel_approximation import Nystroem
+from sklearn.linear_model import RidgeClassifier
 from sklearn.svm import SVC
 from sklearn.tree import DecisionTreeClassifier
-from sklearn.model_selection import GridSearchCV, StratifiedKFold
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import GridSearchCV, HalvingGridSearchCV, StratifiedKFold
 
 from app.features.columns_nsl_kdd import *
+from app.data.cache import load_interim
 from app.utils.io import *
 
 INTERIM = Path("data/interim")
 MODELS = Path("models")
+REPORTS = Path("reports/search")
+SEARCHES = ("grid", "halving")
+
+# Hyper-parameter grids searched per model (also part of the pipeline stage fingerprint)
+PARAM_GRIDS = {
+    "svm": {"clf__C": [1, 3], "clf__gamma": ["scale"]},
+    "dt": {
+        "clf__max_depth": [None, 20, 40],
+        "clf__min_samples_split": [2, 10, 50],
+        "clf__min_samples_leaf": [1, 5, 10],
+    },
+    "ksvm": {"clf__kmap__gamma": [0.01, 0.03], "clf__linear__estimator__alpha": [0.1, 1.0]},
+}
+# Models cheap enough to always train on every row (fast=True only subsamples the others)
+FULL_DATA_MODELS = {"ksvm"}
+KSVM_COMPONENTS = 400
 
 def build_preprocessor(X: pd.DataFrame) -> ColumnTransformer:
     categorical_col = [c for c in CATEGORICAL if c in X.columns]
@@ -25,7 +49,16 @@ def build_preprocessor(X: pd.DataFrame) -> ColumnTransformer:
     ])
     return pre
 
-def grid_search(model_name: str, pre: ColumnTransformer, X, y):
+def grid_search(model_name: str, pre: ColumnTransformer, X, y, search: str = "grid", memory=None, n_jobs: int = -1):
+    """
+    Hyper-parameter search for `model_name`.
+
+    search="grid" fits every candidate on every fold; search="halving" runs successive
+    halving over the number of samples (factor 3, the last round on all rows).
+    `memory` (a joblib.Memory or path) caches the fitted preprocessor per fold, so
+    it is fitted once per fold/sample size instead of once per candidate.
+    `n_jobs` is passed to the search (-1: every CPU).
+    """
     if model_name == "svm":
         clf = SVC(
             kernel="rbf",
@@ -33,41 +66,88 @@ def grid_search(model_name: str, pre: ColumnTransformer, X, y):
             class_weight="balanced",
             random_state=42,
         )
-        grid = {"clf__C": [1, 3], "clf__gamma": ["scale"]}
     elif model_name == "dt":
         clf = DecisionTreeClassifier(
             criterion="gini",
             class_weight="balanced",
             random_state=42,
         )
-        grid = {
-            "clf__max_depth": [None, 20, 40],
-            "clf__min_samples_split": [2, 10, 50],
-            "clf__min_samples_leaf": [1, 5, 10],
-        }
+    elif model_name == "ksvm":
+        # RBF kernel approximated by Nystroem landmarks + a least-squares linear SVM (ridge,
+        # solved in closed form): training is linear in the number of rows and scoring costs
+        # the same per row however big the training set. Probabilities are Platt-calibrated.
+        clf = Pipeline([
+            ("kmap", Nystroem(kernel="rbf", n_components=KSVM_COMPONENTS, random_state=42)),
+            ("linear", CalibratedClassifierCV(
+                RidgeClassifier(class_weight="balanced"),
+                method="sigmoid", cv=3, ensemble=False,
+            )),
+        ])
     else:
         raise ValueError("Unknown model name")
 
-    pipe = Pipeline([("pre", pre), ("clf", clf)])
+    grid = PARAM_GRIDS[model_name]
+    pipe = Pipeline([("pre", pre), ("clf", clf)], memory=memory)
     cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=42)
-    gs = GridSearchCV(pipe, grid, scoring="f1_macro", cv=cv, n_jobs=-1, verbose=1)
+    if search == "grid":
+        gs = GridSearchCV(pipe, grid, scoring="f1_macro", cv=cv, n_jobs=n_jobs, verbose=1)
+    elif search == "halving":
+        gs = HalvingGridSearchCV(pipe, grid, scoring="f1_macro", cv=cv, factor=3, resource="n_samples",
+                                 min_resources="exhaust", random_state=42, n_jobs=n_jobs, verbose=1)
+    else:
+        raise ValueError(f"search must be one of {SEARCHES}")
     gs.fit(X, y)
     return gs
 
 
-def main(task, models, fast):
+def search_report(gs, search: str, seconds: float) -> dict:
+    """Best candidate plus per-candidate timing/score (one entry per candidate and halving round)."""
+    res = gs.cv_results_
+    candidates = []
+    for i, params in enumerate(res["params"]):
+        candidates.append({
+            "params": params,
+            "iter": int(res["iter"][i]) if "iter" in res else 0,
+            "n_resources": int(res["n_resources"][i]) if "n_resources" in res else None,
+            "mean_fit_time": float(res["mean_fit_time"][i]),
+            "mean_score_time": float(res["mean_score_time"][i]),
+            "mean_test_score": float(res["mean_test_score"][i]),
+            "rank": int(res["rank_test_score"][i]),
+        })
+    return {
+        "search": search,
+        "best_params": gs.best_params_,
+        "best_score": float(gs.best_score_),
+        "seconds": round(seconds, 3),
+        "refit_seconds": round(float(getattr(gs, "refit_time_", 0.0)), 3),
+        "fit_seconds_total": round(sum(c["mean_fit_time"] for c in candidates) * gs.n_splits_, 3),
+        "candidates": candidates,
+    }
+
+
+def main(task, models, fast, search="grid", n_jobs=-1):
     ensure_dir(MODELS)
-    df = pd.read_csv(INTERIM / f"train_{task}.csv")
-    if fast and len(df) > 40000:
-        df = df.sample(40000, random_state=42)
-    X = df.drop(columns=["target"])
-    y = df["target"].values
-    pre = build_preprocessor(X)
+    full = load_interim(INTERIM / f"train_{task}")
+    sample = full.sample(40000, random_state=42) if fast and len(full) > 40000 else full
     for name in models:
-        print(f"\n=== Training {name.upper()} ===")
-        gs = grid_search(name, pre, X, y)
-        print("Best params:", gs.best_params_)
+        df = full if name in FULL_DATA_MODELS else sample
+        X = df.drop(columns=["target"])
+        y = df["target"].values
+        pre = build_preprocessor(X)
+        print(f"\n=== Training {name.upper()} ({len(df)} rows) ===")
+        cache_dir = tempfile.mkdtemp(prefix="ids_pre_cache_")
+        t0 = time.perf_counter()
+        try:
+            gs = grid_search(name, pre, X, y, search=search, memory=Memory(cache_dir, verbose=0), n_jobs=n_jobs)
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        seconds = time.perf_counter() - t0
+        print(f"Best params: {gs.best_params_} ({search} search, {seconds:.1f}s)")
         best = gs.best_estimator_
+        best.set_params(memory=None)  # the cache directory is gone; don't ship a reference to it
         out = MODELS / (f"best_{name}.joblib")
-        dump(best, out)
+        atomic_dump(best, out)
         print("Saved:", out)
+        report = REPORTS / f"search_{name}_{task}.json"
+        save_json(search_report(gs, search, seconds), report)
+        print("Saved search report:", report)
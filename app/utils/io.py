@@ -1,7 +1,12 @@
+import hashlib
 import json
+import os
+import tempfile
 from pathlib import Path
 from typing import Union
 
+from joblib import dump
+
 def ensure_dir(path: Union[str, Path]) -> Path:
     p = Path(path)
     p.mkdir(parents=True, exist_ok=True)
@@ -12,3 +17,29 @@ def save_json(obj, path: Union[str, Path]):
     p.parent.mkdir(parents=True, exist_ok=True)
     with open(p, "w", encoding="utf-8") as f:
         json.dump(obj, f, indent=2)
+
+def file_digest(path: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def atomic_dump(obj, path: Union[str, Path], **kwargs) -> Path:
+    """joblib.dump to a temp file next to `path`, then rename it over `path`.
+
+    Readers that memory-mapped the old file keep their mapping (the inode stays alive);
+    rewriting a mapped file in place would kill them with SIGBUS.
+    """
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{p.name}.", suffix=".tmp", dir=p.parent)
+    os.close(fd)
+    try:
+        dump(obj, tmp, **kwargs)
+        os.replace(tmp, p)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return p
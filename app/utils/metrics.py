@@ -0,0 +1,248 @@
+"""
+Lightweight in-process metrics (counters, gauges, histograms) in Prometheus text format.
+
+Hot paths time themselves with time.perf_counter() and call `observe`/`inc`, which
+cost a lock and a bisect; rendering happens only when /metrics is scraped.
+
+    from app.utils.metrics import METRICS, STAGE_SECONDS
+    t0 = time.perf_counter()
+    ...
+    STAGE_SECONDS.observe(time.perf_counter() - t0, "classify")
+    print(METRICS.render())
+
+Worker processes send `METRICS.snapshot()` to their parent, which folds it in with
+`METRICS.merge(worker_id, snapshot)`; counters and histograms then render the sum.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds; spans per-event work (µs) up to slow batch calls
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(name, value, extra=""):
+    parts = [f'{name}="{value}"'] if name and value is not None else []
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, label=None):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self._lock = threading.Lock()
+        self.remote = {}        # source id -> snapshot (counters/histograms of other processes)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """A monotonically increasing total, counted with `inc` or read from `fn` at scrape time."""
+    kind = "counter"
+
+    def __init__(self, name, help_text, label=None, fn=None):
+        super().__init__(name, help_text, label)
+        self.fn = fn
+        self.values = {}
+
+    def inc(self, n=1, label_value=None):
+        with self._lock:
+            self.values[label_value] = self.values.get(label_value, 0) + n
+
+    def snapshot(self):
+        if self.fn is not None:
+            value = self.fn()
+            return dict(value) if isinstance(value, dict) else {None: value}
+        with self._lock:
+            return dict(self.values)
+
+    def _merged(self):
+        merged = self.snapshot()
+        for snap in list(self.remote.values()):
+            for k, v in snap.items():
+                merged[k] = merged.get(k, 0) + v
+        return merged
+
+    def total(self):
+        return sum(self._merged().values())
+
+    def render(self):
+        items = sorted(self._merged().items(), key=lambda kv: str(kv[0]))
+        return self.header() + [f"{self.name}{_labels(self.label, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """A value that is set, or computed by `fn` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn=None, label=None):
+        super().__init__(name, help_text, label)
+        self.fn = fn
+        self.values = {}
+
+    def set(self, value, label_value=None):
+        with self._lock:
+            self.values[label_value] = value
+
+    def render(self):
+        if self.fn is not None:
+            value = self.fn()
+            items = sorted(value.items(), key=lambda kv: str(kv[0])) if isinstance(value, dict) else [(None, value)]
+        else:
+            with self._lock:
+                items = sorted(self.values.items(), key=lambda kv: str(kv[0]))
+        return self.header() + [f"{self.name}{_labels(self.label, k)} {_num(v)}" for k, v in items if v is not None]
+
+
+class Rate(Gauge):
+    """Per-second rate of a counter over the last `window` seconds (events/s, alerts/s).
+
+    Scrapes only add (time, total) samples, at most one per window/10, and the rate is
+    taken against the newest sample at least `window` old: concurrent scrapers see the
+    same value instead of resetting each other's baseline. Before the first full
+    window it is the rate since start.
+    """
+
+    def __init__(self, name, help_text, counter, window=10.0):
+        super().__init__(name, help_text, fn=self._rate)
+        self.counter = counter
+        self.window = window
+        self._samples = deque([(time.monotonic(), 0)])
+
+    def _rate(self):
+        now, total = time.monotonic(), self.counter.total()
+        with self._lock:
+            samples = self._samples
+            while len(samples) > 1 and samples[1][0] <= now - self.window:
+                samples.popleft()
+            then, before = samples[0]
+            if now - samples[-1][0] >= self.window / 10:
+                samples.append((now, total))
+        return round((total - before) / max(now - then, 1e-9), 3)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, label=None):
+        super().__init__(name, help_text, label)
+        self.buckets = tuple(buckets)
+        self.series = {}        # label value -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, label_value=None):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self.series.get(label_value)
+            if s is None:
+                s = self.series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[i] += 1
+            s[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {k: list(v) for k, v in self.series.items()}
+
+    def render(self):
+        out = self.header()
+        series = self.snapshot()
+        for snap in list(self.remote.values()):
+            for k, v in snap.items():
+                s = series.setdefault(k, [0] * len(v))
+                series[k] = [a + b for a, b in zip(s, v)]
+        for key in sorted(series, key=str):
+            s = series[key]
+            cum = 0
+            for bound, n in zip(self.buckets + (float("inf"),), s[:-1]):
+                cum += n
+                le = "+Inf" if bound == float("inf") else _num(bound)
+                le_label = f'le="{le}"'
+                out.append(f"{self.name}_bucket{_labels(self.label, key, le_label)} {cum}")
+            out.append(f"{self.name}_sum{_labels(self.label, key)} {_num(s[-1])}")
+            out.append(f"{self.name}_count{_labels(self.label, key)} {cum}")
+        return out
+
+
+class Metrics:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, label=None, fn=None) -> Counter:
+        return self._add(Counter(name, help_text, label, fn))
+
+    def gauge(self, name, help_text, fn=None, label=None) -> Gauge:
+        return self._add(Gauge(name, help_text, fn, label))
+
+    def rate(self, name, help_text, counter, window=10.0) -> Rate:
+        return self._add(Rate(name, help_text, counter, window))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, label=None) -> Histogram:
+        return self._add(Histogram(name, help_text, buckets, label))
+
+    def snapshot(self) -> dict:
+        """Picklable state of the counters and histograms, for merging into another process."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.snapshot() for m in metrics if hasattr(m, "snapshot")}
+
+    def merge(self, source, snapshot: dict):
+        """Replace the state last received from `source` (snapshots are cumulative)."""
+        with self._lock:
+            for name, snap in snapshot.items():
+                if name in self._metrics:
+                    self._metrics[name].remote[source] = snap
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+# Shared by the Flask app and the Suricata tailer: decode, features, preprocess, classify,
+# alert_write, eve_parse, window_update
+STAGE_SECONDS = METRICS.histogram("ids_stage_seconds", "Time spent per processing stage", label="stage")
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1", metrics: Metrics = METRICS):
+    """Serve `metrics` at http://host:port/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,168 @@
+"""
+Tiny stage runner for the training pipeline.
+
+A stage declares the files it reads (`inputs`), the files/directories it writes
+(`outputs`) and the config it depends on. Its key is a hash of the config, the
+source of the modules that implement it and the content fingerprints of its inputs;
+a stage whose key and outputs match the last successful run is skipped.
+
+Dependencies are implied: a stage depends on whichever stage produces one of its
+inputs. Stages whose dependencies are done run concurrently on a thread pool.
+"""
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from app.utils.io import file_digest
+
+STATE = Path("reports/pipeline/state.json")
+
+
+class Stage:
+    def __init__(self, name, func, inputs=(), outputs=(), config=None, code=()):
+        self.name = name
+        self.func = func
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self.config = config or {}
+        self.code = list(code) or [getattr(func, "func", func)]
+
+
+class _Fingerprints:
+    """Content fingerprints, re-hashed only when a file's mtime/size changes."""
+
+    def __init__(self, known, lock=None):
+        self.known = known
+        # shared with whoever serializes `known` (run_stages saves it with the stage state)
+        self._lock = lock or threading.Lock()
+
+    def _file(self, p: Path) -> str:
+        st = p.stat()
+        stat_key = [st.st_mtime_ns, st.st_size]
+        key = str(p)
+        with self._lock:
+            hit = self.known.get(key)
+        if hit and hit["stat"] == stat_key:
+            return hit["sha256"]
+        digest = file_digest(p)
+        with self._lock:
+            self.known[key] = {"stat": stat_key, "sha256": digest}
+        return digest
+
+    def of(self, path):
+        p = Path(path)
+        if p.is_file():
+            return self._file(p)
+        if p.is_dir():
+            h = hashlib.sha256()
+            for f in sorted(x for x in p.rglob("*") if x.is_file()):
+                h.update(f"{f.relative_to(p)}:{self._file(f)}\n".encode())
+            return h.hexdigest()
+        return None
+
+
+def _code_digest(objs) -> str:
+    h = hashlib.sha256()
+    for obj in objs:
+        src = inspect.getsourcefile(obj)
+        h.update(file_digest(src).encode() if src else repr(obj).encode())
+    return h.hexdigest()
+
+
+def _load_state(path):
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state, path):
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(p.suffix + ".tmp")
+    tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    os.replace(tmp, p)
+
+
+def run_stages(stages, state_path=STATE, force: bool = False, max_workers: int = 4) -> list:
+    """Run `stages` in dependency order, skipping up-to-date ones. Returns one timing record per stage."""
+    producers = {}
+    for s in stages:
+        for out in s.outputs:
+            producers[out] = s.name
+    deps = {s.name: {producers[i] for i in s.inputs if i in producers} - {s.name} for s in stages}
+    by_name = {s.name: s for s in stages}
+
+    state = _load_state(state_path)
+    state.setdefault("stages", {})
+    lock = threading.Lock()
+    fps = _Fingerprints(state.setdefault("files", {}), lock)
+
+    def execute(stage):
+        t0 = time.perf_counter()
+        key = hashlib.sha256(json.dumps({
+            "config": stage.config,
+            "code": _code_digest(stage.code),
+            "inputs": {str(p): fps.of(p) for p in stage.inputs},
+        }, sort_keys=True, default=str).encode()).hexdigest()
+        with lock:
+            prev = state["stages"].get(stage.name)
+        if not force and prev and prev["key"] == key and all(
+                fps.of(p) == prev["outputs"].get(str(p)) for p in stage.outputs):
+            print(f"[stage] {stage.name}: up to date, skipped")
+            return {"stage": stage.name, "status": "skipped", "seconds": time.perf_counter() - t0}
+        print(f"[stage] {stage.name}: running")
+        stage.func()
+        missing = [str(p) for p in stage.outputs if not p.exists()]
+        if missing:
+            raise RuntimeError(f"stage {stage.name} did not write {missing}")
+        outputs = {str(p): fps.of(p) for p in stage.outputs}
+        with lock:
+            state["stages"][stage.name] = {"key": key, "outputs": outputs, "finished_at": time.time()}
+            _save_state(state, state_path)
+        seconds = time.perf_counter() - t0
+        print(f"[stage] {stage.name}: done in {seconds:.1f}s")
+        return {"stage": stage.name, "status": "ran", "seconds": seconds}
+
+    results, done, failed = {}, set(), set()
+    pending = [s.name for s in stages]
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for name in list(pending):
+                if deps[name] & failed:
+                    pending.remove(name)
+                    failed.add(name)
+                    results[name] = {"stage": name, "status": "blocked", "seconds": 0.0}
+                elif deps[name] <= done:
+                    pending.remove(name)
+                    running[pool.submit(execute, by_name[name])] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                try:
+                    results[name] = fut.result()
+                    done.add(name)
+                except Exception as e:
+                    print(f"[stage] {name}: failed: {e}")
+                    failed.add(name)
+                    results[name] = {"stage": name, "status": "failed", "seconds": 0.0, "error": str(e)}
+    with lock:
+        _save_state(state, state_path)
+    return [results[s.name] for s in stages if s.name in results]
+
+
+def print_summary(records, wall_seconds=None) -> None:
+    width = max([len(r["stage"]) for r in records] + [5])
+    print(f"\n{'stage':<{width}}  {'status':<8} {'seconds':>8}")
+    for r in records:
+        print(f"{r['stage']:<{width}}  {r['status']:<8} {r['seconds']:>8.2f}")
+    if wall_seconds is not None:
+        print(f"{'wall':<{width}}  {'':<8} {wall_seconds:>8.2f}")
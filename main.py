@@ -1,24 +1,78 @@
-from app.data import download_nsl_kdd, make_dataset
-from app.models import train, evaluate
+import argparse
+import os
+import time
+from functools import partial
 
+from app.data import download_nsl_kdd, make_dataset
+from app.data.cache import table_path
+from app.models import cascade, train, evaluate
+from app.utils.stages import Stage, print_summary, run_stages
 
-def main():
-    print("[1/5] Downloading NSL-KDD dataset...")
-    # NOTE: If keeps failing, download manually and add to data/raw folder
-    download_nsl_kdd.main() 
+# NOTE: Tasks can either be binary or multiclass. Both datasets are built; models
+# (models/best_<name>.joblib) are trained and evaluated for TASK.
+DATASET_TASKS = ["binary", "multiclass"]
+TASK = "multiclass"
+MODEL_NAMES = ["svm", "dt", "ksvm"]
+FAST = True
+SEARCH = "halving"  # "grid" or "halving" (successive halving over samples)
 
-    print("[2/5] Preprocessing dataset...")
-    # NOTE: Tasks can either be binary or multiclass
-    make_dataset.main(task="multiclass")
 
-    print("[3/5] Training models (SVM and Decision Tree)...")
-    train.main(task="multiclass", models=["svm", "dt"], fast=True)
+def build_stages(task=TASK, models=MODEL_NAMES, fast=FAST, search=SEARCH, jobs=4):
+    # train stages can run side by side: split the CPUs between them instead of each search taking all
+    train_jobs = max(1, (os.cpu_count() or 1) // max(1, min(jobs, len(models))))
+    raw = [download_nsl_kdd.TRAIN_FILE, download_nsl_kdd.TEST_FILE]
+    # NOTE: If download keeps failing, download manually and add to data/raw folder
+    stages = [Stage("download", download_nsl_kdd.main, outputs=raw,
+                    config={"train": download_nsl_kdd.URLS_TRAIN, "test": download_nsl_kdd.URLS_TEST})]
+    for t in DATASET_TASKS:
+        outputs = [table_path(make_dataset.INTERIM / f"train_{t}"), table_path(make_dataset.INTERIM / f"test_{t}")]
+        if t == "multiclass":
+            outputs.append(make_dataset.INTERIM / "label_map_multiclass.json")
+        stages.append(Stage(f"dataset:{t}", partial(make_dataset.main, t), inputs=raw, outputs=outputs,
+                            config={"task": t}, code=[make_dataset, make_dataset.cached_read]))
+    train_table = table_path(make_dataset.INTERIM / f"train_{task}")
+    test_table = table_path(make_dataset.INTERIM / f"test_{task}")
+    for name in models:
+        model_file = train.MODELS / f"best_{name}.joblib"
+        stages.append(Stage(f"train:{name}", partial(train.main, task, [name], fast, search, train_jobs),
+                            inputs=[train_table], outputs=[model_file, train.REPORTS / f"search_{name}_{task}.json"],
+                            config={"task": task, "fast": fast, "search": search, "grid": train.PARAM_GRIDS[name]},
+                            code=[train]))
+        stages.append(Stage(f"evaluate:{name}", partial(evaluate.main, task, name),
+                            inputs=[model_file, test_table],
+                            outputs=[evaluate.REPORTS / f"metrics_{name}_{task}.json",
+                                     evaluate.REPORTS / f"report_{name}_{task}.txt",
+                                     evaluate.REPORTS / f"cm_{name}_{task}.png"],
+                            config={"task": task}, code=[evaluate]))
+    if {"svm", "ksvm"} <= set(models):
+        # exact RBF SVC vs its Nystroem approximation
+        stages.append(Stage("compare:svm-ksvm", partial(evaluate.compare, task, ("svm", "ksvm")),
+                            inputs=[evaluate.REPORTS / f"metrics_{n}_{task}.json" for n in ("svm", "ksvm")],
+                            outputs=[evaluate.REPORTS / f"compare_svm_ksvm_{task}.json"],
+                            config={"task": task}, code=[evaluate]))
+    if {"dt", "svm"} <= set(models):
+        # accuracy vs escalated fraction of the DT -> SVM cascade
+        stages.append(Stage("cascade:dt-svm", partial(cascade.main, task),
+                            inputs=[train.MODELS / f"best_{n}.joblib" for n in ("dt", "svm")] + [test_table],
+                            outputs=[evaluate.REPORTS / f"cascade_dt_svm_{task}.json",
+                                     evaluate.REPORTS / f"cascade_dt_svm_{task}.png"],
+                            config={"task": task, "thresholds": cascade.THRESHOLDS}, code=[cascade, evaluate]))
+    return stages
 
-    print("[4/5] Evaluating models...")
-    # Model can either be "svm", "dt" or both
-    evaluate.main(task="multiclass", model="both")
 
-    print("[5/5] IDS pipeline complete. Models and reports are saved.")
+def main(force=False, jobs=4):
+    print("[1/2] Running IDS pipeline stages (download → datasets → train → evaluate)...")
+    t0 = time.perf_counter()
+    records = run_stages(build_stages(jobs=jobs), force=force, max_workers=jobs)
+    print_summary(records, time.perf_counter() - t0)
+    failed = [r["stage"] for r in records if r["status"] in ("failed", "blocked")]
+    if failed:
+        raise SystemExit(f"Pipeline stages did not complete: {', '.join(failed)}")
+    print("[2/2] IDS pipeline complete. Models and reports are saved.")
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--force", action="store_true", help="Re-run every stage even if it is up to date")
+    ap.add_argument("--jobs", type=int, default=4, help="Stages run concurrently")
+    args = ap.parse_args()
+    main(force=args.force, jobs=args.jobs)
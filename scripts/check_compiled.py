@@ -0,0 +1,74 @@
+"""
+Regression check for app.models.compiled: train small dt/svm/ksvm pipelines on the bundled
+KDDTest+.txt (in a scratch directory), compile them and require the engines to agree with
+sklearn. Exits with status 1 on any mismatch.
+
+    python scripts/check_compiled.py
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from sklearn.calibration import CalibratedClassifierCV  # noqa: E402
+from sklearn.kernel_approximation import Nystroem  # noqa: E402
+from sklearn.linear_model import RidgeClassifier  # noqa: E402
+from sklearn.pipeline import Pipeline  # noqa: E402
+from sklearn.svm import SVC  # noqa: E402
+from sklearn.tree import DecisionTreeClassifier  # noqa: E402
+
+from app.helpers.benchmark import scratch_dir  # noqa: E402
+
+TRAIN_ROWS = 3000
+CHECK_ROWS = 2000
+MAX_PROBA_DIFF = 1e-6
+
+CLASSIFIERS = {
+    "dt": lambda: DecisionTreeClassifier(class_weight="balanced", random_state=42),
+    "svm": lambda: SVC(kernel="rbf", probability=True, class_weight="balanced", random_state=42),
+    "ksvm": lambda: Pipeline([
+        ("kmap", Nystroem(kernel="rbf", gamma=0.03, n_components=100, random_state=42)),
+        ("linear", CalibratedClassifierCV(RidgeClassifier(class_weight="balanced"),
+                                          method="sigmoid", cv=3, ensemble=False)),
+    ]),
+}
+
+
+def main() -> int:
+    from app.data import make_dataset
+    from app.data.cache import load_interim
+    from app.models import train
+    from app.models.compiled import check, compile_pipeline
+
+    failures = []
+    with scratch_dir():
+        for task in ("binary", "multiclass"):
+            make_dataset.main(task)
+            df = load_interim(train.INTERIM / f"train_{task}").sample(frac=1.0, random_state=0)
+            X, y = df.drop(columns=["target"]), df["target"].values
+            X_fit, y_fit, X_check = X.iloc[:TRAIN_ROWS], y[:TRAIN_ROWS], X.iloc[TRAIN_ROWS:TRAIN_ROWS + CHECK_ROWS]
+            for name, make_clf in CLASSIFIERS.items():
+                pipe = Pipeline([("pre", train.build_preprocessor(X_fit)), ("clf", make_clf())]).fit(X_fit, y_fit)
+                compiled = compile_pipeline(pipe)
+                res = check(pipe, compiled, X_check, n_latency=20)
+                ok = res["agreement"] == 1.0 and res.get("max_proba_diff", 0.0) <= MAX_PROBA_DIFF
+                print(f"[{'ok' if ok else 'FAIL'}] {task}/{name}: {res}")
+                if not ok:
+                    failures.append(f"{task}/{name}")
+                # a frame without a model column must fail loudly, not score zeros or raise a bare KeyError
+                try:
+                    compiled.predict(X_check.drop(columns=[compiled.numeric[0]]))
+                    failures.append(f"{task}/{name}: missing column accepted")
+                except ValueError as e:
+                    if "columns are missing" not in str(e):
+                        failures.append(f"{task}/{name}: unclear missing-column error {e!r}")
+    if failures:
+        print(f"[!] {len(failures)} failure(s): {', '.join(failures)}")
+        return 1
+    print("Compiled engines match their pipelines.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())